@@ -7,6 +7,7 @@ import { ChatSidebar, type Message, type Suggestion } from "@/components/ChatSid
 import Agent, { type ElevenLabsAgent } from "@/components/Agent";
 import { ShopSidebar, type ShopItem } from "@/components/ShopSidebar";
 import { cn } from "@/lib/utils";
+import { streamShoppingPipeline, type ShoppingResult } from "@/lib/shopping";
 import { ArrowLeft, ArrowRight, MoveRight, Sparkles, Star, RotateCcw } from "lucide-react";
 
 const apiBase = process.env.NEXT_PUBLIC_API_URL ?? "http://localhost:5001";
@@ -46,9 +47,29 @@ type StoredSession = {
 };
 
 type SessionApiResponse = {
+  session?: { status?: string };
   rating_result?: RatingResult | null;
 };
 
+type SessionEvent = {
+  status: string;
+  rating_result?: RatingResult | null;
+  // Fields of a rating that is still streaming in (score first, then breakdown, summary, suggestions).
+  rating_partial?: Partial<RatingResult> | null;
+};
+
+// Uploads are rated in the background; these statuses mean the rating is still on its way.
+const RATING_PENDING_STATUSES = ["uploaded", "rating"];
+
+// Width variants of a stored upload, served by the backend's /api/images endpoint.
+function uploadSrcSet(url: string | null | undefined) {
+  const marker = "/uploads/";
+  const idx = url ? url.indexOf(marker) : -1;
+  if (!url || idx === -1) return undefined;
+  const name = url.slice(idx + marker.length);
+  return [640, 960, 1280, 1920].map((w) => `${apiBase}/api/images/${name}?w=${w} ${w}w`).join(", ");
+}
+
 function toTitleCase(value: string) {
   return value
     .replaceAll("_", " ")
@@ -61,6 +82,7 @@ export default function DesignPage() {
   const [sessionId, setSessionId] = useState<string | null>(null);
   const [originalUrl, setOriginalUrl] = useState<string | null>(null);
   const [rating, setRating] = useState<RatingResult | null>(null);
+  const [ratingPartial, setRatingPartial] = useState<Partial<RatingResult> | null>(null);
   const [isCurating, setIsCurating] = useState(false);
   const [selectedIds, setSelectedIds] = useState<Set<string>>(new Set());
   const [userExtra, setUserExtra] = useState("");
@@ -98,6 +120,7 @@ export default function DesignPage() {
   }, []);
 
   const pollTimer = useRef<ReturnType<typeof setInterval> | null>(null);
+  const jobEvents = useRef<EventSource | null>(null);
   const hasAutoRatedRef = useRef(false);
 
   const applyRating = useCallback((result: RatingResult | null) => {
@@ -134,24 +157,68 @@ export default function DesignPage() {
   useEffect(() => {
     if (!sessionLoaded || !sessionId || rating) return;
     let cancelled = false;
+    let events: EventSource | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | null = null;
+
+    const retryLater = () => {
+      if (!cancelled) retryTimer = setTimeout(() => void hydrate(), 2000);
+    };
+
+    const watchRating = () => {
+      if (typeof EventSource === "undefined") {
+        retryLater();
+        return;
+      }
+      events = new EventSource(`${apiBase}/api/sessions/${sessionId}/events`);
+      events.onmessage = (ev) => {
+        try {
+          const data = JSON.parse(ev.data) as SessionEvent;
+          if (RATING_PENDING_STATUSES.includes(data.status)) {
+            if (data.rating_partial) setRatingPartial(data.rating_partial);
+            return;
+          }
+          events?.close();
+          events = null;
+          setRatingPartial(null);
+          applyRating(data.rating_result ?? null);
+          setBusy(null);
+        } catch {
+          // ignore malformed events
+        }
+      };
+      events.onerror = () => {
+        events?.close();
+        events = null;
+        retryLater();
+      };
+    };
 
     const hydrate = async () => {
       setBusy("Loading session...");
+      let pending = false;
       try {
         const res = await fetch(`${apiBase}/api/sessions/${sessionId}`);
         const data = (await res.json()) as SessionApiResponse;
         if (!res.ok || cancelled) return;
+        pending = !data.rating_result && RATING_PENDING_STATUSES.includes(data.session?.status ?? "");
+        if (pending) {
+          setBusy("Analyzing your room...");
+          watchRating();
+          return;
+        }
         applyRating(data.rating_result ?? null);
       } catch {
         // ignore load failures
       } finally {
-        if (!cancelled) setBusy(null);
+        if (!cancelled && !pending) setBusy(null);
       }
     };
 
     void hydrate();
     return () => {
       cancelled = true;
+      events?.close();
+      if (retryTimer) clearTimeout(retryTimer);
     };
   }, [applyRating, rating, sessionId, sessionLoaded]);
 
@@ -185,6 +252,8 @@ export default function DesignPage() {
     [generated]
   );
   const afterImageUrl = generatedAbsolute[0] ?? null;
+  // While the rating streams in, show the score and breakdown as soon as they arrive.
+  const shownRating = rating ?? (ratingPartial?.overall_score !== undefined ? ratingPartial : null);
   const showAfter =
     isCurating || job?.status === "pending" || job?.status === "running" || !!afterImageUrl;
 
@@ -253,6 +322,42 @@ export default function DesignPage() {
     }, 1200);
   }, []);
 
+  // Prefer the server-pushed event stream; fall back to polling if it is unavailable or drops.
+  const watchJob = useCallback((jobId: string) => {
+    if (jobEvents.current) jobEvents.current.close();
+    if (typeof EventSource === "undefined") {
+      startPolling(jobId);
+      return;
+    }
+    const es = new EventSource(`${apiBase}/api/jobs/${jobId}/events`);
+    jobEvents.current = es;
+    es.onmessage = (ev) => {
+      try {
+        const data = JSON.parse(ev.data) as JobStatus;
+        setJob(data);
+        if (data.status === "done") {
+          setGenerated(data.generated_images ?? []);
+          setIsCurating(false);
+        } else if (data.status === "error") {
+          setIsCurating(false);
+        } else {
+          return;
+        }
+        es.close();
+        jobEvents.current = null;
+      } catch {
+        // ignore malformed events
+      }
+    };
+    es.onerror = () => {
+      es.close();
+      if (jobEvents.current === es) {
+        jobEvents.current = null;
+        startPolling(jobId);
+      }
+    };
+  }, [startPolling]);
+
   const generate = useCallback(async () => {
     if (!sessionId) return alert("Upload first.");
     if (!rating) return alert("Rating has not loaded yet.");
@@ -290,6 +395,8 @@ export default function DesignPage() {
           additional_changes: additionalChangeItems,
           user_prompt_extra: userExtra,
           num_variations: numVariations,
+          // Keep editing from the variation currently on screen.
+          base_image_url: generated[0],
         }),
       });
       const data = await res.json();
@@ -305,7 +412,7 @@ export default function DesignPage() {
       if (data.status === "done") {
         setIsCurating(false);
       }
-      startPolling(data.job_id as string);
+      watchJob(data.job_id as string);
     } catch (e: unknown) {
       setIsCurating(false);
       alert(e instanceof Error ? e.message : String(e));
@@ -314,83 +421,59 @@ export default function DesignPage() {
       setAdditionalChanges("");
       setUserExtra("");
     }
-  }, [additionalChanges, numVariations, rating, selectedIds, sessionId, startPolling, userExtra]);
+  }, [additionalChanges, generated, numVariations, rating, selectedIds, sessionId, userExtra, watchJob]);
 
-  // Product generation: try backend endpoint first, otherwise fallback to simple parsing
+  // Products for the shop: the backend extracts product names from the prompt and looks each
+  // one up as soon as it is parsed; items are added to the shop as their results arrive.
   const onGenerateProducts = useCallback(async (prompt: string): Promise<string[]> => {
-    try {
-      const res = await fetch(`${apiBase}/api/generate-products`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ prompt }),
-      });
-      if (res.ok) {
-        const data = await res.json();
-        if (Array.isArray(data.products)) return data.products;
-      }
-    } catch (e) {
-      // ignore and fallback
-    }
-
-    // Fallback: split lines/commas and return trimmed guesses
-    const parts = prompt
-      .split(/\r?\n|,|;|\|/)
-      .map((s) => s.trim())
-      .filter(Boolean);
-    // dedupe and limit
-    return Array.from(new Set(parts)).slice(0, 12);
-  }, []);
-
-  const handleProductsGenerated = useCallback(async (products: string[]) => {
-    if (!products || products.length === 0) return;
-
-    // Query backend batch_search to enrich products with SERP info
-    try {
-      const q = products.join(",");
-      const res = await fetch(`${apiBase}/api/batch_search?q=${encodeURIComponent(q)}`);
-      const data = await res.json();
-
-      const results = Array.isArray(data.results) ? data.results : [];
-
+    const batchId = Date.now();
+    let received = 0;
+    const addResult = (r: ShoppingResult) => {
+      received += 1;
       setShopItems((prev) => {
         const next: ShopItem[] = prev ? [...prev] : [];
-        const existing = new Set(next.map((it) => it.name.toLowerCase()));
-        const now = Date.now();
-        results.forEach((r: any, i: number) => {
-          const title = (r.result && r.result.title) ? r.result.title : r.query;
-          const name = title || r.query;
-          if (existing.has(name.toLowerCase())) return;
-          existing.add(name.toLowerCase());
-          next.push({
-            id: `${now}-${i}`,
-            name,
-            price: r.result?.price ?? "TBD",
-            image: r.result?.image,
-            link: r.result?.link,
-            category: "Suggested",
-          });
+        const name = r.result?.title || r.query;
+        if (next.some((it) => it.name.toLowerCase() === name.toLowerCase())) return next;
+        next.push({
+          id: `${batchId}-${r.index}`,
+          name,
+          price: r.result?.price ?? "TBD",
+          image: r.result?.image,
+          link: r.result?.link,
+          category: "Suggested",
         });
         return next;
       });
+    };
 
-      setIsShopOpen(true);
+    setIsShopOpen(true);
+    try {
+      return await streamShoppingPipeline(apiBase, { prompt, job_id: job?.job_id }, addResult);
     } catch (e) {
-      // Fallback: just add names
-      setShopItems((prev) => {
-        const next: ShopItem[] = prev ? [...prev] : [];
-        const now = Date.now();
-        products.forEach((p, i) => {
-          next.push({ id: `${now}-${i}`, name: p, price: "TBD", category: "Suggested" });
-        });
-        return next;
-      });
-      setIsShopOpen(true);
+      if (received > 0) return [];
     }
-  }, []);
+
+    // Fallback: split lines/commas and add the trimmed guesses by name
+    const products = Array.from(new Set(
+      prompt
+        .split(/\r?\n|,|;|\|/)
+        .map((s) => s.trim())
+        .filter(Boolean)
+    )).slice(0, 12);
+    setShopItems((prev) => {
+      const next: ShopItem[] = prev ? [...prev] : [];
+      products.forEach((p, i) => {
+        next.push({ id: `${batchId}-${i}`, name: p, price: "TBD", category: "Suggested" });
+      });
+      return next;
+    });
+    return products;
+  }, [job?.job_id]);
 
   useEffect(() => {
     return () => {
       if (pollTimer.current) clearInterval(pollTimer.current);
+      if (jobEvents.current) jobEvents.current.close();
     };
   }, []);
 
@@ -436,6 +519,8 @@ export default function DesignPage() {
                 <div className="relative w-full h-full flex items-center justify-center p-4">
                    <img
                      src={viewMode === 'original' ? displayImageUrl : (afterImageUrl || displayImageUrl)}
+                     srcSet={uploadSrcSet(viewMode === 'original' ? displayImageUrl : (afterImageUrl || displayImageUrl))}
+                     sizes="(min-width: 1024px) 70vw, 100vw"
                      alt={viewMode === 'original' ? "Original room" : "Curated room"}
                      className={cn(
                        "max-h-full max-w-full object-contain rounded-lg shadow-[0_20px_50px_-12px_rgba(0,0,0,0.25)] ring-1 ring-black/10 transition-all duration-500",
@@ -502,6 +587,8 @@ export default function DesignPage() {
                   <div className="relative w-full flex items-center justify-center bg-neutral-50/50 rounded-2xl p-4 md:p-8 min-h-[50vh]">
                     <img
                       src={displayImageUrl}
+                      srcSet={uploadSrcSet(displayImageUrl)}
+                      sizes="(min-width: 1024px) 50vw, 100vw"
                       alt="Original room"
                       className="max-h-[60vh] max-w-full w-auto h-auto object-contain rounded-lg shadow-xl ring-1 ring-black/5"
                     />
@@ -511,7 +598,7 @@ export default function DesignPage() {
                 {/* Right Column: Rating & Breakdown */}
                 <div className="flex flex-col justify-center space-y-12 py-2">
                   <div className="w-full">
-                    {busy ? (
+                    {busy && !shownRating ? (
                       <div className="flex flex-col gap-4 animate-in fade-in duration-300 py-2">
                         <div className="flex items-center gap-3 text-neutral-900">
                           <div className="h-4 w-4 animate-spin rounded-full border-2 border-neutral-900 border-t-transparent" />
@@ -521,22 +608,22 @@ export default function DesignPage() {
                           Our AI is analyzing lighting, composition, and style to provide tailored recommendations.
                         </p>
                       </div>
-                    ) : rating ? (
+                    ) : shownRating ? (
                       <div className="space-y-8 animate-in fade-in slide-in-from-bottom-2 duration-500">
                         <div>
                           <div className="flex items-end justify-between border-b border-neutral-900 pb-4">
                             <h2 className="font-serif text-2xl text-foreground">Overall</h2>
                             <div className="flex items-baseline gap-1">
                               <span className="font-serif text-5xl text-foreground tracking-tight">
-                                {rating.overall_score}
+                                {shownRating.overall_score}
                               </span>
                               <span className="text-xl text-neutral-400 font-light">/10</span>
                             </div>
                           </div>
-                          {rating.breakdown && Object.keys(rating.breakdown).length > 0 && (
+                          {shownRating.breakdown && Object.keys(shownRating.breakdown).length > 0 && (
                             <div className="space-y-4 pt-4">
                               <div className="grid grid-cols-1 gap-y-4">
-                                {Object.entries(rating.breakdown).map(([k, v]) => (
+                                {Object.entries(shownRating.breakdown).map(([k, v]) => (
                                   <div
                                     key={k}
                                     className="group flex items-center justify-between py-3 rounded-lg px-4 hover:bg-neutral-100 transition-colors"
@@ -606,7 +693,6 @@ export default function DesignPage() {
         onCurate={generate}
         isCurating={isCurating}
         onGenerateProducts={onGenerateProducts}
-        onProductsGenerated={handleProductsGenerated}
         onResetWidth={() => {}}
         isOpen={isChatOpen}
         onOpenShop={afterImageUrl ? openShop : undefined}
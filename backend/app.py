@@ -2,7 +2,7 @@ import os
 import io
 import json
 import uuid
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
 import time as _time
 import requests
 from PIL import Image
@@ -13,18 +13,53 @@ from sqlalchemy import create_engine, Column, String, DateTime, Text, ForeignKey
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 import base64
 import hashlib
+import hmac
 import threading
 import re
-from datetime import datetime
+import socket
+import logging
+import queue
+import random
+import sqlite3
+import asyncio
+import tempfile
+import mimetypes
+import sys
+import csv
+import ipaddress
+import multiprocessing
+import shutil
+import zipfile
+from bisect import bisect_left
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, quote, urljoin, urlparse
+from collections import Counter, deque, OrderedDict
+from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Optional, List
 
+import httpx
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
 from PIL import Image
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, redirect, request, jsonify, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
-from sqlalchemy import create_engine, Column, String, DateTime, Text, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import create_engine, event, Column, String, DateTime, Text, ForeignKey, Float, Integer, Index, MetaData, Table, inspect, select, text, exists, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, aliased, selectinload
+
+from imaging import file_sha256, normalize_to_jpeg, normalize_upload
+
+log = logging.getLogger("saun")
+
+try:
+    import pillow_avif  # noqa: F401  (optional AVIF encoder for image derivatives)
+except ImportError:
+    pass
 
 # ----------------------------
 # Config
@@ -41,39 +76,226 @@ GEMINI_RATING_MODEL = os.getenv("GEMINI_RATING_MODEL", "gemini-3-flash-preview")
 NANOBANANA_MODEL = os.getenv("NANOBANANA_MODEL", "gemini-2.5-flash-image")
 
 MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "10"))
+
+# Uploads are spooled to disk and sent to the Files API in chunks to keep memory flat.
+SPOOL_CHUNK_BYTES = 1024 * 1024
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_MAX_RESUMES = int(os.getenv("UPLOAD_MAX_RESUMES", "5"))
+
+# Model inputs are downscaled copies (longest edge, px; 0 = send full size). Originals stay full size.
+RATING_MAX_EDGE = int(os.getenv("RATING_MAX_EDGE", "1536"))
+EDIT_MAX_EDGE = int(os.getenv("EDIT_MAX_EDGE", "1024"))
+MODEL_INPUT_JPEG_QUALITY = int(os.getenv("MODEL_INPUT_JPEG_QUALITY", "90"))
+
+# Resized/re-encoded copies served by /api/images (disk LRU, capped size)
+DERIVATIVE_CACHE_MAX_MB = int(os.getenv("DERIVATIVE_CACHE_MAX_MB", "512"))
+DERIVATIVE_WIDTHS = [160, 320, 480, 640, 960, 1280, 1920]
+DERIVATIVE_DEFAULT_QUALITY = 80
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Gemini Files API objects expire (48h); stop reusing a uri this long before it does.
+FILE_URI_TTL_HOURS = int(os.getenv("FILE_URI_TTL_HOURS", "47"))
+FILE_URI_MIN_REMAINING_SEC = int(os.getenv("FILE_URI_MIN_REMAINING_SEC", "3600"))
+# Generated images are uploaded in the background once saved, so a follow-up edit sends a fileUri.
+UPLOAD_GENERATED_ASSETS = os.getenv("UPLOAD_GENERATED_ASSETS", "1") == "1"
+FILE_UPLOAD_WORKERS = int(os.getenv("FILE_UPLOAD_WORKERS", "2"))
+# Rendered GET /api/sessions/<id> bodies, keyed by session revision.
+SESSION_VIEW_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_VIEW_CACHE_MAX_ENTRIES", "512"))
+SESSION_VIEW_CACHE_TTL = int(os.getenv("SESSION_VIEW_CACHE_TTL", "3600"))
 FIXED_CATEGORIES = ["organization", "lighting", "spacing", "color_harmony", "cleanliness", "feng shui"]
 
+# Rate limiting: RATE_LIMIT_PER_MINUTE cost units per client. "memory" is per process;
+# "sqlite" shares limits between worker processes through RATE_LIMIT_SQLITE_PATH.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "ratelimit.db")
+RATE_LIMIT_COSTS = os.getenv("RATE_LIMIT_COSTS", "")  # e.g. "generate=5,search=0.5"
+# Number of reverse proxies in front of the app whose X-Forwarded-For can be trusted.
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+
+# Set to 0 for processes that only serve requests or run maintenance scripts.
+RUN_BACKGROUND_WORKERS = os.getenv("RUN_BACKGROUND_WORKERS", "1") == "1"
+
+# Generated images are re-encoded before storage (webp | jpeg | png).
+GENERATED_IMAGE_FORMAT = os.getenv("GENERATED_IMAGE_FORMAT", "webp").lower()
+GENERATED_IMAGE_QUALITY = int(os.getenv("GENERATED_IMAGE_QUALITY", "90"))
+
+# Variations per generation request, and the cap on concurrent Gemini calls per process.
+MAX_VARIATIONS = int(os.getenv("MAX_VARIATIONS", "4"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+# Generation job queue
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "2"))  # 0 = this process only enqueues
+GENERATION_QUEUE_MAX = int(os.getenv("GENERATION_QUEUE_MAX", "50"))
+JOB_POLL_SEC = float(os.getenv("JOB_POLL_SEC", "2"))
+JOB_HEARTBEAT_SEC = int(os.getenv("JOB_HEARTBEAT_SEC", "15"))
+JOB_STALE_SEC = int(os.getenv("JOB_STALE_SEC", "90"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Background rating pipeline (POST /api/sessions without ?sync=1)
+RATING_WORKERS = int(os.getenv("RATING_WORKERS", "4"))
+RATING_RECOVERY_HOURS = int(os.getenv("RATING_RECOVERY_HOURS", "24"))
+# Stream background ratings (streamGenerateContent) so score, breakdown and suggestions reach
+# /api/sessions/<id>/events as they are generated instead of all at once.
+RATING_STREAM = os.getenv("RATING_STREAM", "1") == "1"
+
+# Bulk ingestion (POST /api/bulk): a zip or URL manifest of room photos rated as one job.
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "500"))
+BULK_MAX_ARCHIVE_MB = int(os.getenv("BULK_MAX_ARCHIVE_MB", "512"))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "2"))  # bulk jobs driven at once
+BULK_NORMALIZE_PROCESSES = int(os.getenv("BULK_NORMALIZE_PROCESSES", str(min(4, os.cpu_count() or 1))))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))  # downloads and ratings in flight, across all bulk jobs
+BULK_DB_BATCH = int(os.getenv("BULK_DB_BATCH", "50"))  # sessions written per transaction
+# Manifest URLs must resolve to public addresses unless this is set (e.g. for a private bucket).
+BULK_URL_ALLOW_PRIVATE = os.getenv("BULK_URL_ALLOW_PRIVATE", "0") == "1"
+
+# Where originals and generated images are stored: "local" (UPLOAD_DIR) or "s3" (any
+# S3-compatible service; UPLOAD_DIR then caches the files image processing reads).
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")  # default https://s3.<region>.amazonaws.com
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "")
+S3_PRESIGN_TTL_SEC = int(os.getenv("S3_PRESIGN_TTL_SEC", "3600"))
+# /uploads/<key> redirects here (a CDN or public bucket URL) instead of serving or presigning.
+STORAGE_PUBLIC_URL = os.getenv("STORAGE_PUBLIC_URL", "").rstrip("/")
+# Local storage behind nginx: an internal location aliased to UPLOAD_DIR. /uploads and /api/images
+# then answer with X-Accel-Redirect and nginx sends the bytes.
+STORAGE_ACCEL_REDIRECT = os.getenv("STORAGE_ACCEL_REDIRECT", "").rstrip("/")  # e.g. /protected-uploads
+
+# Outbound HTTP (Gemini, SerpApi)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(max(8, GENERATION_WORKERS + RATING_WORKERS + 8))))
+HTTP_HOST_CONCURRENCY = int(os.getenv("HTTP_HOST_CONCURRENCY", str(HTTP_POOL_SIZE)))
+HTTP_HOST_LIMITS = os.getenv("HTTP_HOST_LIMITS", "")  # e.g. "serpapi.com=4,generativelanguage.googleapis.com=12"
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE_SEC = float(os.getenv("HTTP_BACKOFF_BASE_SEC", "0.5"))
+HTTP_BACKOFF_MAX_SEC = float(os.getenv("HTTP_BACKOFF_MAX_SEC", "8"))
+HTTP_RETRY_AFTER_MAX_SEC = float(os.getenv("HTTP_RETRY_AFTER_MAX_SEC", "30"))
+# Connection cap for the asyncio client; waiting calls cost a coroutine, not a thread.
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "1000"))
+
+# SerpApi shopping results: fresh for SERP_CACHE_TTL, then served stale (while refreshing in the
+# background) for up to SERP_CACHE_STALE_SEC more. SERP_CACHE_SQLITE_PATH adds a shared on-disk tier.
+SERP_CACHE_TTL = int(os.getenv("SERP_CACHE_TTL", str(6 * 3600)))
+SERP_CACHE_STALE_SEC = int(os.getenv("SERP_CACHE_STALE_SEC", str(7 * 24 * 3600)))
+SERP_CACHE_MAX_ENTRIES = int(os.getenv("SERP_CACHE_MAX_ENTRIES", "2048"))
+SERP_CACHE_SQLITE_PATH = os.getenv("SERP_CACHE_SQLITE_PATH", "")
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "4"))
+# /api/batch_search: lookups run as tasks on the shared event loop, at most SERP_BATCH_WORKERS
+# at a time per process; queries still unresolved at the deadline come back as partial results
+# (and keep running, so the next request finds them in the cache).
+SERP_BATCH_WORKERS = int(os.getenv("SERP_BATCH_WORKERS", "6"))
+SERP_BATCH_DEADLINE_SEC = float(os.getenv("SERP_BATCH_DEADLINE_SEC", "12"))
+SERP_BATCH_MAX_ITEMS = int(os.getenv("SERP_BATCH_MAX_ITEMS", "12"))
+# Product names extracted per prompt (/api/generate-products, /api/shopping); 0 disables the database tier.
+PRODUCTS_CACHE_TTL = int(os.getenv("PRODUCTS_CACHE_TTL", str(7 * 24 * 3600)))
+PRODUCTS_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCTS_CACHE_MAX_ENTRIES", "1024"))
+PRODUCTS_CACHE_PERSIST = os.getenv("PRODUCTS_CACHE_PERSIST", "1") == "1"
+# POST /api/shopping: product extraction plus lookups; the result is stored on the job when one is given.
+SHOPPING_PIPELINE_DEADLINE_SEC = float(os.getenv("SHOPPING_PIPELINE_DEADLINE_SEC", "30"))
+SHOPPING_EXTRACT_WORKERS = int(os.getenv("SHOPPING_EXTRACT_WORKERS", "8"))
+
+# Database pool (per process). SQLite runs in WAL mode with a busy timeout; SQLITE_JOURNAL_MODE
+# exists to compare against the old rollback journal (DELETE) in bench_db.py.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SEC = int(os.getenv("DB_POOL_TIMEOUT_SEC", "30"))
+DB_POOL_RECYCLE_SEC = int(os.getenv("DB_POOL_RECYCLE_SEC", "1800"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+# Apply pending schema migrations on startup; with 0, run `python migrate_db.py` before deploying.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+
+# Slow-request profiling (off by default): requests and generation jobs running longer than
+# PROFILE_SLOW_MS have their stacks sampled every PROFILE_SAMPLE_MS and written to PROFILE_DIR
+# as folded stacks (input for flamegraph.pl or speedscope).
+PROFILE_SLOW_MS = int(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_SAMPLE_MS = int(os.getenv("PROFILE_SAMPLE_MS", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Server-Sent Events
+SSE_KEEPALIVE_SEC = float(os.getenv("SSE_KEEPALIVE_SEC", "15"))
+SSE_RESYNC_SEC = float(os.getenv("SSE_RESYNC_SEC", "30"))  # DB re-check for jobs run by another process
+
+# Gemini calls fail with a clear error without a key; everything else (sessions, caches, SerpApi) still works.
 if not GEMINI_API_KEY:
-    raise RuntimeError("Missing GEMINI_API_KEY in environment")
+    log.warning("GEMINI_API_KEY is not set; Gemini calls will fail")
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+DERIVED_DIR = os.path.join(UPLOAD_DIR, "derived")
+os.makedirs(DERIVED_DIR, exist_ok=True)
+DERIVATIVE_CACHE_DIR = os.path.join(UPLOAD_DIR, ".cache", "images")
+os.makedirs(DERIVATIVE_CACHE_DIR, exist_ok=True)
+BULK_STAGING_DIR = os.path.join(UPLOAD_DIR, ".bulk")
 
-# Gemini REST base
-BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
-UPLOAD_BASE_URL = "https://generativelanguage.googleapis.com/upload/v1beta"
+# Upstream endpoints; overridable so bench_load.py can point them at fake_upstreams.py.
+BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+UPLOAD_BASE_URL = os.getenv("GEMINI_UPLOAD_BASE_URL", "https://generativelanguage.googleapis.com/upload/v1beta").rstrip("/")
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search.json")
 
 # ----------------------------
 # DB setup
 # ----------------------------
 Base = declarative_base()
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+
+def make_engine(url: str):
+    """
+    SQLite: WAL journal (readers never block the writer), synchronous=NORMAL and a busy
+    timeout, so concurrent job writes wait for the lock instead of failing with
+    "database is locked". Other databases (PostgreSQL): a sized pool with pre-ping and
+    recycling, so connections dropped by the server or a proxy are replaced transparently.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT_SEC,
+            pool_recycle=DB_POOL_RECYCLE_SEC,
+            pool_pre_ping=True,
+        )
+
+    in_memory = url in ("sqlite://", "sqlite:///:memory:")
+    eng = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        **({} if in_memory else {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT_SEC}),
+    )
+
+    @event.listens_for(eng, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cur.close()
+
+    return eng
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
 class Session(Base):
     __tablename__ = "sessions"
     id = Column(String, primary_key=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    status = Column(String, default="uploaded")  # uploaded, rated, generating, done, error
+    status = Column(String, default="uploaded")  # uploaded, rating, rated, generating, done, error
+    error_message = Column(Text, nullable=True)
 
     original_image_path = Column(String, nullable=False)
     original_image_url = Column(String, nullable=False)
     original_file_uri = Column(String, nullable=True)  # Gemini Files API uri (optional but recommended)
 
     rating_json = Column(Text, nullable=True)
-    suggestions_json = Column(Text, nullable=True)
+    suggestions_json = Column(Text, nullable=True)  # legacy; suggestions are rows in the suggestions table
+
+    # Bumped whenever anything in GET /api/sessions/<id> changes (see _bump_session_revisions).
+    revision = Column(Integer, default=0, server_default="0", nullable=False)
 
-    images = relationship("ImageAsset", back_populates="session", cascade="all, delete-orphan")
-    jobs = relationship("GenerationJob", back_populates="session", cascade="all, delete-orphan")
+    images = relationship("ImageAsset", back_populates="session", cascade="all, delete-orphan", order_by="ImageAsset.created_at")
+    jobs = relationship("GenerationJob", back_populates="session", cascade="all, delete-orphan", order_by="GenerationJob.created_at.desc()")
+    rating = relationship("Rating", uselist=False, cascade="all, delete-orphan")
+    suggestions = relationship("Suggestion", cascade="all, delete-orphan", order_by="Suggestion.position")
 
 class ImageAsset(Base):
     __tablename__ = "image_assets"
@@ -81,12 +303,21 @@ class ImageAsset(Base):
     session_id = Column(String, ForeignKey("sessions.id"), nullable=False)
     kind = Column(String, nullable=False)  # original, generated
     path = Column(String, nullable=False)
-    url = Column(String, nullable=False)
+    url = Column(String, nullable=False, index=True)
     meta_json = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    source_sha256 = Column(String, nullable=True, index=True)  # sha256 of the bytes as uploaded
+    file_uri = Column(String, nullable=True)  # Gemini Files API uri for this file
+    file_uri_expires_at = Column(DateTime, nullable=True)
+    # Originals only: file_uri holds the rating-size upload, these the edit-size one.
+    edit_file_uri = Column(String, nullable=True)
+    edit_file_uri_expires_at = Column(DateTime, nullable=True)
+
     session = relationship("Session", back_populates="images")
 
+    __table_args__ = (Index("ix_image_assets_session_kind_created_at", "session_id", "kind", "created_at"),)
+
 class GenerationJob(Base):
     __tablename__ = "generation_jobs"
     id = Column(String, primary_key=True)
@@ -97,51 +328,1404 @@ class GenerationJob(Base):
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Scheduler bookkeeping (see JobScheduler)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    worker_id = Column(String, nullable=True)
+    attempts = Column(Integer, default=0, server_default="0")
+
+    products_json = Column(Text, nullable=True)  # last /api/shopping result for this job
+
     session = relationship("Session", back_populates="jobs")
 
-Base.metadata.create_all(engine)
+    __table_args__ = (
+        Index("ix_generation_jobs_status_created_at", "status", "created_at"),
+        Index("ix_generation_jobs_session_created_at", "session_id", "created_at"),
+    )
+
+class RatingCache(Base):
+    """
+    Structured rating per (image content, model, prompt/schema version).
+    """
+    __tablename__ = "rating_cache"
+    sha256 = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    prompt_version = Column(String, primary_key=True)
+    rating_json = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ProductCache(Base):
+    """
+    Product names extracted for a normalized edit prompt (see products_cache_key), per model.
+    """
+    __tablename__ = "product_cache"
+    prompt_sha256 = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    products_json = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class Rating(Base):
+    """
+    A session's rating with one numeric column per FIXED_CATEGORIES entry, for SQL aggregates.
+    Written alongside Session.rating_json, which stays the API representation.
+    """
+    __tablename__ = "ratings"
+    session_id = Column(String, ForeignKey("sessions.id"), primary_key=True)
+    model = Column(String, nullable=True)
+    overall_score = Column(Float, nullable=True)
+    organization = Column(Float, nullable=True)
+    lighting = Column(Float, nullable=True)
+    spacing = Column(Float, nullable=True)
+    color_harmony = Column(Float, nullable=True)
+    cleanliness = Column(Float, nullable=True)
+    feng_shui = Column(Float, nullable=True)
+    summary = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class Suggestion(Base):
+    __tablename__ = "suggestions"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, ForeignKey("sessions.id"), nullable=False)
+    key = Column(String, nullable=False)  # the model's id for it, e.g. "s1"
+    position = Column(Integer, nullable=False)
+    category = Column(String, nullable=True)
+    title = Column(Text, nullable=True)
+    why = Column(Text, nullable=True)
+    steps_json = Column(Text, nullable=True)
+    impact = Column(String, nullable=True)
+    effort = Column(String, nullable=True)
+    times_chosen = Column(Integer, default=0, server_default="0", nullable=False)  # generation jobs that applied it
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_suggestions_session_position", "session_id", "position"),
+        Index("ix_suggestions_category", "category"),
+    )
+
+class BulkJob(Base):
+    """
+    A POST /api/bulk upload: many images turned into sessions and rated (see run_bulk_job).
+    """
+    __tablename__ = "bulk_jobs"
+    id = Column(String, primary_key=True)
+    status = Column(String, default="queued")  # queued, running, done, error
+    source = Column(String, nullable=False)  # archive, manifest
+    total = Column(Integer, nullable=False, default=0)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class BulkItem(Base):
+    __tablename__ = "bulk_items"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bulk_job_id = Column(String, ForeignKey("bulk_jobs.id"), nullable=False)
+    position = Column(Integer, nullable=False)
+    ref = Column(Text, nullable=True)  # archive member name, or the manifest's ref (default: its url)
+    source_url = Column(Text, nullable=True)  # manifest items, until downloaded
+    staged_path = Column(String, nullable=True)  # raw file under BULK_STAGING_DIR, until normalized
+    status = Column(String, default="queued")  # queued, normalized, rated, error
+    session_id = Column(String, ForeignKey("sessions.id"), nullable=True)
+    error_message = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (Index("ix_bulk_items_job_position", "bulk_job_id", "position"),)
+
+# Rating breakdown key -> Rating column
+CATEGORY_COLUMNS = {c: c.replace(" ", "_") for c in FIXED_CATEGORIES}
+
+def _score(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def rating_rows(session_id: str, rating_obj: Dict[str, Any], model: Optional[str] = None,
+                created_at: Optional[datetime] = None) -> tuple:
+    """
+    Column values for the ratings row and the suggestions rows of one rating object.
+    """
+    breakdown = rating_obj.get("breakdown") or {}
+    now = created_at or datetime.utcnow()
+    rating = {
+        "session_id": session_id,
+        "model": model,
+        "overall_score": _score(rating_obj.get("overall_score")),
+        "summary": rating_obj.get("summary"),
+        "created_at": now,
+        **{col: _score(breakdown.get(cat)) for cat, col in CATEGORY_COLUMNS.items()},
+    }
+    suggestions = [
+        {
+            "session_id": session_id,
+            "key": str(s.get("id") or f"s{i + 1}"),
+            "position": i,
+            "category": s.get("category"),
+            "title": s.get("title"),
+            "why": s.get("why"),
+            "steps_json": json.dumps(s.get("steps") or []),
+            "impact": s.get("impact"),
+            "effort": s.get("effort"),
+            "times_chosen": 0,
+            "created_at": now,
+        }
+        for i, s in enumerate(rating_obj.get("suggestions") or [])
+        if isinstance(s, dict)
+    ]
+    return rating, suggestions
+
+def write_rating_rows(conn, session_id: str, rating_obj: Dict[str, Any], model: Optional[str] = None,
+                      created_at: Optional[datetime] = None) -> None:
+    """
+    Replace the session's ratings/suggestions rows; conn is a Connection or ORM session.
+    times_chosen carries over to the new suggestion with the same key.
+    """
+    rating, suggestions = rating_rows(session_id, rating_obj, model, created_at)
+    chosen = dict(conn.execute(
+        select(Suggestion.key, Suggestion.times_chosen).where(Suggestion.session_id == session_id)
+    ).all())
+    for row in suggestions:
+        row["times_chosen"] = chosen.get(row["key"], 0)
+    conn.execute(Suggestion.__table__.delete().where(Suggestion.session_id == session_id))
+    conn.execute(Rating.__table__.delete().where(Rating.session_id == session_id))
+    conn.execute(Rating.__table__.insert(), [rating])
+    if suggestions:
+        conn.execute(Suggestion.__table__.insert(), suggestions)
+
+def suggestion_dict(row: Suggestion) -> Dict[str, Any]:
+    return {
+        "id": row.key,
+        "category": row.category,
+        "title": row.title,
+        "why": row.why,
+        "steps": json.loads(row.steps_json) if row.steps_json else [],
+        "impact": row.impact,
+        "effort": row.effort,
+    }
+
+def _backfill_rating_rows(conn) -> None:
+    rated = conn.execute(
+        select(Session.id, Session.rating_json, Session.created_at)
+        .where(Session.rating_json.isnot(None), ~exists().where(Rating.session_id == Session.id))
+    )
+    # The model and exact rating time weren't recorded for these; the session's upload time stands in.
+    for session_id, rating_json, created_at in rated.all():
+        try:
+            rating_obj = json.loads(rating_json)
+        except ValueError:
+            continue
+        if isinstance(rating_obj, dict):
+            write_rating_rows(conn, session_id, rating_obj, created_at=created_at)
+
+# ----------------------------
+# Schema migrations
+# ----------------------------
+# Applied in order and recorded in schema_migrations. Every step checks before it changes
+# anything, so databases created before migrations were tracked (by create_all plus
+# ad-hoc ALTERs) upgrade cleanly. Append new steps; never edit or reorder applied ones.
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+def _create_tables(conn, *names: str) -> None:
+    for name in names:
+        Base.metadata.tables[name].create(conn, checkfirst=True)
+
+def _add_columns(conn, table: str, *names: str) -> None:
+    """
+    ALTER TABLE ADD COLUMN for model columns the table lacks, with DDL rendered for the
+    connection's dialect.
+    """
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name in names:
+        if name not in existing:
+            ddl = CreateColumn(Base.metadata.tables[table].c[name]).compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+def _create_indexes(conn, *names: str) -> None:
+    """
+    Create model indexes the named tables lack; with no names, on every model table the
+    database already has (tables created later get their indexes from _create_tables).
+    """
+    if not names:
+        existing = set(inspect(conn).get_table_names())
+        names = tuple(t.name for t in Base.metadata.sorted_tables if t.name in existing)
+    for name in names:
+        for idx in Base.metadata.tables[name].indexes:
+            idx.create(conn, checkfirst=True)
+
+MIGRATIONS = [
+    (1, "base tables", lambda conn: _create_tables(conn, "sessions", "image_assets", "generation_jobs")),
+    (2, "session errors and job scheduler bookkeeping", lambda conn: (
+        _add_columns(conn, "sessions", "error_message"),
+        _add_columns(conn, "generation_jobs", "started_at", "finished_at", "heartbeat_at", "worker_id", "attempts"),
+    )),
+    (3, "upload hashes and Files API uris on assets", lambda conn: (
+        _add_columns(conn, "image_assets", "source_sha256", "file_uri", "file_uri_expires_at"),
+    )),
+    (4, "rating cache", lambda conn: _create_tables(conn, "rating_cache")),
+    (5, "product caches", lambda conn: (
+        _create_tables(conn, "product_cache"),
+        _add_columns(conn, "generation_jobs", "products_json"),
+    )),
+    (6, "session view revision", lambda conn: _add_columns(conn, "sessions", "revision")),
+    (7, "indexes", _create_indexes),
+    (8, "typed ratings and suggestions", lambda conn: (
+        _create_tables(conn, "ratings", "suggestions"),
+        _backfill_rating_rows(conn),
+    )),
+    (9, "bulk ingestion jobs", lambda conn: _create_tables(conn, "bulk_jobs", "bulk_items")),
+    (10, "image asset url index", lambda conn: _create_indexes(conn, "image_assets")),
+    (11, "edit-size Files API uris on originals", lambda conn: (
+        _add_columns(conn, "image_assets", "edit_file_uri", "edit_file_uri_expires_at"),
+    )),
+]
+
+def _applied_versions(eng) -> set:
+    if not inspect(eng).has_table("schema_migrations"):
+        return set()
+    with eng.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+def pending_migrations(eng=None) -> List[tuple]:
+    applied = _applied_versions(eng or engine)
+    return [(v, n) for v, n, _ in MIGRATIONS if v not in applied]
+
+def migrate(eng=None, log_fn=None) -> List[int]:
+    """
+    Apply pending MIGRATIONS, each in its own transaction. Returns the versions applied.
+    """
+    eng = eng or engine
+    schema_migrations.create(eng, checkfirst=True)
+    applied = _applied_versions(eng)
+    done = []
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with eng.begin() as conn:
+                step(conn)
+                conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+        except IntegrityError:
+            continue  # applied concurrently by another process
+        done.append(version)
+        if log_fn:
+            log_fn(f"applied migration {version}: {name}")
+    return done
+
+if AUTO_MIGRATE:
+    migrate()
+
+# Columns rendered by GET /api/sessions/<id>; changing one of them invalidates the cached view.
+SESSION_VIEW_FIELDS = {
+    Session: ("status", "error_message", "original_image_url", "original_file_uri", "rating_json"),
+    ImageAsset: ("kind", "url", "meta_json"),
+    GenerationJob: ("status", "result_images_json", "error_message"),
+}
+
+def bump_session_revisions(db, session_ids) -> None:
+    """
+    Invalidate the cached session view of session_ids. ORM changes do this on flush; call
+    it after bulk UPDATEs on generation_jobs/image_assets, which bypass the flush.
+    """
+    ids = {sid for sid in session_ids if sid}
+    if ids:
+        db.execute(
+            Session.__table__.update().where(Session.id.in_(ids)).values(revision=func.coalesce(Session.revision, 0) + 1)
+        )
+
+@event.listens_for(SessionLocal, "before_flush")
+def _bump_session_revisions(db, flush_context, instances) -> None:
+    touched = set()
+    for obj in list(db.new) + list(db.deleted):
+        if type(obj) in SESSION_VIEW_FIELDS and not isinstance(obj, Session):
+            touched.add(obj.session_id)
+    for obj in db.dirty:
+        fields = SESSION_VIEW_FIELDS.get(type(obj))
+        if fields and any(inspect(obj).attrs[f].history.has_changes() for f in fields):
+            touched.add(obj.id if isinstance(obj, Session) else obj.session_id)
+    # New sessions start at revision 0 and are inserted by this flush.
+    touched -= {obj.id for obj in db.new if isinstance(obj, Session)}
+    bump_session_revisions(db, touched)
 
 # ----------------------------
-# Minimal in-memory rate limiter (hackathon-safe)
+# Rate limiting (GCRA)
 # ----------------------------
 _RATE_WINDOW_SEC = 60
 _RATE_LIMIT = int(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
-_ip_hits: Dict[str, List[float]] = {}
-_ip_lock = threading.Lock()
-
-def check_rate_limit(ip: str) -> bool:
-    now = _time.time()
-    with _ip_lock:
-        hits = _ip_hits.get(ip, [])
-        hits = [t for t in hits if now - t < _RATE_WINDOW_SEC]
-        if len(hits) >= _RATE_LIMIT:
-            _ip_hits[ip] = hits
+
+def _parse_kv_list(spec: str, cast=int) -> Dict[str, Any]:
+    out = {}
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        try:
+            if key.strip():
+                out[key.strip()] = cast(value.strip())
+        except ValueError:
+            continue
+    return out
+
+# Cost per request in limiter units; routes not listed cost 1.
+ROUTE_COSTS = {
+    "create_session": 2, "rate": 2, "generate": 4, "generate_products": 1, "search": 0.5, "batch_search": 1,
+    "shopping": 2, "bulk": 10,
+}
+ROUTE_COSTS.update(_parse_kv_list(RATE_LIMIT_COSTS, float))
+
+def _gcra(tat: Optional[float], now: float, cost: float) -> tuple:
+    """
+    Generic cell rate algorithm: one theoretical arrival time per key stands in for a token
+    bucket of _RATE_LIMIT units refilling over _RATE_WINDOW_SEC.
+    Returns (allowed, new_tat, retry_after_sec).
+    """
+    interval = _RATE_WINDOW_SEC / _RATE_LIMIT
+    new_tat = max(tat or now, now) + cost * interval
+    over = new_tat - now - _RATE_WINDOW_SEC
+    if over > 0:
+        return False, tat, over
+    return True, new_tat, 0.0
+
+class MemoryRateLimitBackend:
+    """
+    Per-process limiter. Keys are spread over lock stripes; a key whose TAT is in the past
+    is indistinguishable from a new key, so such idle keys are swept out.
+    """
+
+    def __init__(self, stripes: int = 64, sweep_every: int = 1024):
+        self._stripes = [({}, threading.Lock()) for _ in range(stripes)]
+        self._sweep_every = sweep_every
+        self._ops = [0] * stripes
+
+    def allow(self, key: str, cost: float) -> tuple:
+        idx = hash(key) % len(self._stripes)
+        tats, lock = self._stripes[idx]
+        now = _time.monotonic()
+        with lock:
+            allowed, new_tat, retry_after = _gcra(tats.get(key), now, cost)
+            if allowed:
+                tats[key] = new_tat
+            self._ops[idx] += 1
+            if self._ops[idx] % self._sweep_every == 0:
+                for k in [k for k, t in tats.items() if t <= now]:
+                    del tats[k]
+        return allowed, retry_after
+
+class SQLiteRateLimitBackend:
+    """
+    Limiter shared by every process on the host through one small SQLite file (WAL mode).
+    Each decision is a single IMMEDIATE transaction on one row.
+    """
+
+    def __init__(self, path: str, sweep_every: int = 1024):
+        self.path = path
+        self._local = threading.local()
+        self._sweep_every = sweep_every
+        self._ops = 0
+        self._conn().execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def allow(self, key: str, cost: float) -> tuple:
+        conn = self._conn()
+        now = _time.time()  # wall clock: shared across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            allowed, new_tat, retry_after = _gcra(row[0] if row else None, now, cost)
+            if allowed:
+                conn.execute("INSERT OR REPLACE INTO rate_limits (key, tat) VALUES (?, ?)", (key, new_tat))
+            self._ops += 1
+            if self._ops % self._sweep_every == 0:
+                conn.execute("DELETE FROM rate_limits WHERE tat <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, retry_after
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        self.rejections: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def check(self, route: str, client: str) -> tuple:
+        """
+        Returns (allowed, retry_after_sec) for `client` calling `route`. Limiter failures
+        fail open so a locked/missing limiter file never takes the API down.
+        """
+        try:
+            allowed, retry_after = self.backend.allow(client, ROUTE_COSTS.get(route, 1))
+        except Exception:
+            log.exception("rate limiter backend failed")
+            return True, 0.0
+        if not allowed:
+            with self._lock:
+                self.rejections[route] = self.rejections.get(route, 0) + 1
+        return allowed, retry_after
+
+rate_limiter = RateLimiter(
+    SQLiteRateLimitBackend(RATE_LIMIT_SQLITE_PATH) if RATE_LIMIT_BACKEND == "sqlite" else MemoryRateLimitBackend()
+)
+
+# ----------------------------
+# Metrics and profiling
+# ----------------------------
+LATENCY_BUCKETS_SEC = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+def _labels_key(labels: Optional[Dict[str, Any]]) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+class Metrics:
+    """
+    Process-local counters and histograms, rendered in the Prometheus text format by GET /metrics.
+    Numbers that are already kept elsewhere (cache counters, the job queue) are read at scrape
+    time by collectors rather than mirrored here.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS_SEC):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, tuple] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        # Per-bucket (not yet cumulative) counts, the +Inf bucket, then the sum.
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+        self._collectors: List = []
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 1) -> None:
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = _labels_key(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            hist[slot] += 1
+            hist[-1] += value
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time a block into saun_stage_duration_seconds{stage=...}."""
+        started = _time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("saun_stage_duration_seconds", _time.perf_counter() - started, {"stage": stage})
+
+    def collector(self, fn):
+        """
+        Register fn() -> iterable of (name, kind, help, [(labels, value), ...]), called per scrape.
+        """
+        self._collectors.append(fn)
+        return fn
+
+    def _header(self, lines: List[str], name: str, kind: str, help_text: Optional[str] = None) -> None:
+        lines.append(f"# HELP {name} {help_text or self._help.get(name, (kind, name))[1]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self) -> str:
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self._histograms.items()}
+
+        lines: List[str] = []
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, "counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, "histogram")
+            for key, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), hist):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {hist[-1]:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+        for fn in self._collectors:
+            try:
+                for name, kind, help_text, samples in fn():
+                    self._header(lines, name, kind, help_text)
+                    for labels, value in samples:
+                        lines.append(f"{name}{_format_labels(_labels_key(labels))} {value:g}")
+            except Exception:
+                log.exception("metrics collector %s failed", getattr(fn, "__name__", fn))
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("saun_http_requests_total", "counter", "HTTP requests served, by route and status.")
+metrics.describe("saun_http_request_duration_seconds", "histogram", "Time to produce a response (streamed bodies excluded).")
+metrics.describe("saun_stage_duration_seconds", "histogram", "Duration of instrumented stages of request handlers and jobs.")
+metrics.describe("saun_upstream_requests_total", "counter", "Gemini/SerpApi calls, by endpoint and result (each retry counts).")
+metrics.describe("saun_upstream_request_duration_seconds", "histogram", "Latency of single Gemini/SerpApi attempts, by endpoint.")
+metrics.describe("saun_rate_limited_total", "counter", "Requests rejected by the rate limiter, by route.")
+metrics.describe("saun_rating_cache_total", "counter", "Rating cache lookups by content hash, by result.")
+metrics.describe("saun_generation_job_wait_seconds", "histogram", "Time generation jobs spent queued.")
+metrics.describe("saun_generation_job_run_seconds", "histogram", "Time generation jobs spent running.")
+
+class SlowProfiler:
+    """
+    Opt-in sampling profiler. Threads register work with begin()/end() (or track()); one
+    sampler thread records their stacks every sample_ms, and work that took at least slow_ms
+    is written to out_dir as folded stacks ("frame;frame;frame count" per line).
+    """
+
+    def __init__(self, out_dir: str, slow_ms: int, sample_ms: int):
+        self.out_dir = out_dir
+        self.slow_ms = slow_ms
+        self.sample_ms = max(1, sample_ms)
+        self.enabled = slow_ms > 0
+        self._active: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample_loop(self) -> None:
+        while True:
+            _time.sleep(self.sample_ms / 1000)
+            frames = sys._current_frames()
+            with self._lock:
+                for tid, samples in self._active.items():
+                    frame = frames.get(tid)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    if stack:
+                        samples[";".join(reversed(stack))] += 1
+
+    def begin(self) -> Optional[tuple]:
+        if not self.enabled:
+            return None
+        samples: Counter = Counter()
+        with self._lock:
+            self._active[threading.get_ident()] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+        return threading.get_ident(), samples, _time.perf_counter()
+
+    def end(self, token: Optional[tuple], name: str) -> None:
+        if token is None:
+            return
+        tid, samples, started = token
+        with self._lock:
+            if self._active.get(tid) is samples:
+                del self._active[tid]
+        elapsed_ms = (_time.perf_counter() - started) * 1000
+        if elapsed_ms < self.slow_ms or not samples:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_")
+        path = os.path.join(self.out_dir, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{slug}-{int(elapsed_ms)}ms.folded")
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        log.info("slow %s (%dms): profile written to %s", name, elapsed_ms, path)
+
+    @contextmanager
+    def track(self, name: str):
+        token = self.begin()
+        try:
+            yield
+        finally:
+            self.end(token, name)
+
+profiler = SlowProfiler(PROFILE_DIR, PROFILE_SLOW_MS, PROFILE_SAMPLE_MS)
+
+# ----------------------------
+# Outbound HTTP client
+# ----------------------------
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class HttpClient:
+    """
+    Shared keep-alive connection pools (one requests.Session per host) with a concurrency
+    cap per host, retries with jittered exponential backoff that honour Retry-After, and
+    per-call latency/status stats.
+    """
+
+    def __init__(self, pool_size: int, host_concurrency: int, host_limits: Dict[str, int], max_retries: int, adapter_cls=HTTPAdapter):
+        self.pool_size = pool_size
+        self.adapter_cls = adapter_cls
+        self.host_concurrency = host_concurrency
+        self.host_limits = host_limits
+        self.max_retries = max_retries
+        self._sessions: Dict[str, requests.Session] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[tuple, Dict[str, Any]] = {}
+
+    def _host_state(self, host: str):
+        with self._lock:
+            if host not in self._sessions:
+                sess = requests.Session()
+                adapter = self.adapter_cls(pool_connections=1, pool_maxsize=self.pool_size)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                self._sessions[host] = sess
+                self._slots[host] = threading.BoundedSemaphore(self.host_limits.get(host, self.host_concurrency))
+            return self._sessions[host], self._slots[host]
+
+    def _record(self, host: str, label: str, status: str, elapsed_ms: float, retried: bool) -> None:
+        with self._lock:
+            st = self._stats.setdefault((host, label), {"calls": 0, "retries": 0, "status": {}, "latency_ms": deque(maxlen=500)})
+            st["calls"] += 1
+            st["retries"] += int(retried)
+            st["status"][status] = st["status"].get(status, 0) + 1
+            st["latency_ms"].append(elapsed_ms)
+        metrics.inc("saun_upstream_requests_total", {"host": host, "endpoint": label, "status": status})
+        metrics.observe("saun_upstream_request_duration_seconds", elapsed_ms / 1000, {"host": host, "endpoint": label})
+
+    @staticmethod
+    def _retry_after_sec(resp: requests.Response) -> Optional[float]:
+        value = resp.headers.get("Retry-After")
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        try:
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(when.tzinfo)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _backoff_sec(attempt: int) -> float:
+        return random.uniform(0, min(HTTP_BACKOFF_MAX_SEC, HTTP_BACKOFF_BASE_SEC * (2 ** attempt)))
+
+    def request(self, method: str, url: str, label: Optional[str] = None, retry: bool = True, **kwargs) -> requests.Response:
+        """
+        Like requests.request. Connection errors, timeouts and RETRY_STATUSES are retried
+        (unless retry=False); the last response is returned as-is, so callers still
+        raise_for_status().
+        """
+        host = urlparse(url).netloc
+        label = label or host
+        session, slot = self._host_state(host)
+        attempts = self.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            started = _time.monotonic()
+            with slot:
+                try:
+                    resp = session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    self._record(host, label, type(e).__name__, (_time.monotonic() - started) * 1000, attempt > 0)
+                    if last:
+                        raise
+                    delay = self._backoff_sec(attempt)
+                    resp = None
+            if resp is not None:
+                self._record(host, label, str(resp.status_code), (_time.monotonic() - started) * 1000, attempt > 0)
+                if last or resp.status_code not in RETRY_STATUSES:
+                    return resp
+                retry_after = self._retry_after_sec(resp)
+                if retry_after is not None and retry_after > HTTP_RETRY_AFTER_MAX_SEC:
+                    return resp
+                delay = retry_after if retry_after is not None else self._backoff_sec(attempt)
+                resp.close()
+            _time.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "host": host,
+                    "endpoint": label,
+                    "calls": st["calls"],
+                    "retries": st["retries"],
+                    "status": dict(st["status"]),
+                    "latency_ms": _summarize_ms(st["latency_ms"]),
+                }
+                for (host, label), st in sorted(self._stats.items())
+            ]
+
+http_client = HttpClient(
+    HTTP_POOL_SIZE,
+    HTTP_HOST_CONCURRENCY,
+    {
+        urlparse(BASE_URL).netloc: GEMINI_MAX_CONCURRENCY,
+        urlparse(SERPAPI_URL).netloc: SERP_BATCH_WORKERS,
+        **_parse_kv_list(HTTP_HOST_LIMITS),
+    },
+    HTTP_MAX_RETRIES,
+)
+
+# ----------------------------
+# Async runtime (shared event loop)
+# ----------------------------
+class AsyncRuntime:
+    """
+    One asyncio event loop on a daemon thread, shared by the process. Upstream waits run
+    there as tasks instead of each holding an OS thread; sync code hands a coroutine over
+    with submit() and gets a concurrent.futures.Future back. The loop starts on first use.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-runtime", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+async_runtime = AsyncRuntime()
+
+class AsyncHttpClient:
+    """
+    asyncio counterpart of HttpClient for code running on async_runtime: one pooled
+    httpx.AsyncClient, a semaphore per host with the same limits, the same retry policy,
+    and stats recorded into the sync client so /api/upstreams shows both.
+    Only used from the loop thread, so its state needs no locking.
+    """
+
+    def __init__(self, sync_client: HttpClient, max_connections: int):
+        self.sync = sync_client
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_state(self, host: str):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.sync.pool_size)
+            )
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(self.sync.host_limits.get(host, self.sync.host_concurrency))
+        return self._client, self._slots[host]
+
+    async def request(self, method: str, url: str, label: Optional[str] = None, retry: bool = True, **kwargs) -> httpx.Response:
+        host = urlparse(url).netloc
+        label = label or host
+        client, slot = self._host_state(host)
+        attempts = self.sync.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            started = _time.monotonic()
+            async with slot:
+                try:
+                    resp = await client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    self.sync._record(host, label, type(e).__name__, (_time.monotonic() - started) * 1000, attempt > 0)
+                    if last:
+                        raise
+                    delay = HttpClient._backoff_sec(attempt)
+                    resp = None
+            if resp is not None:
+                self.sync._record(host, label, str(resp.status_code), (_time.monotonic() - started) * 1000, attempt > 0)
+                if last or resp.status_code not in RETRY_STATUSES:
+                    return resp
+                retry_after = HttpClient._retry_after_sec(resp)
+                if retry_after is not None and retry_after > HTTP_RETRY_AFTER_MAX_SEC:
+                    return resp
+                delay = retry_after if retry_after is not None else HttpClient._backoff_sec(attempt)
+            await asyncio.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+async_http_client = AsyncHttpClient(http_client, ASYNC_HTTP_MAX_CONNECTIONS)
+
+# ----------------------------
+# Asset storage
+# ----------------------------
+def storage_key(name: str) -> str:
+    """
+    Sharded key for a stored file: "ab/cd/<name>", from a hash of the name, so no directory
+    (or bucket listing prefix) grows past a few hundred entries.
+    """
+    h = hashlib.sha256(name.encode("utf-8")).hexdigest()
+    return f"{h[:2]}/{h[2:4]}/{name}"
+
+class LocalStorage:
+    """
+    Originals and generated images under root, addressed by key (the path relative to root,
+    which is also what /uploads/<key> serves). Writes go to a temp file beside the destination
+    and are renamed into place, so a crash never leaves a truncated image behind.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def key_of(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def temp_path(self, key: str) -> str:
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        return f"{dest}.{uuid.uuid4().hex}.tmp"
+
+    def put(self, tmp_path: str, key: str, content_type: str) -> str:
+        """
+        Publish a finished temp file (from temp_path) under key. Returns the local path.
+        """
+        dest = self.path(key)
+        os.replace(tmp_path, dest)
+        return dest
+
+    @contextmanager
+    def writing(self, key: str, content_type: str):
+        """
+        Yields a temp path to write; it is published under key when the block completes and
+        removed if it raises.
+        """
+        tmp = self.temp_path(key)
+        try:
+            yield tmp
+            self.put(tmp, key, content_type)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def fetch(self, path: str) -> str:
+        """
+        Local path of a stored file, for reading. Raises FileNotFoundError when it is gone.
+        """
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return path
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def delete(self, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+
+    def public_url(self, key: str) -> Optional[str]:
+        """
+        Where /uploads/<key> redirects to, or None to serve the file from here.
+        """
+        return f"{STORAGE_PUBLIC_URL}/{key}" if STORAGE_PUBLIC_URL else None
+
+def _sigv4_signature(secret_key: str, date: str, scope: str, amz_date: str, canonical_request: str, region: str) -> str:
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    key = f"AWS4{secret_key}".encode("utf-8")
+    for part in (date, region, "s3", "aws4_request"):
+        key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+    return hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def sigv4_request(method: str, url: str, access_key: str, secret_key: str, region: str,
+                  payload_sha256: str, headers: Optional[Dict[str, str]] = None, now: Optional[datetime] = None,
+                  expires: Optional[int] = None) -> Any:
+    """
+    AWS Signature Version 4 for S3. Returns the request headers (Authorization, x-amz-*) or,
+    with `expires`, a presigned URL valid for that many seconds.
+    """
+    now = now or datetime.now(timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = amz_date[:8]
+    scope = f"{date}/{region}/s3/aws4_request"
+    parsed = urlparse(url)
+    canonical_uri = quote(parsed.path or "/", safe="/-_.~")
+
+    signed = {k.lower(): " ".join(str(v).split()) for k, v in (headers or {}).items()}
+    signed["host"] = parsed.netloc
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    if expires is None:
+        signed["x-amz-content-sha256"] = payload_sha256
+        signed["x-amz-date"] = amz_date
+    signed_headers = ";".join(sorted(signed))
+    if expires is not None:
+        payload_sha256 = "UNSIGNED-PAYLOAD"
+        query += [
+            ("X-Amz-Algorithm", "AWS4-HMAC-SHA256"),
+            ("X-Amz-Credential", f"{access_key}/{scope}"),
+            ("X-Amz-Date", amz_date),
+            ("X-Amz-Expires", str(expires)),
+            ("X-Amz-SignedHeaders", signed_headers),
+        ]
+    canonical_query = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query))
+    canonical_request = "\n".join([
+        method, canonical_uri, canonical_query,
+        "".join(f"{k}:{signed[k]}\n" for k in sorted(signed)), signed_headers, payload_sha256,
+    ])
+    signature = _sigv4_signature(secret_key, date, scope, amz_date, canonical_request, region)
+    if expires is not None:
+        return f"{parsed.scheme}://{parsed.netloc}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+    out = {k: v for k, v in (headers or {}).items()}
+    out.update({
+        "x-amz-content-sha256": payload_sha256,
+        "x-amz-date": amz_date,
+        "Authorization": f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}",
+    })
+    return out
+
+class _FileBody:
+    """
+    A request body that streams a file and reopens it on every iteration, so retries in
+    http_client resend the whole file. __len__ lets requests send Content-Length.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.path)
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            yield from iter(lambda: f.read(SPOOL_CHUNK_BYTES), b"")
+
+class S3Storage(LocalStorage):
+    """
+    Assets in an S3-compatible bucket (path-style requests, SigV4-signed, through http_client),
+    with root as a read-through cache: files are uploaded before they are renamed into the
+    cache, and nodes that don't have one download it on first use. /uploads/<key> redirects
+    to a presigned URL, so browsers fetch image bytes from the bucket.
+    """
+
+    def __init__(self, root: str, endpoint: str, bucket: str, region: str, access_key: str, secret_key: str,
+                 presign_ttl: int):
+        super().__init__(root)
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.presign_ttl = presign_ttl
+
+    def _object_url(self, key: str) -> str:
+        return f"{self.endpoint}/{self.bucket}/{key}"
+
+    def _request(self, method: str, key: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None,
+                 payload_sha256: Optional[str] = None, **kwargs):
+        url = self._object_url(key)
+        signed = sigv4_request(
+            method, url, self.access_key, self.secret_key, self.region,
+            payload_sha256 or hashlib.sha256(body).hexdigest(), headers,
+        )
+        return http_client.request(method, url, label=f"storage.{method.lower()}", headers=signed, data=body or None, timeout=60, **kwargs)
+
+    def put(self, tmp_path: str, key: str, content_type: str) -> str:
+        # The payload hash is signed, so the file is read twice (hashed, then sent) rather than held in memory.
+        with metrics.span("storage.put"):
+            resp = self._request(
+                "PUT", key, _FileBody(tmp_path), {"Content-Type": content_type}, payload_sha256=file_sha256(tmp_path),
+            )
+        resp.raise_for_status()
+        return super().put(tmp_path, key, content_type)
+
+    def fetch(self, path: str) -> str:
+        if os.path.isfile(path):
+            return path
+        key = self.key_of(path)
+        with metrics.span("storage.fetch"):
+            resp = self._request("GET", key, stream=True)
+            with resp:
+                if resp.status_code == 404:
+                    raise FileNotFoundError(path)
+                resp.raise_for_status()
+                tmp = self.temp_path(key)
+                try:
+                    with open(tmp, "wb") as out:
+                        for chunk in resp.iter_content(SPOOL_CHUNK_BYTES):
+                            out.write(chunk)
+                    os.replace(tmp, path)
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+        return path
+
+    def in_bucket(self, key: str) -> bool:
+        resp = self._request("HEAD", key)
+        if resp.status_code == 404:
             return False
-        hits.append(now)
-        _ip_hits[ip] = hits
+        resp.raise_for_status()
         return True
 
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path) or self.in_bucket(self.key_of(path))
+
+    def delete(self, path: str) -> None:
+        resp = self._request("DELETE", self.key_of(path))
+        if resp.status_code != 404:
+            resp.raise_for_status()
+        super().delete(path)
+
+    def public_url(self, key: str) -> Optional[str]:
+        if STORAGE_PUBLIC_URL:
+            return f"{STORAGE_PUBLIC_URL}/{key}"
+        # Signing time is rounded down to half the TTL, so the same URL is handed out for a while
+        # and browsers and CDNs can cache the image; it stays valid for at least TTL/2.
+        window = max(1, self.presign_ttl // 2)
+        signed_at = datetime.fromtimestamp(int(_time.time()) // window * window, timezone.utc)
+        return sigv4_request(
+            "GET", self._object_url(key), self.access_key, self.secret_key, self.region, "", now=signed_at,
+            expires=self.presign_ttl,
+        )
+
+def make_storage() -> LocalStorage:
+    if STORAGE_BACKEND == "s3":
+        if not S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        return S3Storage(
+            UPLOAD_DIR, S3_ENDPOINT_URL or f"https://s3.{S3_REGION}.amazonaws.com", S3_BUCKET, S3_REGION,
+            S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY, S3_PRESIGN_TTL_SEC,
+        )
+    return LocalStorage(UPLOAD_DIR)
+
+storage = make_storage()
+
+# ----------------------------
+# Result cache
+# ----------------------------
+class SQLiteCacheStore:
+    """
+    Persistent tier for ResultCache: JSON values in one SQLite file (WAL mode), so entries
+    survive restarts and are shared by every worker process on the host.
+    """
+
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, stored_at REAL NOT NULL, value TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[tuple]:
+        row = self._conn().execute(
+            "SELECT stored_at, value FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def set(self, key: str, value: Any, stored_at: float) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, stored_at, value) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, stored_at, json.dumps(value)),
+        )
+
+    def purge(self, older_than: float) -> None:
+        self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND stored_at < ?", (self.namespace, older_than)
+        )
+
+cache_refresh_pool = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+
+class ResultCache:
+    """
+    Bounded in-process LRU in front of an optional persistent store.
+
+    - Entries younger than ttl_sec are served as-is. Entries up to stale_sec older than that
+      are still served, and a background refresh replaces them (stale-while-revalidate).
+    - Concurrent misses for the same key share one loader call (single-flight).
+    - Loader errors are not cached; a stale value outlives a failed refresh.
+
+    Times are wall-clock so entries from the store can be aged in any process.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl_sec: float, stale_sec: float = 0, store=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.stale_sec = stale_sec
+        self.store = store
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, "stale_hits": 0, "store_hits": 0, "misses": 0, "coalesced": 0,
+            "refreshes": 0, "errors": 0, "evictions": 0,
+        }
+        self._writes = 0
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, key: str, stored_at: float, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _lookup(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.store is not None:
+            try:
+                entry = self.store.get(key)
+            except Exception:
+                log.exception("%s cache store read failed", self.name)
+                entry = None
+            if entry is not None and _time.time() - entry[0] < self.ttl_sec + self.stale_sec:
+                self._count("store_hits")
+                self._remember(key, *entry)
+        if entry is None or _time.time() - entry[0] >= self.ttl_sec + self.stale_sec:
+            return None
+        return entry
+
+    def set(self, key: str, value: Any) -> None:
+        stored_at = _time.time()
+        self._remember(key, stored_at, value)
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, value, stored_at)
+            with self._lock:
+                self._writes += 1
+                purge = self._writes % 256 == 0
+            if purge:
+                self.store.purge(stored_at - self.ttl_sec - self.stale_sec)
+        except Exception:
+            log.exception("%s cache store write failed", self.name)
+
+    def _load(self, key: str, loader) -> Any:
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+            else:
+                self._counters["coalesced"] += 1
+        if not leader:
+            return fut.result()
+        try:
+            value = loader()
+        except BaseException as e:
+            self._count("errors")
+            fut.set_exception(e)
+            raise
+        else:
+            self.set(key, value)
+            fut.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def _load_async(self, key: str, loader) -> Any:
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+            else:
+                self._counters["coalesced"] += 1
+        if not leader:
+            return await asyncio.wrap_future(fut)
+        try:
+            value = await loader()
+        except BaseException as e:
+            self._count("errors")
+            fut.set_exception(e)
+            raise
+        else:
+            self.set(key, value)
+            fut.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh(self, key: str, loader) -> None:
+        with self._lock:
+            if key in self._inflight:
+                return
+            self._counters["refreshes"] += 1
+
+        def run():
+            try:
+                self._load(key, loader)
+            except Exception as e:
+                log.warning("%s cache refresh for %r failed: %s", self.name, key, e)
+
+        cache_refresh_pool.submit(run)
+
+    def get(self, key: str, loader) -> Any:
+        """Return the cached value for key, calling loader() (once across threads) on a miss."""
+        entry = self._lookup(key)
+        if entry is None:
+            self._count("misses")
+            return self._load(key, loader)
+        stored_at, value = entry
+        if _time.time() - stored_at < self.ttl_sec:
+            self._count("hits")
+        else:
+            self._count("stale_hits")
+            self._refresh(key, loader)
+        return value
+
+    async def get_async(self, key: str, loader) -> Any:
+        """
+        get() for code on an event loop: loader() returns an awaitable, and waiting on a load
+        already in flight (from either get or get_async) does not block the loop.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            self._count("misses")
+            return await self._load_async(key, loader)
+        stored_at, value = entry
+        if _time.time() - stored_at < self.ttl_sec:
+            self._count("hits")
+        else:
+            self._count("stale_hits")
+            self._refresh(key, lambda: async_runtime.submit(loader()).result())
+        return value
+
+    def peek(self, key: str, loader=None, count_miss: bool = False) -> Optional[Any]:
+        """
+        Cached value for key without loading on a miss (None). A stale value is still
+        returned, and refreshed in the background when a loader is given. Misses are only
+        counted with count_miss, for callers that fill the entry with set() rather than get().
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            if count_miss:
+                self._count("misses")
+            return None
+        stored_at, value = entry
+        if _time.time() - stored_at < self.ttl_sec:
+            self._count("hits")
+        else:
+            self._count("stale_hits")
+            if loader is not None:
+                self._refresh(key, loader)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["stale_hits"] + counters["misses"]
+        return {
+            "name": self.name,
+            "size": size,
+            "max_entries": self.max_entries,
+            "persistent": self.store is not None,
+            "hit_ratio": round((counters["hits"] + counters["stale_hits"]) / lookups, 3) if lookups else None,
+            **counters,
+        }
+
 # ----------------------------
 # Gemini helpers (REST)
 # ----------------------------
+def _gemini_api_key() -> str:
+    if not GEMINI_API_KEY:
+        raise RuntimeError("Missing GEMINI_API_KEY in environment")
+    return GEMINI_API_KEY
+
 def _headers_json() -> Dict[str, str]:
-    return {"x-goog-api-key": GEMINI_API_KEY, "Content-Type": "application/json"}
+    return {"x-goog-api-key": _gemini_api_key(), "Content-Type": "application/json"}
 
 def gemini_generate_content(model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     url = f"{BASE_URL}/models/{model}:generateContent"
-    r = requests.post(url, headers=_headers_json(), json=payload, timeout=120)
+    r = http_client.post(url, label=f"generateContent:{model}", headers=_headers_json(), json=payload, timeout=120)
+    r.raise_for_status()
+    return r.json()
+
+async def gemini_generate_content_async(model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    url = f"{BASE_URL}/models/{model}:generateContent"
+    r = await async_http_client.post(url, label=f"generateContent:{model}", headers=_headers_json(), json=payload, timeout=120)
     r.raise_for_status()
     return r.json()
 
-def gemini_resumable_upload(file_bytes: bytes, mime_type: str, display_name: str) -> Dict[str, Any]:
+def gemini_stream_generate_content(model: str, payload: Dict[str, Any]):
+    """
+    streamGenerateContent over SSE: yields each partial response as it arrives.
+    """
+    url = f"{BASE_URL}/models/{model}:streamGenerateContent"
+    r = http_client.post(
+        url, label=f"streamGenerateContent:{model}", headers=_headers_json(), params={"alt": "sse"},
+        json=payload, timeout=120, stream=True,
+    )
+    try:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if line and line.startswith("data:"):
+                yield json.loads(line[5:])
+    finally:
+        r.close()
+
+def _upload_query(upload_url: str) -> requests.Response:
+    """
+    Ask the Files API how much of an interrupted resumable upload it has received.
+    """
+    resp = http_client.post(upload_url, label="files.upload:query", headers={"X-Goog-Upload-Command": "query"}, timeout=30)
+    resp.raise_for_status()
+    return resp
+
+def gemini_resumable_upload(path: str, mime_type: str, display_name: str) -> Dict[str, Any]:
     """
     Best-practice media upload via Files API resumable protocol. :contentReference[oaicite:4]{index=4}
+    The file is streamed from disk in chunks (at most UPLOAD_CHUNK_BYTES in memory) and, after a
+    network error or 5xx, resumed from the offset the server reports.
     Returns the full file object response, including file.uri.
     """
-    num_bytes = len(file_bytes)
+    num_bytes = os.path.getsize(path)
 
     # Start resumable session
-    start_url = f"{UPLOAD_BASE_URL}/files?key={GEMINI_API_KEY}"
+    start_url = f"{UPLOAD_BASE_URL}/files?key={_gemini_api_key()}"
     start_headers = {
         "X-Goog-Upload-Protocol": "resumable",
         "X-Goog-Upload-Command": "start",
@@ -150,26 +1734,70 @@ def gemini_resumable_upload(file_bytes: bytes, mime_type: str, display_name: str
         "Content-Type": "application/json",
     }
     metadata = {"file": {"displayName": display_name}}
-    start_resp = requests.post(start_url, headers=start_headers, json=metadata, timeout=60)
+    start_resp = http_client.post(start_url, label="files.upload:start", headers=start_headers, json=metadata, timeout=60)
     start_resp.raise_for_status()
 
     upload_url = start_resp.headers.get("x-goog-upload-url")
     if not upload_url:
         raise RuntimeError("Missing x-goog-upload-url from resumable upload start response")
 
-    # Upload bytes + finalize
-    up_headers = {
-        "Content-Length": str(num_bytes),
-        "X-Goog-Upload-Offset": "0",
-        "X-Goog-Upload-Command": "upload, finalize",
-    }
-    up_resp = requests.post(upload_url, headers=up_headers, data=file_bytes, timeout=120)
-    up_resp.raise_for_status()
-    return up_resp.json()
+    # Non-final chunks must be a multiple of the server's granularity.
+    granularity = int(start_resp.headers.get("x-goog-upload-chunk-granularity") or 256 * 1024)
+    chunk_size = max(granularity, UPLOAD_CHUNK_BYTES // granularity * granularity)
+
+    offset = 0
+    resumes = 0
+    with open(path, "rb") as f:
+        while True:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            final = offset + len(chunk) >= num_bytes
+            up_headers = {
+                "Content-Length": str(len(chunk)),
+                "X-Goog-Upload-Offset": str(offset),
+                "X-Goog-Upload-Command": "upload, finalize" if final else "upload",
+            }
+            try:
+                up_resp = http_client.post(upload_url, label="files.upload:chunk", retry=False, headers=up_headers, data=chunk, timeout=120)
+                if up_resp.status_code in RETRY_STATUSES:
+                    raise requests.ConnectionError(f"upload chunk returned {up_resp.status_code}")
+                up_resp.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout):
+                resumes += 1
+                if resumes > UPLOAD_MAX_RESUMES:
+                    raise
+                _time.sleep(HttpClient._backoff_sec(resumes))
+                status = _upload_query(upload_url)
+                if status.headers.get("x-goog-upload-status") == "final":
+                    return status.json()
+                offset = int(status.headers.get("x-goog-upload-size-received") or 0)
+                continue
+            if final:
+                return up_resp.json()
+            offset += len(chunk)
+
+def file_uri_expiry(uploaded: Dict[str, Any]) -> datetime:
+    """
+    Expiry of an uploaded file (naive UTC), from its expirationTime when present.
+    """
+    fallback = datetime.utcnow() + timedelta(hours=FILE_URI_TTL_HOURS)
+    m = re.match(r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})", uploaded.get("file", {}).get("expirationTime") or "")
+    if not m:
+        return fallback
+    return min(fallback, datetime.strptime(m.group(1), "%Y-%m-%dT%H:%M:%S"))
+
+def _uri_live(uri: Optional[str], expires_at: Optional[datetime]) -> bool:
+    if not uri or not expires_at:
+        return False
+    return expires_at - datetime.utcnow() > timedelta(seconds=FILE_URI_MIN_REMAINING_SEC)
 
-def extract_text_from_gemini(resp: Dict[str, Any]) -> str:
+def file_uri_usable(asset: Optional["ImageAsset"]) -> bool:
+    return asset is not None and _uri_live(asset.file_uri, asset.file_uri_expires_at)
+
+def extract_text_from_gemini(resp: Dict[str, Any], strip: bool = True) -> str:
     """
     Gemini responses can have multiple parts; concatenate all text parts.
+    Pass strip=False for streamed chunks, whose edge whitespace belongs to the text.
     """
     candidates = resp.get("candidates", [])
     if not candidates:
@@ -179,7 +1807,8 @@ def extract_text_from_gemini(resp: Dict[str, Any]) -> str:
     for p in parts:
         if "text" in p and p["text"] is not None:
             texts.append(p["text"])
-    return "".join(texts).strip()
+    text = "".join(texts)
+    return text.strip() if strip else text
 
 def extract_inline_images_from_gemini(resp: Dict[str, Any]) -> List[Dict[str, str]]:
     """
@@ -303,6 +1932,11 @@ def _safe_json_loads(value: Optional[str], fallback):
     except Exception:
         return fallback
 
+def _get_session_asset_by_url(db, session_id: str, url: Optional[str]) -> Optional[ImageAsset]:
+    if not url:
+        return None
+    return db.query(ImageAsset).filter(ImageAsset.session_id == session_id, ImageAsset.url == url).first()
+
 def _get_latest_generated_asset(db, session_id: str) -> Optional[ImageAsset]:
     return (
         db.query(ImageAsset)
@@ -311,6 +1945,39 @@ def _get_latest_generated_asset(db, session_id: str) -> Optional[ImageAsset]:
         .first()
     )
 
+MODEL_INPUT_MAX_EDGE = {"rating": RATING_MAX_EDGE, "edit": EDIT_MAX_EDGE}
+
+def model_input_path(src_path: str, purpose: str) -> str:
+    """
+    Path of the image to send to Gemini for `purpose` ("rating" or "edit"): a JPEG whose
+    longest edge is at most MODEL_INPUT_MAX_EDGE[purpose], resampled with Lanczos. Variants
+    are written once under DERIVED_DIR and reused; small JPEGs are used as-is.
+    """
+    edge = MODEL_INPUT_MAX_EDGE[purpose]
+    if edge <= 0:
+        return storage.fetch(src_path)
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    dest = os.path.join(DERIVED_DIR, f"{stem}-{purpose}-{edge}.jpg")
+    if os.path.exists(dest):
+        return dest
+    src_path = storage.fetch(src_path)
+    with Image.open(src_path) as img:
+        if max(img.size) <= edge and img.format == "JPEG":
+            return src_path
+        # JPEG draft mode decodes at a reduced scale, so large photos are never fully expanded.
+        img.draft("RGB", (edge, edge))
+        out = img.convert("RGB") if img.mode != "RGB" else img
+        out.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        out.save(tmp, format="JPEG", quality=MODEL_INPUT_JPEG_QUALITY)
+    os.replace(tmp, dest)
+    return dest
+
+def _inline_image_part(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode("utf-8")
+    return {"inlineData": {"mimeType": _mime_from_path(path), "data": b64}}
+
 def _mime_from_path(path: str) -> str:
     lower = path.lower()
     if lower.endswith(".png"):
@@ -319,16 +1986,173 @@ def _mime_from_path(path: str) -> str:
         return "image/webp"
     return "image/jpeg"
 
-def generate_rating_for_session(db, sess: Session) -> Dict[str, Any]:
+# Changes whenever the rating prompt, schema or input resolution changes, which invalidates cached ratings.
+RATING_PROMPT_VERSION = hashlib.sha256(
+    (build_rating_prompt(FIXED_CATEGORIES) + json.dumps(RATING_SCHEMA, sort_keys=True) + f"@{RATING_MAX_EDGE}").encode("utf-8")
+).hexdigest()[:12]
+
+def _apply_rating(db, sess: Session, rating_obj: Dict[str, Any]) -> None:
+    # rating_json stays the API blob; scores and suggestions are also written as typed rows for queries.
+    sess.rating_json = json.dumps(rating_obj)
+    sess.status = "rated"
+    write_rating_rows(db, sess.id, rating_obj, GEMINI_RATING_MODEL)
+    db.commit()
+
+def get_cached_rating(db, content_sha256: str) -> Optional[Dict[str, Any]]:
+    row = db.query(RatingCache).get((content_sha256, GEMINI_RATING_MODEL, RATING_PROMPT_VERSION))
+    return _safe_json_loads(row.rating_json, None) if row else None
+
+def store_cached_rating(db, content_sha256: str, rating_obj: Dict[str, Any]) -> None:
+    db.merge(RatingCache(
+        sha256=content_sha256,
+        model=GEMINI_RATING_MODEL,
+        prompt_version=RATING_PROMPT_VERSION,
+        rating_json=json.dumps(rating_obj),
+        created_at=datetime.utcnow(),
+    ))
+    db.commit()
+
+class JsonObjectStreamParser:
+    """
+    Incremental parser for a streamed JSON object: feed() text chunks as they arrive and get
+    back ("field", key, value) for each top-level member once its value is complete, plus
+    ("item", key, element) for each element of a top-level array member as soon as that
+    element is complete (before the array's own "field" event).
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.reading_key = False
+        self.key_chars: List[str] = []
+        self.key: Optional[str] = None
+        self.in_value = False
+        self.value: List[str] = []
+        self.in_item = False
+        self.item: List[str] = []
+
+    def _add(self, ch: str) -> None:
+        if self.in_value:
+            self.value.append(ch)
+        if self.in_item:
+            self.item.append(ch)
+
+    def _emit(self, out: list, kind: str, chars: List[str]) -> None:
+        raw = "".join(chars).strip()
+        if not raw:
+            return
+        try:
+            out.append((kind, self.key, json.loads(raw)))
+        except ValueError:
+            pass
+
+    def feed(self, text: str) -> List[tuple]:
+        out: List[tuple] = []
+        for ch in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.reading_key:
+                        self.reading_key = False
+                        self.key = json.loads('"' + "".join(self.key_chars) + '"')
+                        continue
+                if self.reading_key:
+                    self.key_chars.append(ch)
+                else:
+                    self._add(ch)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1 and not self.in_value:
+                    self.reading_key = True
+                    self.key_chars = []
+                else:
+                    self._add(ch)
+            elif self.depth == 0:
+                if ch == "{":
+                    self.depth = 1
+            elif self.depth == 1 and not self.in_value:
+                if ch == ":":
+                    self.in_value = True
+                    self.value = []
+                elif ch == "}":
+                    self.depth = 0
+            elif self.depth == 1 and ch in ",}":
+                self._emit(out, "field", self.value)
+                self.in_value = False
+                if ch == "}":
+                    self.depth = 0
+            elif self.depth == 1 and ch == "[" and not "".join(self.value).strip():
+                # A top-level array: its elements are reported one by one.
+                self.value.append(ch)
+                self.depth = 2
+                self.in_item = True
+                self.item = []
+            elif self.depth == 2 and self.in_item and ch in ",]":
+                self._emit(out, "item", self.item)
+                self.item = []
+                self.value.append(ch)
+                if ch == "]":
+                    self.in_item = False
+                    self.depth = 1
+            else:
+                if ch in "[{":
+                    self.depth += 1
+                elif ch in "]}":
+                    self.depth -= 1
+                self._add(ch)
+        return out
+
+def _stream_rating_text(payload: Dict[str, Any], on_partial) -> str:
+    """
+    Run the rating over streamGenerateContent, calling on_partial(rating_so_far) whenever a
+    top-level field or a single suggestion completes. Returns the full response text.
+    """
+    parser = JsonObjectStreamParser()
+    partial: Dict[str, Any] = {}
+    chunks: List[str] = []
+    for resp in gemini_stream_generate_content(GEMINI_RATING_MODEL, payload):
+        text = extract_text_from_gemini(resp, strip=False)
+        chunks.append(text)
+        events = parser.feed(text)
+        for kind, key, value in events:
+            if kind == "item":
+                partial.setdefault(key, []).append(value)
+            else:
+                partial[key] = value
+        if events:
+            on_partial(dict(partial))
+    return "".join(chunks).strip()
+
+def generate_rating_for_session(db, sess: Session, content_sha256: Optional[str] = None, use_cache: bool = True,
+                                on_partial=None) -> Dict[str, Any]:
+    """
+    Rate the session's original image. When content_sha256 is given, a cached rating for the
+    same bytes/model/prompt version is reused (unless use_cache is False) and fresh ratings are
+    written back to the cache. With on_partial, the rating is streamed and on_partial gets the
+    fields completed so far (in RATING_SCHEMA order: score, breakdown, summary, then one
+    suggestion at a time); the complete rating is still only stored at the end.
+    """
+    if content_sha256 and use_cache:
+        cached = get_cached_rating(db, content_sha256)
+        metrics.inc("saun_rating_cache_total", {"result": "hit" if cached else "miss"})
+        if cached:
+            _apply_rating(db, sess, cached)
+            return cached
+
     prompt = build_rating_prompt(FIXED_CATEGORIES)
 
     parts = []
     if sess.original_file_uri:
         parts.append({"fileData": {"fileUri": sess.original_file_uri, "mimeType": "image/jpeg"}})
     else:
-        with open(sess.original_image_path, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode("utf-8")
-        parts.append({"inlineData": {"mimeType": "image/jpeg", "data": b64}})
+        parts.append(_inline_image_part(model_input_path(sess.original_image_path, "rating")))
 
     parts.append({"text": prompt})
 
@@ -341,39 +2165,406 @@ def generate_rating_for_session(db, sess: Session) -> Dict[str, Any]:
         }
     }
 
-    resp = gemini_generate_content(GEMINI_RATING_MODEL, payload)
-    text = extract_text_from_gemini(resp)
+    with metrics.span("rating.model"):
+        if on_partial:
+            text = _stream_rating_text(payload, on_partial)
+        else:
+            text = extract_text_from_gemini(gemini_generate_content(GEMINI_RATING_MODEL, payload))
     if not text:
         raise RuntimeError("Gemini returned empty response text for structured output")
 
     rating_obj = json.loads(text)
-    suggestions = rating_obj.get("suggestions", [])
-    sess.rating_json = json.dumps(rating_obj)
-    sess.suggestions_json = json.dumps(suggestions)
-    sess.status = "rated"
-    db.commit()
+    with metrics.span("rating.commit"):
+        _apply_rating(db, sess, rating_obj)
+        if content_sha256:
+            store_cached_rating(db, content_sha256, rating_obj)
     return rating_obj
 
 # ----------------------------
-# Background job runner (simple)
+# In-process pub/sub (feeds the SSE endpoints)
 # ----------------------------
-_job_threads: Dict[str, threading.Thread] = {}
-_job_lock = threading.Lock()
+class EventBus:
+    """
+    Fan-out of small JSON events to subscribers of a topic such as "job:<id>".
+    Slow subscribers drop events rather than block publishers.
+    """
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._subs: Dict[str, List[queue.Queue]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str) -> queue.Queue:
+        q: queue.Queue = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subs.setdefault(topic, []).append(q)
+        return q
+
+    def unsubscribe(self, topic: str, q: queue.Queue) -> None:
+        with self._lock:
+            subs = self._subs.get(topic, [])
+            if q in subs:
+                subs.remove(q)
+            if not subs:
+                self._subs.pop(topic, None)
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subs = list(self._subs.get(topic, []))
+        for q in subs:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass
+
+event_bus = EventBus()
+
+JOB_TERMINAL_STATES = ("done", "error")
+
+def job_payload(job: GenerationJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "generated_images": _safe_json_loads(job.result_images_json, []),
+        "error": job.error_message,
+    }
+
+def publish_job(job: GenerationJob) -> None:
+    event_bus.publish(f"job:{job.id}", job_payload(job))
+
+def sse_format(data: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+def sse_response(topic: str, load_snapshot, is_final) -> Response:
+    """
+    Stream events for `topic`: the current state from load_snapshot() first, then each
+    published change, closing once is_final(event) is true. load_snapshot is re-run every
+    SSE_RESYNC_SEC of silence, since work done by another process publishes elsewhere.
+    Returns a 404 JSON response when load_snapshot() finds nothing.
+    """
+    # Subscribe before reading the snapshot so a transition in between is not lost.
+    sub = event_bus.subscribe(topic)
+    snapshot = load_snapshot()
+    if not snapshot:
+        event_bus.unsubscribe(topic, sub)
+        return jsonify({"error": {"code": "not_found", "message": "Not found"}}), 404
+
+    def stream():
+        last = snapshot
+        last_sync = _time.monotonic()
+        try:
+            yield sse_format(last)
+            while not is_final(last):
+                try:
+                    event = sub.get(timeout=SSE_KEEPALIVE_SEC)
+                except queue.Empty:
+                    event = None
+                    if _time.monotonic() - last_sync >= SSE_RESYNC_SEC:
+                        last_sync = _time.monotonic()
+                        event = load_snapshot()
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event != last:
+                    last = event
+                    yield sse_format(event)
+        finally:
+            event_bus.unsubscribe(topic, sub)
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+SESSION_PENDING_STATES = ("uploaded", "rating")
+
+# Fields of ratings still streaming in, by session id (this process only).
+_rating_progress: Dict[str, Dict[str, Any]] = {}
+_rating_progress_lock = threading.Lock()
+
+def session_payload(sess: Session) -> Dict[str, Any]:
+    with _rating_progress_lock:
+        partial = _rating_progress.get(sess.id)
+    return {
+        "session_id": sess.id,
+        "status": sess.status,
+        "rating_result": _safe_json_loads(sess.rating_json, None),
+        "rating_partial": None if sess.rating_json else partial,
+        "error": sess.error_message,
+    }
+
+def publish_session(sess: Session) -> None:
+    event_bus.publish(f"session:{sess.id}", session_payload(sess))
+
+# ----------------------------
+# Rating pipeline
+# ----------------------------
+def ensure_original_file_uri(db, sess: Session, asset: Optional[ImageAsset]) -> Optional[str]:
+    """
+    Make sure the session's original has a live Files API uri, uploading it if needed.
+    Upload failures are not fatal; rating/generation fall back to inlineData.
+    """
+    if file_uri_usable(asset):
+        if sess.original_file_uri != asset.file_uri:
+            sess.original_file_uri = asset.file_uri
+            db.commit()
+        return asset.file_uri
+    file_uri, expires_at = None, None
+    try:
+        rating_input = model_input_path(sess.original_image_path, "rating")
+        uploaded = gemini_resumable_upload(rating_input, _mime_from_path(rating_input), display_name=f"room-{sess.id}")
+        file_uri = uploaded.get("file", {}).get("uri")
+        expires_at = file_uri_expiry(uploaded) if file_uri else None
+    except Exception:
+        pass
+    sess.original_file_uri = file_uri
+    if asset is not None:
+        asset.file_uri = file_uri
+        asset.file_uri_expires_at = expires_at
+    db.commit()
+    return file_uri
+
+_uploads_in_flight: Dict[str, threading.Event] = {}
+_uploads_lock = threading.Lock()
+
+def _edit_uri_fields(asset: ImageAsset) -> tuple:
+    if asset.kind == "original":
+        return "edit_file_uri", "edit_file_uri_expires_at"
+    return "file_uri", "file_uri_expires_at"
+
+def ensure_edit_file_uri(db, asset: ImageAsset) -> Optional[str]:
+    """
+    Live Files API uri for the edit-size variant of an asset, uploading it when it has none
+    or it is about to expire. Generated assets keep it in file_uri; originals in
+    edit_file_uri, since their file_uri is the rating-size upload. One upload per asset at
+    a time: a caller that finds an upload in flight waits for it. Returns None when the
+    upload fails; callers inline the image instead.
+    """
+    uri_field, expires_field = _edit_uri_fields(asset)
+
+    def live_uri() -> Optional[str]:
+        uri = getattr(asset, uri_field)
+        return uri if _uri_live(uri, getattr(asset, expires_field)) else None
+
+    uri = live_uri()
+    if uri:
+        return uri
+    with _uploads_lock:
+        done = _uploads_in_flight.get(asset.id)
+        leader = done is None
+        if leader:
+            done = _uploads_in_flight[asset.id] = threading.Event()
+    if not leader:
+        done.wait(timeout=120)
+        db.refresh(asset)
+        return live_uri()
+    try:
+        edit_input = model_input_path(asset.path, "edit")
+        uploaded = gemini_resumable_upload(edit_input, _mime_from_path(edit_input), display_name=f"asset-{asset.id}")
+        file_uri = uploaded.get("file", {}).get("uri")
+        if file_uri:
+            setattr(asset, uri_field, file_uri)
+            setattr(asset, expires_field, file_uri_expiry(uploaded))
+            db.commit()
+        return file_uri
+    except Exception as e:
+        log.warning("upload of asset %s failed: %s", asset.id, e)
+        return None
+    finally:
+        with _uploads_lock:
+            _uploads_in_flight.pop(asset.id, None)
+        done.set()
+
+file_upload_pool = ThreadPoolExecutor(max_workers=FILE_UPLOAD_WORKERS, thread_name_prefix="file-upload")
+
+def upload_generated_assets(asset_ids: List[str]) -> None:
+    db = SessionLocal()
+    try:
+        for asset in db.query(ImageAsset).filter(ImageAsset.id.in_(asset_ids)):
+            ensure_edit_file_uri(db, asset)
+    finally:
+        db.close()
+
+def rating_error_message(e: Exception) -> str:
+    if isinstance(e, json.JSONDecodeError):
+        return "Gemini did not return valid JSON"
+    return str(e)
+
+def run_rating_pipeline(session_id: str, use_cache: bool = True, stream: bool = RATING_STREAM) -> None:
+    """
+    Background stages for an uploaded session: Files API upload, then the rating call.
+    Status moves uploaded -> rating -> rated (or error) and each step is published; with
+    `stream`, so is each rating field as it arrives (as rating_partial).
+    """
+    def on_partial(partial: Dict[str, Any]) -> None:
+        with _rating_progress_lock:
+            _rating_progress[session_id] = partial
+        publish_session(sess)
+
+    db = SessionLocal()
+    try:
+        sess: Optional[Session] = db.query(Session).get(session_id)
+        if not sess or sess.rating_json:
+            return
+        asset = _get_original_asset(db, sess.id)
+        ensure_original_file_uri(db, sess, asset)
+
+        sess.status = "rating"
+        db.commit()
+        publish_session(sess)
+
+        generate_rating_for_session(
+            db, sess, content_sha256=asset.source_sha256 if asset else None, use_cache=use_cache,
+            on_partial=on_partial if stream else None,
+        )
+        with _rating_progress_lock:
+            _rating_progress.pop(session_id, None)
+        publish_session(sess)
+    except Exception as e:
+        db.rollback()
+        sess = db.query(Session).get(session_id)
+        if sess:
+            sess.status = "error"
+            sess.error_message = rating_error_message(e)
+            db.commit()
+            with _rating_progress_lock:
+                _rating_progress.pop(session_id, None)
+            publish_session(sess)
+    finally:
+        with _rating_progress_lock:
+            _rating_progress.pop(session_id, None)
+        db.close()
+
+rating_pool = ThreadPoolExecutor(max_workers=RATING_WORKERS, thread_name_prefix="rating")
+
+def recover_pending_ratings() -> None:
+    """
+    Re-submit sessions whose background rating was interrupted by a restart. Sessions created
+    by a bulk upload are left to recover_bulk_jobs, which rates them under its own limits.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=RATING_RECOVERY_HOURS)
+    db = SessionLocal()
+    try:
+        pending = (
+            db.query(Session.id)
+            .filter(Session.status.in_(SESSION_PENDING_STATES), Session.rating_json.is_(None), Session.created_at >= cutoff)
+            .filter(~db.query(BulkItem.id).filter(BulkItem.session_id == Session.id).exists())
+            .all()
+        )
+    finally:
+        db.close()
+    for (session_id,) in pending:
+        rating_pool.submit(run_rating_pipeline, session_id)
+
+# ----------------------------
+# Generation jobs
+# ----------------------------
+GENERATED_FORMATS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "png": ("PNG", "image/png", ".png"),
+}
+
+def generated_format() -> tuple:
+    """
+    (Pillow format, mimeType, extension) for GENERATED_IMAGE_FORMAT.
+    """
+    return GENERATED_FORMATS.get(GENERATED_IMAGE_FORMAT, GENERATED_FORMATS["webp"])
+
+def encode_generated_image(src, dest: str) -> str:
+    """
+    Re-encode an image (path or file object) to GENERATED_IMAGE_FORMAT at dest.
+    Returns the mimeType.
+    """
+    pil_format, mime, _ = generated_format()
+    with Image.open(src) as img:
+        out = img.convert("RGB") if img.mode not in ("RGB", "L") else img
+        if pil_format == "PNG":
+            out.save(dest, format="PNG", optimize=True)
+        elif pil_format == "WEBP":
+            out.save(dest, format="WEBP", quality=GENERATED_IMAGE_QUALITY, method=6)
+        else:
+            out.save(dest, format="JPEG", quality=GENERATED_IMAGE_QUALITY, optimize=True, progressive=True)
+    return mime
+
+def store_generated_image(img_bytes: bytes, source_mime: str, name_stem: str) -> tuple:
+    """
+    Persist model output in the configured storage format, falling back to the raw bytes
+    if they cannot be decoded. Returns (storage key, mimeType).
+    """
+    _, mime, ext = generated_format()
+    key = storage_key(name_stem + ext)
+    try:
+        with storage.writing(key, mime) as tmp:
+            encode_generated_image(io.BytesIO(img_bytes), tmp)
+        return key, mime
+    except Exception:
+        log.exception("could not transcode generated image; storing %s as-is", source_mime)
+        key = storage_key(name_stem + {"image/jpeg": ".jpg", "image/webp": ".webp"}.get(source_mime, ".png"))
+        with storage.writing(key, source_mime) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(img_bytes)
+        return key, source_mime
+
+async def generate_variation(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One Nano Banana call on the shared event loop; the image is decoded and stored on a
+    worker thread.
+    """
+    resp = await gemini_generate_content_async(NANOBANANA_MODEL, payload)
+    return await asyncio.to_thread(store_variation, resp)
+
+def store_variation(resp: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Stores the first image of a Nano Banana response and describes it for an ImageAsset.
+    """
+    imgs = extract_inline_images_from_gemini(resp)
+
+    if not imgs:
+        # Sometimes models return text-only error/explanation
+        t = extract_text_from_gemini(resp)
+        raise RuntimeError(f"Nano Banana returned no image. Model text: {t[:400]}")
+
+    # Save first image part
+    img0 = imgs[0]
+    img_bytes = base64.b64decode(img0["data"])
+    out_id = str(uuid.uuid4())
+    with metrics.span("generation.encode"):
+        key, stored_mime = store_generated_image(img_bytes, img0.get("mimeType", "image/png"), out_id)
+    out_path = storage.path(key)
+    return {
+        "id": out_id,
+        "path": out_path,
+        "url": f"/uploads/{key}",
+        "created_at": datetime.utcnow(),
+        "meta": {
+            "mimeType": stored_mime,
+            "sourceMimeType": img0.get("mimeType", "image/png"),
+            "sha256": sha256_file(out_path),
+            "sourceSha256": sha256_bytes(img_bytes),
+            "model": NANOBANANA_MODEL,
+        },
+    }
 
 def run_generation_job(job_id: str):
+    """
+    Execute a job that JobScheduler has already claimed (status == "running").
+    """
     db = SessionLocal()
     try:
         job: GenerationJob = db.query(GenerationJob).get(job_id)
         if not job:
             return
-        job.status = "running"
-        db.commit()
+        publish_job(job)
 
         sess: Session = db.query(Session).get(job.session_id)
         if not sess:
             job.status = "error"
             job.error_message = "Session not found"
+            job.finished_at = datetime.utcnow()
             db.commit()
+            publish_job(job)
             return
 
         requested = json.loads(job.requested_edits_json)
@@ -381,72 +2572,86 @@ def run_generation_job(job_id: str):
         selected_categories = requested.get("selected_categories", [])
         additional_changes = requested.get("additional_changes", [])
         user_extra = requested.get("user_prompt_extra", "")
-        num_variations = 1
+        num_variations = max(1, min(MAX_VARIATIONS, int(requested.get("num_variations") or 1)))
 
         # Build prompt
         edit_prompt = build_edit_prompt(selected_suggestions, selected_categories, additional_changes, user_extra)
 
-        # Start from the latest generated image when available; otherwise use original upload.
+        # Start from the image the user picked, else the latest generated image, else the original upload,
+        # referenced by Files API uri (uploaded or refreshed here if needed) and inlined only as a fallback.
+        # The original's rating upload doubles as its edit input only when both sizes match.
         parts = []
-        latest_generated = _get_latest_generated_asset(db, sess.id)
-        if latest_generated:
-            with open(latest_generated.path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("utf-8")
-            parts.append({"inlineData": {"mimeType": _mime_from_path(latest_generated.path), "data": b64}})
-        elif sess.original_file_uri:
-            parts.append({"fileData": {"fileUri": sess.original_file_uri, "mimeType": "image/jpeg"}})
-        else:
-            with open(sess.original_image_path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("utf-8")
-            parts.append({"inlineData": {"mimeType": "image/jpeg", "data": b64}})
+        with metrics.span("generation.base_image"):
+            base = _get_session_asset_by_url(db, sess.id, requested.get("base_image_url")) or _get_latest_generated_asset(db, sess.id)
+            if base is None or base.kind == "original":
+                base_path = sess.original_image_path
+                original = base or _get_original_asset(db, sess.id)
+                if EDIT_MAX_EDGE == RATING_MAX_EDGE:
+                    base_uri = ensure_original_file_uri(db, sess, original)
+                else:
+                    base_uri = ensure_edit_file_uri(db, original) if original else None
+            else:
+                base_path = base.path
+                base_uri = ensure_edit_file_uri(db, base)
+            edit_input = model_input_path(base_path, "edit")
+            if base_uri:
+                parts.append({"fileData": {"fileUri": base_uri, "mimeType": _mime_from_path(edit_input)}})
+            else:
+                parts.append(_inline_image_part(edit_input))
 
         parts.append({"text": edit_prompt})
 
-        generated_urls = []
-        for _ in range(num_variations):
-            payload = {"contents": [{"parts": parts}]}
-            resp = gemini_generate_content(NANOBANANA_MODEL, payload)
-            imgs = extract_inline_images_from_gemini(resp)
-
-            if not imgs:
-                # Sometimes models return text-only error/explanation
-                t = extract_text_from_gemini(resp)
-                raise RuntimeError(f"Nano Banana returned no image. Model text: {t[:400]}")
-
-            # Save first image part
-            img0 = imgs[0]
-            img_bytes = base64.b64decode(img0["data"])
-            out_id = str(uuid.uuid4())
-            out_name = f"{out_id}.png"
-            out_path = os.path.join(UPLOAD_DIR, out_name)
-            with open(out_path, "wb") as f:
-                f.write(img_bytes)
-
-            url = f"/uploads/{out_name}"
-            generated_urls.append(url)
-
-            asset = ImageAsset(
-                id=out_id,
-                session_id=sess.id,
-                kind="generated",
-                path=out_path,
-                url=url,
-                meta_json=json.dumps({"mimeType": img0.get("mimeType", "image/png"), "model": NANOBANANA_MODEL}),
-            )
-            db.add(asset)
-            db.commit()
-
+        # Variations run concurrently as tasks on the shared event loop. Each one is committed as it
+        # lands, with the job's result list, so progress is visible from every process and a requeued
+        # job only generates the variations it is still missing.
+        generated_urls: List[str] = _safe_json_loads(job.result_images_json, [])
+        payload = {"contents": [{"parts": parts}]}
+        futures = [async_runtime.submit(generate_variation(payload)) for _ in range(num_variations - len(generated_urls))]
+        failures: List[str] = []
+        with metrics.span("generation.variations"):
+            for fut in as_completed(futures):
+                try:
+                    out = fut.result()
+                except Exception as e:
+                    failures.append(str(e))
+                    continue
+                db.add(ImageAsset(
+                    id=out["id"],
+                    session_id=sess.id,
+                    kind="generated",
+                    path=out["path"],
+                    url=out["url"],
+                    meta_json=json.dumps(out["meta"]),
+                    created_at=out["created_at"],
+                ))
+                generated_urls.append(out["url"])
+                job.result_images_json = json.dumps(generated_urls)
+                with metrics.span("generation.commit"):
+                    db.commit()
+                publish_job(job)
+                if UPLOAD_GENERATED_ASSETS:
+                    file_upload_pool.submit(upload_generated_assets, [out["id"]])
+
+        if not generated_urls:
+            raise RuntimeError(failures[0] if failures else "No variations generated")
+
+        if failures:
+            job.error_message = f"{len(failures)} of {num_variations} variations failed: {failures[0][:300]}"
         job.status = "done"
-        job.result_images_json = json.dumps(generated_urls)
+        job.finished_at = datetime.utcnow()
         sess.status = "done"
         db.commit()
+        publish_job(job)
 
     except Exception as e:
+        db.rollback()
         job = db.query(GenerationJob).get(job_id)
         if job:
             job.status = "error"
             job.error_message = str(e)
+            job.finished_at = datetime.utcnow()
             db.commit()
+            publish_job(job)
         sess = None
         if job:
             sess = db.query(Session).get(job.session_id)
@@ -456,38 +2661,657 @@ def run_generation_job(job_id: str):
     finally:
         db.close()
 
-def start_job_thread(job_id: str):
-    t = threading.Thread(target=run_generation_job, args=(job_id,), daemon=True)
-    with _job_lock:
-        _job_threads[job_id] = t
-    t.start()
+def _summarize_ms(samples) -> Dict[str, Any]:
+    values = sorted(samples)
+    if not values:
+        return {"count": 0}
+    def pct(p: float) -> int:
+        return int(values[min(len(values) - 1, int(p * len(values)))])
+    return {
+        "count": len(values),
+        "avg": int(sum(values) / len(values)),
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "max": int(values[-1]),
+    }
+
+class JobScheduler:
+    """
+    Fixed-size worker pool that uses the generation_jobs table as its queue.
+
+    Workers claim the oldest queued job whose session has nothing running and no older
+    queued job, so edits within a session apply in submission order (each builds on the
+    previous result) while different sessions run in parallel. Claims are a single
+    conditional UPDATE, so several processes can share the table safely.
+
+    Running jobs are heartbeated; a job whose owner stopped heartbeating (crash, restart)
+    goes back to the queue until it has been attempted JOB_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, num_workers: int, max_queue: int):
+        self.num_workers = num_workers
+        self.max_queue = max_queue
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._signal = threading.Semaphore(0)
+        self._claim_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, float] = {}  # job_id -> monotonic start
+        self._wait_ms: deque = deque(maxlen=500)
+        self._run_ms: deque = deque(maxlen=500)
+        self._finished = {"done": 0, "error": 0, "requeued": 0, "abandoned": 0}
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads or self.num_workers <= 0:
+            return
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"gen-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._maintenance_loop, name="gen-maintenance", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def notify(self) -> None:
+        """Wake an idle worker after a job was committed."""
+        self._signal.release()
+
+    def queue_depth(self, db) -> int:
+        return db.query(func.count(GenerationJob.id)).filter(GenerationJob.status == "queued").scalar() or 0
+
+    def _claimable(self):
+        running = aliased(GenerationJob)
+        earlier = aliased(GenerationJob)
+        return (
+            ~exists().where(running.session_id == GenerationJob.session_id, running.status == "running"),
+            ~exists().where(
+                earlier.session_id == GenerationJob.session_id,
+                earlier.status == "queued",
+                earlier.created_at < GenerationJob.created_at,
+            ),
+        )
+
+    def _claim_next(self) -> Optional[GenerationJob]:
+        db = SessionLocal()
+        try:
+            with self._claim_lock:
+                # Other processes claim from the same table. Where the database supports it, rows
+                # another claimer has locked are skipped; either way the conditional UPDATE below
+                # only succeeds for whichever claimer still finds the job queued.
+                candidates = (
+                    db.query(GenerationJob.id)
+                    .filter(GenerationJob.status == "queued", *self._claimable())
+                    .order_by(GenerationJob.created_at.asc())
+                    .limit(10)
+                    .with_for_update(skip_locked=True)
+                    .all()
+                )
+                for (job_id,) in candidates:
+                    now = datetime.utcnow()
+                    claimed = (
+                        db.query(GenerationJob)
+                        .filter(GenerationJob.id == job_id, GenerationJob.status == "queued", *self._claimable())
+                        .update({
+                            GenerationJob.status: "running",
+                            GenerationJob.started_at: now,
+                            GenerationJob.heartbeat_at: now,
+                            GenerationJob.worker_id: self.worker_id,
+                            GenerationJob.attempts: func.coalesce(GenerationJob.attempts, 0) + 1,
+                        }, synchronize_session=False)
+                    )
+                    if claimed == 1:
+                        bump_session_revisions(db, [db.query(GenerationJob.session_id).filter(GenerationJob.id == job_id).scalar()])
+                    db.commit()
+                    if claimed == 1:
+                        return db.query(GenerationJob).get(job_id)
+                return None
+        finally:
+            db.close()
+
+    def _worker_loop(self) -> None:
+        while True:
+            try:
+                job = self._claim_next()
+            except Exception:
+                log.exception("job claim failed")
+                job = None
+            if not job:
+                self._signal.acquire(timeout=JOB_POLL_SEC)
+                continue
+
+            wait_ms = (job.started_at - job.created_at).total_seconds() * 1000 if job.created_at else 0
+            started = _time.monotonic()
+            with self._lock:
+                self._in_flight[job.id] = started
+                self._wait_ms.append(wait_ms)
+            metrics.observe("saun_generation_job_wait_seconds", wait_ms / 1000)
+            try:
+                with profiler.track(f"job {job.id}"):
+                    run_generation_job(job.id)
+            except Exception:
+                log.exception("generation job %s crashed", job.id)
+            finally:
+                run_ms = (_time.monotonic() - started) * 1000
+                metrics.observe("saun_generation_job_run_seconds", run_ms / 1000)
+                status = self._final_status(job.id)
+                with self._lock:
+                    self._in_flight.pop(job.id, None)
+                    self._run_ms.append(run_ms)
+                    if status in self._finished:
+                        self._finished[status] += 1
+                # A finished job may unblock the next one queued for the same session.
+                self.notify()
+
+    def _final_status(self, job_id: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).get(job_id)
+            return job.status if job else None
+        finally:
+            db.close()
+
+    def _maintenance_loop(self) -> None:
+        while True:
+            _time.sleep(JOB_HEARTBEAT_SEC)
+            try:
+                self._heartbeat()
+                self._requeue_stale()
+            except Exception:
+                log.exception("job maintenance failed")
+
+    def _heartbeat(self) -> None:
+        with self._lock:
+            job_ids = list(self._in_flight)
+        if not job_ids:
+            return
+        db = SessionLocal()
+        try:
+            db.query(GenerationJob).filter(
+                GenerationJob.id.in_(job_ids), GenerationJob.status == "running"
+            ).update({GenerationJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _requeue_stale(self) -> None:
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SEC)
+        last_seen = func.coalesce(GenerationJob.heartbeat_at, GenerationJob.started_at, GenerationJob.created_at)
+        db = SessionLocal()
+        try:
+            stale = db.query(GenerationJob).filter(GenerationJob.status == "running", last_seen < cutoff)
+            stale_rows = stale.with_entities(GenerationJob.id, GenerationJob.session_id).all()
+            stale_ids = [job_id for job_id, _ in stale_rows]
+            bump_session_revisions(db, [session_id for _, session_id in stale_rows])
+            exhausted = stale.filter(func.coalesce(GenerationJob.attempts, 0) >= JOB_MAX_ATTEMPTS)
+            abandoned_sessions = [session_id for (session_id,) in exhausted.with_entities(GenerationJob.session_id)]
+            abandoned = exhausted.update({
+                GenerationJob.status: "error",
+                GenerationJob.error_message: "Job abandoned after repeated worker failures",
+                GenerationJob.finished_at: datetime.utcnow(),
+            }, synchronize_session=False)
+            requeued = stale.filter(func.coalesce(GenerationJob.attempts, 0) < JOB_MAX_ATTEMPTS).update({
+                GenerationJob.status: "queued",
+                GenerationJob.worker_id: None,
+            }, synchronize_session=False)
+            if abandoned_sessions:
+                # As run_generation_job does on failure, unless the session has other jobs still to run.
+                pending = aliased(GenerationJob)
+                db.query(Session).filter(
+                    Session.id.in_(abandoned_sessions),
+                    Session.status == "generating",
+                    ~exists().where(pending.session_id == Session.id, pending.status.in_(["queued", "running"])),
+                ).update({Session.status: "error"}, synchronize_session=False)
+            db.commit()
+            for job in db.query(GenerationJob).filter(GenerationJob.id.in_(stale_ids)):
+                publish_job(job)
+        finally:
+            db.close()
+        if requeued or abandoned:
+            with self._lock:
+                self._finished["requeued"] += requeued
+                self._finished["abandoned"] += abandoned
+            log.warning("requeued %d stale job(s), abandoned %d", requeued, abandoned)
+            for _ in range(requeued):
+                self.notify()
+
+    def estimate_wait_sec(self, depth: int) -> int:
+        with self._lock:
+            runs = list(self._run_ms)
+        avg_run_sec = (sum(runs) / len(runs) / 1000) if runs else 20
+        return max(1, int(avg_run_sec * depth / max(1, self.num_workers)))
+
+    def stats(self, db) -> Dict[str, Any]:
+        counts = dict(
+            db.query(GenerationJob.status, func.count(GenerationJob.id))
+            .filter(GenerationJob.status.in_(["queued", "running"]))
+            .group_by(GenerationJob.status)
+            .all()
+        )
+        with self._lock:
+            return {
+                "worker_id": self.worker_id,
+                "workers": self.num_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": counts.get("queued", 0),
+                "running": counts.get("running", 0),
+                "in_flight_here": len(self._in_flight),
+                "wait_ms": _summarize_ms(self._wait_ms),
+                "run_ms": _summarize_ms(self._run_ms),
+                "finished": dict(self._finished),
+            }
+
+job_scheduler = JobScheduler(GENERATION_WORKERS, GENERATION_QUEUE_MAX)
+
+def start_background_workers() -> None:
+    job_scheduler.start()
+    recover_pending_ratings()
+    recover_bulk_jobs()
+
+# ----------------------------
+# Image derivatives (thumbnails / responsive sizes)
+# ----------------------------
+DERIVATIVE_FORMATS = {
+    "avif": ("AVIF", "image/avif"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+def derivative_format_supported(fmt: str) -> bool:
+    Image.init()
+    return fmt in DERIVATIVE_FORMATS and DERIVATIVE_FORMATS[fmt][0] in Image.SAVE
+
+class DerivativeCache:
+    """
+    Disk-backed LRU of generated image variants, capped at max_bytes. Recency is kept in
+    memory and mirrored into file mtimes, so the order survives restarts.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # name -> size, oldest first
+        self._total = 0
+        self._lock = threading.Lock()
+        self._building: Dict[str, threading.Lock] = {}
+        files = []
+        for name in os.listdir(root):
+            full = os.path.join(root, name)
+            if name.endswith(".tmp"):
+                os.remove(full)
+            elif os.path.isfile(full):
+                st = os.stat(full)
+                files.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total += size
+
+    def get_or_create(self, name: str, build) -> str:
+        """
+        Path of cached entry `name`, calling build(tmp_path) to create it on a miss.
+        Concurrent misses for the same name build once.
+        """
+        path = os.path.join(self.root, name)
+        with self._lock:
+            if name in self._entries and os.path.exists(path):
+                self._entries.move_to_end(name)
+                hit = True
+            else:
+                hit = False
+                build_lock = self._building.setdefault(name, threading.Lock())
+        if hit:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+
+        with build_lock:
+            if not os.path.exists(path):
+                tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+                try:
+                    build(tmp)
+                    os.replace(tmp, path)
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+            size = os.path.getsize(path)
+            with self._lock:
+                self._building.pop(name, None)
+                self._total += size - self._entries.pop(name, 0)
+                self._entries[name] = size
+                self._evict()
+        return path
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+
+derivative_cache = DerivativeCache(DERIVATIVE_CACHE_DIR, DERIVATIVE_CACHE_MAX_MB * 1024 * 1024)
+
+_asset_sha_cache: "OrderedDict[str, str]" = OrderedDict()
+_asset_sha_lock = threading.Lock()
+
+def asset_sha256(filename: str, fetch) -> str:
+    """
+    Content hash of a stored upload, from ImageAsset.meta_json when recorded (and backfilled
+    there otherwise, hashing the local path fetch() returns). Stored files never change, so
+    results are memoized in-process.
+    """
+    with _asset_sha_lock:
+        if filename in _asset_sha_cache:
+            _asset_sha_cache.move_to_end(filename)
+            return _asset_sha_cache[filename]
+
+    db = SessionLocal()
+    try:
+        asset = db.query(ImageAsset).filter(ImageAsset.url == f"/uploads/{filename}").first()
+        meta = _safe_json_loads(asset.meta_json, {}) if asset else {}
+        digest = meta.get("sha256")
+        if not digest:
+            digest = sha256_file(fetch())
+            if asset:
+                meta["sha256"] = digest
+                asset.meta_json = json.dumps(meta)
+                db.commit()
+    finally:
+        db.close()
+
+    with _asset_sha_lock:
+        _asset_sha_cache[filename] = digest
+        while len(_asset_sha_cache) > 4096:
+            _asset_sha_cache.popitem(last=False)
+    return digest
+
+def render_derivative(src_path: str, width: int, fmt: str, quality: int, dest_path: str) -> None:
+    pil_format = DERIVATIVE_FORMATS[fmt][0]
+    with Image.open(src_path) as img:
+        target_w = min(width, img.width)
+        target_h = max(1, round(img.height * target_w / img.width))
+        img.draft("RGB", (target_w, target_h))
+        out = img.convert("RGB") if img.mode != "RGB" else img
+        if out.size != (target_w, target_h):
+            out = out.resize((target_w, target_h), Image.Resampling.LANCZOS)
+        save_kwargs = {"quality": quality}
+        if pil_format == "WEBP":
+            save_kwargs["method"] = 4
+        elif pil_format == "JPEG":
+            save_kwargs.update(optimize=True, progressive=True)
+        out.save(dest_path, format=pil_format, **save_kwargs)
 
 # ----------------------------
 # Flask app
 # ----------------------------
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+if TRUSTED_PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
 CORS(app, resources={r"/api/*": {"origins": CORS_ORIGIN}})
 
+@app.before_request
+def _start_request_metrics():
+    g.request_started = _time.perf_counter()
+    g.profile_token = profiler.begin()
+
+@app.after_request
+def _record_request_metrics(resp):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("saun_http_request_duration_seconds", _time.perf_counter() - started, {"method": request.method, "route": route})
+        metrics.inc("saun_http_requests_total", {"method": request.method, "route": route, "status": resp.status_code})
+        profiler.end(g.pop("profile_token", None), f"{request.method} {route}")
+    return resp
+
 @app.get("/api/health")
 def health():
     return jsonify({"ok": True})
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@metrics.collector
+def _cache_metrics():
+    stats = [c.stats() for c in (serp_cache, products_cache, session_view_cache)]
+    events = ("hits", "stale_hits", "store_hits", "misses", "coalesced", "refreshes", "errors", "evictions")
+    yield "saun_cache_events_total", "counter", "Result cache lookups and maintenance, by cache and event.", [
+        ({"cache": st["name"], "event": e}, st[e]) for st in stats for e in events
+    ]
+    yield "saun_cache_entries", "gauge", "Entries held in memory, by cache.", [({"cache": st["name"]}, st["size"]) for st in stats]
+
+@metrics.collector
+def _job_metrics():
+    db = SessionLocal()
+    try:
+        st = job_scheduler.stats(db)
+    finally:
+        db.close()
+    yield "saun_generation_jobs_finished_total", "counter", "Generation jobs finished by this process's workers, by final state.", [
+        ({"status": status}, n) for status, n in st["finished"].items()
+    ]
+    yield "saun_generation_jobs", "gauge", "Generation jobs in the shared queue, by state.", [
+        ({"status": "queued"}, st["queue_depth"]), ({"status": "running"}, st["running"]),
+    ]
+    yield "saun_generation_jobs_in_flight", "gauge", "Generation jobs running on this process's workers.", [({}, st["in_flight_here"])]
+
+@app.get("/api/upstreams")
+def upstream_stats():
+    return jsonify({"upstreams": http_client.stats(), "caches": [serp_cache.stats(), products_cache.stats()]})
+
+@app.get("/api/queue")
+def queue_stats():
+    db = SessionLocal()
+    try:
+        return jsonify(job_scheduler.stats(db))
+    finally:
+        db.close()
+
+def _immutable(resp, etag: Optional[str] = None):
+    # Upload filenames are UUIDs and their content never changes.
+    resp.cache_control.no_cache = None
+    resp.cache_control.public = True
+    resp.cache_control.max_age = IMMUTABLE_MAX_AGE
+    resp.cache_control.immutable = True
+    if etag:
+        resp.set_etag(etag)
+    return resp
+
+def _accel_redirect(internal_path: str, mimetype: Optional[str]) -> Response:
+    # nginx serves internal_path (under STORAGE_ACCEL_REDIRECT) itself; no bytes pass through Python.
+    resp = Response(mimetype=mimetype or "application/octet-stream")
+    resp.headers["X-Accel-Redirect"] = f"{STORAGE_ACCEL_REDIRECT}/{quote(internal_path)}"
+    return resp
+
+def _stored_key(filename: str) -> Optional[str]:
+    # Scratch space under UPLOAD_DIR (.spool-*, .bulk/, .cache/) is never served.
+    parts = filename.split("/")
+    if any(not p or p.startswith(".") for p in parts):
+        return None
+    return "/".join(parts)
+
 @app.get("/uploads/<path:filename>")
 def uploads(filename):
-    return send_from_directory(UPLOAD_DIR, filename)
+    """
+    A stored original or generated image: a redirect to STORAGE_PUBLIC_URL or a presigned
+    bucket URL when storage has one, an X-Accel-Redirect with STORAGE_ACCEL_REDIRECT, and
+    otherwise the file itself.
+    """
+    key = _stored_key(filename)
+    if key is None:
+        return jsonify({"error": {"code": "not_found", "message": "Image not found"}}), 404
+    target = storage.public_url(key)
+    if target:
+        resp = redirect(target, 302)
+        # Presigned URLs stay the same for S3_PRESIGN_TTL_SEC / 2 (see S3Storage.public_url).
+        resp.cache_control.public = True
+        resp.cache_control.max_age = IMMUTABLE_MAX_AGE if STORAGE_PUBLIC_URL else S3_PRESIGN_TTL_SEC // 4
+        return resp
+    if STORAGE_ACCEL_REDIRECT:
+        if not os.path.isfile(storage.path(key)):
+            return jsonify({"error": {"code": "not_found", "message": "Image not found"}}), 404
+        return _immutable(_accel_redirect(key, mimetypes.guess_type(key)[0]))
+    return _immutable(send_from_directory(UPLOAD_DIR, key, max_age=IMMUTABLE_MAX_AGE))
+
+@app.get("/api/images/<path:filename>")
+def image_derivative(filename: str):
+    """
+    Resized/re-encoded copy of an upload. Query: w (snapped up to DERIVATIVE_WIDTHS),
+    fmt (avif|webp|jpeg; negotiated from Accept when omitted) and q (30-95).
+    """
+    key = _stored_key(filename)
+    if key is None:
+        return jsonify({"error": {"code": "not_found", "message": "Image not found"}}), 404
+
+    try:
+        requested_w = int(request.args.get("w") or DERIVATIVE_WIDTHS[-1])
+        quality = min(95, max(30, int(request.args.get("q") or DERIVATIVE_DEFAULT_QUALITY)))
+    except ValueError:
+        return jsonify({"error": {"code": "bad_request", "message": "w and q must be integers"}}), 400
+    width = next((w for w in DERIVATIVE_WIDTHS if w >= requested_w), DERIVATIVE_WIDTHS[-1])
+
+    fmt = (request.args.get("fmt") or "").lower()
+    negotiated = not fmt
+    if negotiated:
+        accept = request.headers.get("Accept", "")
+        fmt = next((f for f in ("avif", "webp") if f"image/{f}" in accept and derivative_format_supported(f)), "jpeg")
+    elif fmt == "jpg":
+        fmt = "jpeg"
+    if not derivative_format_supported(fmt):
+        return jsonify({"error": {"code": "bad_request", "message": f"Unsupported format: {fmt}"}}), 400
+
+    # The etag comes from the recorded hash, so revalidations and derivative cache hits are
+    # answered without fetching the original from storage.
+    def source() -> str:
+        return storage.fetch(storage.path(key))
+
+    try:
+        digest = asset_sha256(key, source)
+        etag = f"{digest[:32]}-w{width}-q{quality}-{fmt}"
+        if etag in request.if_none_match:
+            resp = _immutable(Response(status=304), etag)
+        else:
+            path = derivative_cache.get_or_create(f"{etag}.{fmt}", lambda tmp: render_derivative(source(), width, fmt, quality, tmp))
+            if STORAGE_ACCEL_REDIRECT:
+                resp = _immutable(_accel_redirect(storage.key_of(path), DERIVATIVE_FORMATS[fmt][1]), etag)
+            else:
+                resp = _immutable(send_file(path, mimetype=DERIVATIVE_FORMATS[fmt][1], etag=False, conditional=False), etag)
+    except FileNotFoundError:
+        return jsonify({"error": {"code": "not_found", "message": "Image not found"}}), 404
+
+    if negotiated:
+        resp.vary.add("Accept")
+    return resp
 
 def client_ip() -> str:
-    return request.headers.get("X-Forwarded-For", request.remote_addr or "unknown").split(",")[0].strip()
+    # X-Forwarded-For is only honoured through ProxyFix for TRUSTED_PROXY_COUNT hops.
+    return request.remote_addr or "unknown"
+
+def enforce_rate_limit(route: str):
+    """
+    None when the caller may proceed, else the 429 response to return.
+    """
+    allowed, retry_after = rate_limiter.check(route, client_ip())
+    if allowed:
+        return None
+    metrics.inc("saun_rate_limited_total", {"route": route})
+    resp = jsonify({"error": {"code": "rate_limited", "message": "Too many requests"}})
+    resp.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return resp, 429
+
+def request_flag(name: str) -> bool:
+    value = request.args.get(name) or request.form.get(name) or ""
+    return value.lower() in ("1", "true", "yes")
 
 def sha256_bytes(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
 
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(SPOOL_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def spool_to_disk(stream) -> tuple:
+    """
+    Copy an upload stream to a temp file in UPLOAD_DIR, hashing it on the way.
+    Returns (path, sha256, size); the caller removes the file.
+    """
+    h = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".spool-")
+    with os.fdopen(fd, "wb") as out:
+        for chunk in iter(lambda: stream.read(SPOOL_CHUNK_BYTES), b""):
+            h.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return path, h.hexdigest(), size
+
+def _find_original_by_source_hash(db, source_sha256: str) -> Optional[ImageAsset]:
+    candidates = (
+        db.query(ImageAsset)
+        .filter(ImageAsset.source_sha256 == source_sha256, ImageAsset.kind == "original")
+        .order_by(ImageAsset.created_at.desc())
+        .limit(5)
+        .all()
+    )
+    for asset in candidates:
+        if storage.exists(asset.path):
+            return asset
+    return None
+
+def _get_original_asset(db, session_id: str) -> Optional[ImageAsset]:
+    return (
+        db.query(ImageAsset)
+        .filter(ImageAsset.session_id == session_id, ImageAsset.kind == "original")
+        .order_by(ImageAsset.created_at.asc())
+        .first()
+    )
+
+def add_original_session(db, sid: str, path: str, url: str, meta: Dict[str, Any], source_sha256: str,
+                         existing: Optional[ImageAsset]) -> tuple:
+    """
+    Add a new session and its original asset (not committed). `existing` is the asset found
+    by source hash, whose Files API uris are reused while they are still valid.
+    """
+    reuse_uri = file_uri_usable(existing)
+    reuse_edit_uri = existing is not None and _uri_live(existing.edit_file_uri, existing.edit_file_uri_expires_at)
+    sess = Session(
+        id=sid,
+        status="uploaded",
+        original_image_path=path,
+        original_image_url=url,
+        original_file_uri=existing.file_uri if reuse_uri else None,
+    )
+    db.add(sess)
+
+    asset = ImageAsset(
+        id=str(uuid.uuid4()),
+        session_id=sid,
+        kind="original",
+        path=path,
+        url=url,
+        meta_json=json.dumps(meta),
+        source_sha256=source_sha256,
+        file_uri=existing.file_uri if reuse_uri else None,
+        file_uri_expires_at=existing.file_uri_expires_at if reuse_uri else None,
+        edit_file_uri=existing.edit_file_uri if reuse_edit_uri else None,
+        edit_file_uri_expires_at=existing.edit_file_uri_expires_at if reuse_edit_uri else None,
+    )
+    db.add(asset)
+    return sess, asset
+
 @app.post("/api/sessions")
 def create_session():
-    ip = client_ip()
-    if not check_rate_limit(ip):
-        return jsonify({"error": {"code": "rate_limited", "message": "Too many requests"}}), 429
+    limited = enforce_rate_limit("create_session")
+    if limited:
+        return limited
 
     if "image" not in request.files:
         return jsonify({"error": {"code": "bad_request", "message": "Missing form-data field: image"}}), 400
@@ -496,95 +3320,111 @@ def create_session():
     if not file.filename:
         return jsonify({"error": {"code": "bad_request", "message": "Empty filename"}}), 400
 
-    raw = file.read()
-    if not raw:
-        return jsonify({"error": {"code": "bad_request", "message": "Empty file"}}), 400
-
     # Basic mime guard
     mime = file.mimetype or "application/octet-stream"
     if mime not in ("image/jpeg", "image/png", "image/webp"):
         return jsonify({"error": {"code": "unsupported_media_type", "message": f"Unsupported mime: {mime}"}}), 415
 
-    # Normalize to JPEG to keep downstream consistent
-    try:
-        img = Image.open(io.BytesIO(raw)).convert("RGB")
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=92)
-        img_bytes = buf.getvalue()
-        mime = "image/jpeg"
-    except Exception:
-        return jsonify({"error": {"code": "bad_image", "message": "Could not parse image"}}), 400
-
-    sid = str(uuid.uuid4())
-    filename = f"{sid}.jpg"
-    path = os.path.join(UPLOAD_DIR, filename)
-    with open(path, "wb") as f:
-        f.write(img_bytes)
-
-    # Upload to Gemini Files API (recommended) :contentReference[oaicite:6]{index=6}
-    file_uri = None
-    try:
-        uploaded = gemini_resumable_upload(img_bytes, mime, display_name=f"room-{sid}")
-        file_uri = uploaded.get("file", {}).get("uri")
-    except Exception as e:
-        # Not fatal for hackathon; we can fall back to inlineData.
-        file_uri = None
+    refresh_rating = request_flag("refresh_rating")
+    with metrics.span("create_session.spool"):
+        spool_path, source_sha256, size = spool_to_disk(file.stream)
+    if not size:
+        os.remove(spool_path)
+        return jsonify({"error": {"code": "bad_request", "message": "Empty file"}}), 400
 
     db = SessionLocal()
     try:
-        sess = Session(
-            id=sid,
-            status="uploaded",
-            original_image_path=path,
-            original_image_url=f"/uploads/{filename}",
-            original_file_uri=file_uri,
-        )
-        db.add(sess)
-
-        asset = ImageAsset(
-            id=str(uuid.uuid4()),
-            session_id=sid,
-            kind="original",
-            path=path,
-            url=f"/uploads/{filename}",
-            meta_json=json.dumps({"mimeType": mime, "sha256": sha256_bytes(img_bytes)}),
-        )
-        db.add(asset)
-        db.commit()
+        # Content-addressed reuse: identical upload bytes map to the same stored file and Files API uri.
+        with metrics.span("create_session.dedup_lookup"):
+            existing = _find_original_by_source_hash(db, source_sha256)
+        sid = str(uuid.uuid4())
+        if existing:
+            path = existing.path
+            url = existing.url
+            meta = _safe_json_loads(existing.meta_json, {})
+        else:
+            key = storage_key(f"{sid}.jpg")
+            path = storage.path(key)
+            url = f"/uploads/{key}"
+            # Normalize to JPEG to keep downstream consistent
+            try:
+                with metrics.span("create_session.normalize"), storage.writing(key, "image/jpeg") as tmp:
+                    normalize_to_jpeg(spool_path, tmp)
+            except Exception:
+                return jsonify({"error": {"code": "bad_image", "message": "Could not parse image"}}), 400
+            with metrics.span("create_session.hash"):
+                meta = {"mimeType": "image/jpeg", "sha256": sha256_file(path)}
 
-        try:
-            rating_obj = generate_rating_for_session(db, sess)
-        except json.JSONDecodeError:
-            sess.status = "error"
+        sess, asset = add_original_session(db, sid, path, url, meta, source_sha256, existing)
+        with metrics.span("create_session.commit"):
             db.commit()
+
+        cached = None if refresh_rating else get_cached_rating(db, source_sha256)
+        if cached:
+            # Known image: no model work left, answer straight away in either mode.
+            rating_obj = generate_rating_for_session(db, sess, content_sha256=source_sha256)
             return jsonify({
-                "error": {"code": "bad_model_output", "message": "Gemini did not return valid JSON"},
                 "session_id": sid,
+                "status": sess.status,
                 "original_image_url": sess.original_image_url,
-            }), 502
-        except requests.HTTPError as e:
+                "file_uri": sess.original_file_uri,
+                "rating_result": rating_obj,
+                "reused_upload": existing is not None,
+                "rating_cached": True,
+            })
+
+        if not request_flag("sync"):
+            # Upload and rating continue in the background; follow along via
+            # GET /api/sessions/<id> or /api/sessions/<id>/events.
+            rating_pool.submit(run_rating_pipeline, sid, not refresh_rating)
+            return jsonify({
+                "session_id": sid,
+                "status": sess.status,
+                "original_image_url": sess.original_image_url,
+                "file_uri": None,
+                "rating_result": None,
+                "reused_upload": existing is not None,
+                "rating_cached": False,
+            }), 202
+
+        try:
+            # Upload to Gemini Files API (recommended) :contentReference[oaicite:6]{index=6}
+            with metrics.span("create_session.files_upload"):
+                ensure_original_file_uri(db, sess, asset)
+            with metrics.span("create_session.rating"):
+                rating_obj = generate_rating_for_session(db, sess, content_sha256=source_sha256, use_cache=not refresh_rating)
+        except Exception as e:
+            # Same outcome as a failed background rating, so the session is never left in "uploaded".
+            db.rollback()
             sess.status = "error"
+            sess.error_message = rating_error_message(e)
             db.commit()
+            publish_session(sess)
+            code = "bad_model_output" if isinstance(e, json.JSONDecodeError) else "gemini_error"
             return jsonify({
-                "error": {"code": "gemini_error", "message": str(e)},
+                "error": {"code": code, "message": sess.error_message},
                 "session_id": sid,
                 "original_image_url": sess.original_image_url,
             }), 502
 
         return jsonify({
             "session_id": sid,
+            "status": sess.status,
             "original_image_url": sess.original_image_url,
-            "file_uri": file_uri,  # optional
+            "file_uri": sess.original_file_uri,  # optional
             "rating_result": rating_obj,
+            "reused_upload": existing is not None,
+            "rating_cached": False,
         })
     finally:
         db.close()
+        os.remove(spool_path)
 
 @app.post("/api/sessions/<session_id>/rate")
 def rate_session(session_id: str):
-    ip = client_ip()
-    if not check_rate_limit(ip):
-        return jsonify({"error": {"code": "rate_limited", "message": "Too many requests"}}), 429
+    limited = enforce_rate_limit("rate")
+    if limited:
+        return limited
 
     db = SessionLocal()
     try:
@@ -592,7 +3432,12 @@ def rate_session(session_id: str):
         if not sess:
             return jsonify({"error": {"code": "not_found", "message": "Session not found"}}), 404
 
-        rating_obj = generate_rating_for_session(db, sess)
+        # An explicit re-rate always calls the model; the fresh result replaces the cached one.
+        original = _get_original_asset(db, sess.id)
+        ensure_original_file_uri(db, sess, original)  # the stored uri may have expired since the upload
+        rating_obj = generate_rating_for_session(
+            db, sess, content_sha256=original.source_sha256 if original else None, use_cache=False
+        )
         return jsonify(rating_obj)
 
     except json.JSONDecodeError:
@@ -604,9 +3449,9 @@ def rate_session(session_id: str):
 
 @app.post("/api/sessions/<session_id>/generate")
 def generate(session_id: str):
-    ip = client_ip()
-    if not check_rate_limit(ip):
-        return jsonify({"error": {"code": "rate_limited", "message": "Too many requests"}}), 429
+    limited = enforce_rate_limit("generate")
+    if limited:
+        return limited
 
     body = request.get_json(silent=True) or {}
     selected_ids = body.get("selected_suggestion_ids") or []
@@ -617,7 +3462,13 @@ def generate(session_id: str):
         additional_changes = [additional_changes]
     additional_changes = [str(x).strip() for x in additional_changes if str(x).strip()]
     user_extra = body.get("user_prompt_extra", "")
-    num_variations = 1
+    base_image_url = body.get("base_image_url") or None
+    try:
+        num_variations = int(body.get("num_variations") or 1)
+    except (TypeError, ValueError):
+        num_variations = 0
+    if not 1 <= num_variations <= MAX_VARIATIONS:
+        return jsonify({"error": {"code": "bad_request", "message": f"num_variations must be between 1 and {MAX_VARIATIONS}"}}), 400
 
     db = SessionLocal()
     try:
@@ -625,16 +3476,27 @@ def generate(session_id: str):
         if not sess:
             return jsonify({"error": {"code": "not_found", "message": "Session not found"}}), 404
 
-        if not sess.suggestions_json and not sess.rating_json:
+        if not sess.rating_json:
             return jsonify({"error": {"code": "bad_state", "message": "Session has no rating/suggestions"}}), 400
 
-        all_suggestions = _safe_json_loads(sess.suggestions_json, [])
+        depth = job_scheduler.queue_depth(db)
+        if depth >= GENERATION_QUEUE_MAX:
+            resp = jsonify({
+                "error": {"code": "queue_full", "message": "Generation queue is full, try again shortly"},
+                "queue_depth": depth,
+            })
+            resp.headers["Retry-After"] = str(job_scheduler.estimate_wait_sec(depth))
+            return resp, 503
+
+        rows = db.query(Suggestion).filter(Suggestion.session_id == sess.id).order_by(Suggestion.position).all()
         selected_ids_set = set(selected_ids)
         selected_categories_set = set(selected_categories)
-        chosen = [
-            s for s in all_suggestions
-            if s.get("id") in selected_ids_set or s.get("category") in selected_categories_set
-        ]
+        chosen_rows = [r for r in rows if r.key in selected_ids_set or r.category in selected_categories_set]
+        if not chosen_rows and not selected_categories and rows:
+            chosen_rows = rows[:1]
+        for r in chosen_rows:
+            r.times_chosen = Suggestion.times_chosen + 1
+        chosen = [suggestion_dict(r) for r in chosen_rows]
 
         if not chosen and selected_categories:
             chosen = [{
@@ -647,9 +3509,6 @@ def generate(session_id: str):
                 "effort": "medium",
             } for c in selected_categories]
 
-        if not chosen and all_suggestions:
-            chosen = all_suggestions[:1]
-
         job_id = str(uuid.uuid4())
         job = GenerationJob(
             id=job_id,
@@ -661,6 +3520,7 @@ def generate(session_id: str):
                 "additional_changes": additional_changes,
                 "user_prompt_extra": user_extra,
                 "num_variations": num_variations,
+                "base_image_url": base_image_url,
                 "model": NANOBANANA_MODEL,
             })
         )
@@ -668,26 +3528,19 @@ def generate(session_id: str):
         sess.status = "generating"
         db.commit()
 
-        start_job_thread(job_id)
+        publish_job(job)
+        job_scheduler.notify()
 
-        return jsonify({"job_id": job_id, "status": "queued"})
+        return jsonify({"job_id": job_id, "status": "queued", "queue_depth": depth + 1})
     finally:
         db.close()
 
 
-@app.post("/api/generate-products")
-def generate_products():
-    ip = client_ip()
-    if not check_rate_limit(ip):
-        return jsonify({"error": {"code": "rate_limited", "message": "Too many requests"}}), 429
-
-    body = request.get_json(silent=True) or {}
-    prompt = body.get("prompt", "")
-    if not prompt or not isinstance(prompt, str):
-        return jsonify({"error": {"code": "bad_request", "message": "Missing prompt"}}), 400
+MAX_PRODUCTS = 12
 
+def build_products_instruction(prompt: str) -> str:
     # Build a concise instruction to return a JSON array of descriptive product names
-    instruction = (
+    return (
         "Given the following edit prompt for an interior design image, produce a JSON array (only) of up to 12 products"
         " that would likely appear in the edited image. For each product, provide a brief but descriptive name (2-5 words)"
         " that includes style/material details (e.g., 'Modern Beige Linen Sofa', 'Minimalist Chrome Floor Lamp')."
@@ -695,32 +3548,182 @@ def generate_products():
         f"\n\nPrompt:\n{prompt}"
     )
 
-    try:
-        payload = {
-            "contents": [{"parts": [{"text": instruction}]}],
-            "generationConfig": {"responseMimeType": "application/json", "temperature": 0.5}
-        }
-        resp = gemini_generate_content(GEMINI_RATING_MODEL, payload)
-        text = extract_text_from_gemini(resp)
-        if text:
-            try:
-                data = json.loads(text)
-                if isinstance(data, list):
-                    # normalize strings
-                    products = [str(x).strip() for x in data if isinstance(x, (str, int, float)) and str(x).strip()]
-                    return jsonify({"products": products})
-            except Exception:
-                # fall through to fallback parsing
-                pass
-    except requests.HTTPError as e:
-        # let fallback handle
-        pass
-    except Exception:
-        pass
+def _products_payload(prompt: str) -> Dict[str, Any]:
+    return {
+        "contents": [{"parts": [{"text": build_products_instruction(prompt)}]}],
+        "generationConfig": {"responseMimeType": "application/json", "temperature": 0.5}
+    }
+
+PRODUCTS_PROMPT_VERSION = hashlib.sha256(json.dumps(_products_payload(""), sort_keys=True).encode("utf-8")).hexdigest()[:12]
 
-    # Fallback: naive extraction from prompt (split punctuation/newlines)
+def products_cache_key(prompt: str) -> str:
+    normalized = " ".join(prompt.lower().split())
+    return sha256_bytes(f"{PRODUCTS_PROMPT_VERSION}\n{normalized}".encode("utf-8"))
+
+class ProductCacheStore:
+    """
+    Persistent tier for products_cache: product_cache rows in the app database.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def get(self, key: str) -> Optional[tuple]:
+        db = SessionLocal()
+        try:
+            row = db.query(ProductCache).get((key, self.model))
+            if not row:
+                return None
+            return row.created_at.replace(tzinfo=timezone.utc).timestamp(), json.loads(row.products_json)
+        finally:
+            db.close()
+
+    def set(self, key: str, value: Any, stored_at: float) -> None:
+        db = SessionLocal()
+        try:
+            db.merge(ProductCache(
+                prompt_sha256=key,
+                model=self.model,
+                products_json=json.dumps(value),
+                created_at=datetime.utcfromtimestamp(stored_at),
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def purge(self, older_than: float) -> None:
+        db = SessionLocal()
+        try:
+            db.query(ProductCache).filter(ProductCache.created_at < datetime.utcfromtimestamp(older_than)).delete()
+            db.commit()
+        finally:
+            db.close()
+
+products_cache = ResultCache(
+    "products",
+    PRODUCTS_CACHE_MAX_ENTRIES,
+    PRODUCTS_CACHE_TTL,
+    store=ProductCacheStore(GEMINI_RATING_MODEL) if PRODUCTS_CACHE_PERSIST else None,
+)
+
+def products_from_text(text: str) -> List[str]:
+    try:
+        data = json.loads(text)
+    except Exception:
+        return []
+    if not isinstance(data, list):
+        return []
+    # normalize strings
+    return [str(x).strip() for x in data if isinstance(x, (str, int, float)) and str(x).strip()]
+
+def fallback_products(prompt: str) -> List[str]:
+    # Naive extraction from prompt (split punctuation/newlines)
     parts = [p.strip() for p in re.split(r"\r?\n|,|;|\||\\/", prompt) if p.strip()]
-    products = list(dict.fromkeys(parts))[:12]
+    return list(dict.fromkeys(parts))[:MAX_PRODUCTS]
+
+def _extract_products_uncached(prompt: str) -> List[str]:
+    with metrics.span("products.model"):
+        resp = gemini_generate_content(GEMINI_RATING_MODEL, _products_payload(prompt))
+    products = products_from_text(extract_text_from_gemini(resp))
+    if not products:
+        raise ValueError("model returned no products")
+    return products
+
+def extract_products(prompt: str) -> List[str]:
+    # Only model answers are cached; the fallback is cheap and should not stick.
+    try:
+        return products_cache.get(products_cache_key(prompt), lambda: _extract_products_uncached(prompt))
+    except Exception:
+        # let fallback handle
+        pass
+    return fallback_products(prompt)
+
+class JsonStringArrayParser:
+    """
+    Incremental parser for a streamed JSON array of strings: feed() text chunks as they
+    arrive and get back each top-level string element as soon as its closing quote is seen.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.buf: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        out = []
+        for ch in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        try:
+                            value = json.loads('"' + "".join(self.buf) + '"').strip()
+                        except ValueError:
+                            value = ""
+                        if value:
+                            out.append(value)
+                    continue
+                if self.depth == 1:
+                    self.buf.append(ch)
+            elif ch == '"':
+                self.in_string = True
+                self.buf = []
+            elif ch in "[{":
+                self.depth += 1
+            elif ch in "]}":
+                self.depth -= 1
+        return out
+
+def stream_products(prompt: str):
+    """
+    Yield product names as Gemini streams them, falling back to extract-style parsing of
+    the full text, then to naive prompt splitting, when the stream yields none.
+    """
+    key = products_cache_key(prompt)
+    cached = products_cache.peek(key, count_miss=True)
+    if cached is not None:
+        yield from cached[:MAX_PRODUCTS]
+        return
+
+    parser = JsonStringArrayParser()
+    text, names = [], []
+    try:
+        for chunk in gemini_stream_generate_content(GEMINI_RATING_MODEL, _products_payload(prompt)):
+            piece = extract_text_from_gemini(chunk, strip=False)
+            text.append(piece)
+            for name in parser.feed(piece):
+                names.append(name)
+                yield name
+    except Exception as e:
+        log.warning("product stream failed: %s", e)
+        if names:
+            return
+    if names:
+        products_cache.set(key, names)
+        return
+    products = products_from_text("".join(text))
+    if products:
+        products_cache.set(key, products)
+    yield from (products or fallback_products(prompt))[:MAX_PRODUCTS]
+
+@app.post("/api/generate-products")
+def generate_products():
+    limited = enforce_rate_limit("generate_products")
+    if limited:
+        return limited
+
+    body = request.get_json(silent=True) or {}
+    prompt = body.get("prompt", "")
+    if not prompt or not isinstance(prompt, str):
+        return jsonify({"error": {"code": "bad_request", "message": "Missing prompt"}}), 400
+
+    with metrics.span("generate_products.extract"):
+        products = extract_products(prompt)
     return jsonify({"products": products})
 
 
@@ -728,46 +3731,34 @@ def generate_products():
 # SerpApi proxy endpoints
 # ----------------------------
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
-SERP_CACHE_TTL = int(os.getenv("SERP_CACHE_TTL", "60"))
-_serp_cache = {}
+serp_cache = ResultCache(
+    "serpapi",
+    SERP_CACHE_MAX_ENTRIES,
+    SERP_CACHE_TTL,
+    SERP_CACHE_STALE_SEC,
+    SQLiteCacheStore(SERP_CACHE_SQLITE_PATH, "serpapi.google_shopping") if SERP_CACHE_SQLITE_PATH else None,
+)
 
-def _serp_cache_get(key: str):
-    item = _serp_cache.get(key)
-    if not item:
-        return None
-    expires_at, payload = item
-    if _time.time() > expires_at:
-        _serp_cache.pop(key, None)
-        return None
-    return payload
-
-def _serp_cache_set(key: str, payload):
-    _serp_cache[key] = (_time.time() + SERP_CACHE_TTL, payload)
+def _serp_cache_key(query: str) -> str:
+    return " ".join(query.lower().split())
 
 def _fetch_serp_one(query: str):
-    key = query.lower()
-    cached = _serp_cache_get(key)
-    if cached:
-        return cached
+    with metrics.span("serp.lookup"):
+        return serp_cache.get(_serp_cache_key(query), lambda: _fetch_serp_uncached(query))
 
+def _serp_params(query: str) -> Dict[str, Any]:
     if not SERPAPI_KEY:
         raise RuntimeError("Missing SERPAPI_KEY env var")
-
-    params = {
+    return {
         "engine": "google_shopping",
         "q": query,
         "api_key": SERPAPI_KEY,
     }
 
-    r = requests.get("https://serpapi.com/search.json", params=params, timeout=20)
-    r.raise_for_status()
-    data = r.json()
-
+def _serp_payload(query: str, data: Dict[str, Any]) -> Dict[str, Any]:
     results = data.get("shopping_results") or []
     if not results:
-        payload = {"query": query, "result": None}
-        _serp_cache_set(key, payload)
-        return payload
+        return {"query": query, "result": None}
 
     top = results[0]
     payload = {
@@ -782,65 +3773,258 @@ def _fetch_serp_one(query: str):
             "reviews": top.get("reviews"),
         },
     }
-    _serp_cache_set(key, payload)
     return payload
 
+def _fetch_serp_uncached(query: str):
+    r = http_client.get(SERPAPI_URL, label="serpapi.google_shopping", params=_serp_params(query), timeout=20)
+    r.raise_for_status()
+    return _serp_payload(query, r.json())
 
-@app.get("/api/batch_search")
-def batch_search():
-    raw = (request.args.get("q") or "").strip()
-    if not raw:
-        return jsonify({"error": "Missing q"}), 400
+async def _fetch_serp_uncached_async(query: str):
+    r = await async_http_client.get(SERPAPI_URL, label="serpapi.google_shopping", params=_serp_params(query), timeout=20)
+    r.raise_for_status()
+    return _serp_payload(query, r.json())
 
-    parts = [p.strip() for p in raw.split(",")]
-    parts = [p for p in parts if p]
+async def fetch_serp_async(query: str):
+    with metrics.span("serp.lookup"):
+        return await serp_cache.get_async(_serp_cache_key(query), lambda: _fetch_serp_uncached_async(query))
 
-    # de-dupe preserving order
+
+def parse_batch_queries(raw: str) -> List[str]:
+    # de-dupe (case/whitespace-insensitive) preserving order
     seen = set()
     queries = []
-    for p in parts:
-        k = p.lower()
-        if k not in seen:
+    for p in raw.split(","):
+        p = p.strip()
+        k = _serp_cache_key(p)
+        if k and k not in seen:
             seen.add(k)
             queries.append(p)
+    return queries[:SERP_BATCH_MAX_ITEMS]
+
+def iter_batch_search(queries: List[str], deadline_sec: float):
+    """
+    Yield (index, {"query", "result"}) as each lookup resolves: cache hits first, then
+    upstream lookups in completion order. Queries still running at the deadline are
+    yielded last with "timed_out": true.
+    """
+    pending = {}
+    for i, q in enumerate(queries):
+        cached = serp_cache.peek(_serp_cache_key(q), lambda q=q: _fetch_serp_uncached(q))
+        if cached is not None:
+            yield i, {**cached, "query": q}
+        else:
+            pending[async_runtime.submit(fetch_serp_async(q))] = i
+
+    try:
+        for fut in as_completed(pending, timeout=deadline_sec):
+            i = pending.pop(fut)
+            try:
+                yield i, {**fut.result(), "query": queries[i]}
+            except Exception as e:
+                yield i, {"query": queries[i], "result": None, "error": str(e)}
+    except FuturesTimeoutError:
+        for i in sorted(pending.values()):
+            yield i, {"query": queries[i], "result": None, "timed_out": True}
+
+@app.get("/api/batch_search")
+def batch_search():
+    """
+    Shopping lookups for a comma-separated q. With ?stream=1 the response is NDJSON: one
+    {"index", "query", "result"} line per query as soon as it resolves, then {"done": true}.
+    ?deadline= (seconds) can shorten SERP_BATCH_DEADLINE_SEC.
+    """
+    limited = enforce_rate_limit("batch_search")
+    if limited:
+        return limited
 
-    MAX_ITEMS = 12
-    queries = queries[:MAX_ITEMS]
+    raw = (request.args.get("q") or "").strip()
+    if not raw:
+        return jsonify({"error": "Missing q"}), 400
 
+    queries = parse_batch_queries(raw)
     if not queries:
         return jsonify({"queries": [], "results": []})
 
-    MAX_WORKERS = min(4, len(queries))
-    out_by_query = {}
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-        future_map = {ex.submit(_fetch_serp_one, q): q for q in queries}
-        for fut in as_completed(future_map):
-            q = future_map[fut]
-            try:
-                out_by_query[q] = fut.result()
-            except Exception as e:
-                out_by_query[q] = {"query": q, "result": None, "error": str(e)}
+    deadline = SERP_BATCH_DEADLINE_SEC
+    try:
+        deadline = min(deadline, max(0.0, float(request.args.get("deadline", deadline))))
+    except ValueError:
+        pass
+
+    if request_flag("stream"):
+        def stream():
+            timed_out = 0
+            for i, item in iter_batch_search(queries, deadline):
+                timed_out += int(bool(item.get("timed_out")))
+                yield json.dumps({"index": i, **item}) + "\n"
+            yield json.dumps({"done": True, "queries": queries, "timed_out": timed_out}) + "\n"
+
+        return Response(
+            stream_with_context(stream()),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
-    results = [out_by_query[q] for q in queries]
-    return jsonify({"queries": queries, "results": results})
+    out_by_index = dict(iter_batch_search(queries, deadline))
+    results = [out_by_index[i] for i in range(len(queries))]
+    return jsonify({"queries": queries, "results": results, "partial": any(r.get("timed_out") for r in results)})
 
 
 @app.get("/api/search")
 def search():
+    limited = enforce_rate_limit("search")
+    if limited:
+        return limited
+
     q = (request.args.get("q") or "").strip()
     if not q:
         return jsonify({"error": "Missing q"}), 400
 
-    cached = _serp_cache_get(q.lower())
-    if cached:
-        return jsonify(cached)
-
     try:
         payload = _fetch_serp_one(q)
         return jsonify(payload)
     except Exception as e:
         return jsonify({"query": q, "result": None, "error": str(e)})
 
+# ----------------------------
+# Shopping pipeline (products -> SerpApi)
+# ----------------------------
+shopping_extract_pool = ThreadPoolExecutor(max_workers=SHOPPING_EXTRACT_WORKERS, thread_name_prefix="products-extract")
+
+def iter_shopping_pipeline(prompt: str, deadline_sec: float):
+    """
+    Extract products from prompt and look each one up as soon as its name is parsed.
+    Yields {"type": "product"} and {"type": "result"} events as they happen; lookups still
+    running at the deadline are yielded as timed-out results before the final "done".
+    """
+    events: "queue.Queue" = queue.Queue()
+    deadline = _time.monotonic() + deadline_sec
+
+    def extract():
+        try:
+            # Queued behind other requests past the deadline: nobody is waiting any more.
+            if _time.monotonic() < deadline:
+                for name in stream_products(prompt):
+                    events.put(("product", name))
+        finally:
+            events.put(("extracted", None))
+
+    shopping_extract_pool.submit(extract)
+
+    queries: List[str] = []
+    results: Dict[int, Dict[str, Any]] = {}
+    seen = set()
+    extracting, outstanding = True, 0
+    while extracting or outstanding:
+        try:
+            kind, value = events.get(timeout=max(0.0, deadline - _time.monotonic()))
+        except queue.Empty:
+            break
+        if kind == "extracted":
+            extracting = False
+        elif kind == "product":
+            key = _serp_cache_key(value)
+            if not key or key in seen or len(queries) >= MAX_PRODUCTS:
+                continue
+            seen.add(key)
+            i = len(queries)
+            queries.append(value)
+            yield {"type": "product", "index": i, "name": value}
+            cached = serp_cache.peek(key, lambda q=value: _fetch_serp_uncached(q))
+            if cached is not None:
+                results[i] = {**cached, "query": value}
+                yield {"type": "result", "index": i, **results[i]}
+            else:
+                outstanding += 1
+                async_runtime.submit(fetch_serp_async(value)).add_done_callback(lambda f, i=i: events.put(("result", (i, f))))
+        elif kind == "result":
+            outstanding -= 1
+            i, fut = value
+            try:
+                results[i] = {**fut.result(), "query": queries[i]}
+            except Exception as e:
+                results[i] = {"query": queries[i], "result": None, "error": str(e)}
+            yield {"type": "result", "index": i, **results[i]}
+
+    for i in range(len(queries)):
+        if i not in results:
+            results[i] = {"query": queries[i], "result": None, "timed_out": True}
+            yield {"type": "result", "index": i, **results[i]}
+    yield {
+        "type": "done",
+        "products": queries,
+        "results": [results[i] for i in range(len(queries))],
+        "complete": not extracting and not any(r.get("timed_out") or r.get("error") for r in results.values()),
+    }
+
+def _replay_shopping(saved: Dict[str, Any]):
+    for i, name in enumerate(saved["products"]):
+        yield {"type": "product", "index": i, "name": name}
+        yield {"type": "result", "index": i, **saved["results"][i]}
+    yield {"type": "done", "products": saved["products"], "results": saved["results"], "complete": True, "cached": True}
+
+@app.post("/api/shopping")
+def shopping_pipeline():
+    """
+    Products for an edit plus their shopping results, in one NDJSON stream.
+    Body: {"prompt": str} and/or {"job_id": str}; with only a job_id the job's edit prompt is used.
+    A complete result is stored on the job and replayed for the same job and prompt.
+    """
+    limited = enforce_rate_limit("shopping")
+    if limited:
+        return limited
+
+    body = request.get_json(silent=True) or {}
+    prompt = body.get("prompt") or ""
+    job_id = body.get("job_id")
+    if not isinstance(prompt, str) or (not prompt and not job_id):
+        return jsonify({"error": {"code": "bad_request", "message": "Provide prompt or job_id"}}), 400
+
+    saved = None
+    if job_id:
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).get(job_id)
+            if not job:
+                return jsonify({"error": {"code": "not_found", "message": "Job not found"}}), 404
+            if not prompt:
+                requested = _safe_json_loads(job.requested_edits_json, {})
+                prompt = build_edit_prompt(
+                    requested.get("selected_suggestions", []),
+                    requested.get("selected_categories", []),
+                    requested.get("additional_changes", []),
+                    requested.get("user_prompt_extra", ""),
+                )
+            saved = _safe_json_loads(job.products_json, None)
+        finally:
+            db.close()
+    prompt_sha256 = sha256_bytes(prompt.encode("utf-8"))
+    if saved and saved.get("prompt_sha256") != prompt_sha256:
+        saved = None
+
+    def stream():
+        events = _replay_shopping(saved) if saved else iter_shopping_pipeline(prompt, SHOPPING_PIPELINE_DEADLINE_SEC)
+        for ev in events:
+            yield json.dumps(ev) + "\n"
+            if job_id and not saved and ev["type"] == "done" and ev["complete"]:
+                db = SessionLocal()
+                try:
+                    job = db.query(GenerationJob).get(job_id)
+                    if job:
+                        job.products_json = json.dumps(
+                            {"prompt_sha256": prompt_sha256, "products": ev["products"], "results": ev["results"]}
+                        )
+                        db.commit()
+                finally:
+                    db.close()
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/api/jobs/<job_id>")
 def job_status(job_id: str):
     db = SessionLocal()
@@ -849,45 +4033,666 @@ def job_status(job_id: str):
         if not job:
             return jsonify({"error": {"code": "not_found", "message": "Job not found"}}), 404
 
-        return jsonify({
-            "job_id": job.id,
-            "status": job.status,
-            "generated_images": json.loads(job.result_images_json) if job.result_images_json else [],
-            "error": job.error_message,
-        })
+        return jsonify(job_payload(job))
     finally:
         db.close()
 
-@app.get("/api/sessions/<session_id>")
-def get_session(session_id: str):
+def _load_job_payload(job_id: str) -> Optional[Dict[str, Any]]:
     db = SessionLocal()
     try:
-        sess: Optional[Session] = db.query(Session).get(session_id)
-        if not sess:
-            return jsonify({"error": {"code": "not_found", "message": "Session not found"}}), 404
+        job = db.query(GenerationJob).get(job_id)
+        return job_payload(job) if job else None
+    finally:
+        db.close()
 
-        images = db.query(ImageAsset).filter(ImageAsset.session_id == sess.id).order_by(ImageAsset.created_at.asc()).all()
-        jobs = db.query(GenerationJob).filter(GenerationJob.session_id == sess.id).order_by(GenerationJob.created_at.desc()).all()
+@app.get("/api/jobs/<job_id>/events")
+def job_events(job_id: str):
+    """
+    Server-Sent Events stream of job status. Sends the current state, then every transition
+    published by the scheduler/runner, and closes after done/error. Each event carries the
+    same JSON as GET /api/jobs/<job_id>.
+    """
+    return sse_response(
+        f"job:{job_id}",
+        lambda: _load_job_payload(job_id),
+        lambda event: event["status"] in JOB_TERMINAL_STATES,
+    )
 
-        return jsonify({
+def _load_session_payload(session_id: str) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        sess = db.query(Session).get(session_id)
+        return session_payload(sess) if sess else None
+    finally:
+        db.close()
+
+@app.get("/api/sessions/<session_id>/events")
+def session_events(session_id: str):
+    """
+    Server-Sent Events stream of the background rating pipeline (uploaded -> rating -> rated/error).
+    """
+    return sse_response(
+        f"session:{session_id}",
+        lambda: _load_session_payload(session_id),
+        lambda event: event["status"] not in SESSION_PENDING_STATES,
+    )
+
+session_view_cache = ResultCache("session_view", SESSION_VIEW_CACHE_MAX_ENTRIES, SESSION_VIEW_CACHE_TTL)
+
+def render_session_view(session_id: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        sess: Optional[Session] = (
+            db.query(Session)
+            .options(selectinload(Session.images), selectinload(Session.jobs))
+            .filter(Session.id == session_id)
+            .one_or_none()
+        )
+        if not sess:
+            return None
+
+        return json.dumps({
             "session": {
                 "id": sess.id,
                 "status": sess.status,
                 "created_at": sess.created_at.isoformat() + "Z",
                 "original_image_url": sess.original_image_url,
                 "file_uri": sess.original_file_uri,
+                "error": sess.error_message,
             },
             "rating_result": json.loads(sess.rating_json) if sess.rating_json else None,
-            "images": [{"id": im.id, "kind": im.kind, "url": im.url, "meta": json.loads(im.meta_json) if im.meta_json else None} for im in images],
+            "images": [{"id": im.id, "kind": im.kind, "url": im.url, "meta": json.loads(im.meta_json) if im.meta_json else None} for im in sess.images],
             "jobs": [{
                 "id": j.id,
                 "status": j.status,
                 "generated_images": json.loads(j.result_images_json) if j.result_images_json else [],
                 "error": j.error_message
-            } for j in jobs]
+            } for j in sess.jobs]
         })
     finally:
         db.close()
 
+@app.get("/api/sessions/<session_id>")
+def get_session(session_id: str):
+    """
+    Served from a rendered copy keyed by the session's revision, with an ETag of that
+    revision, so a conditional GET costs one primary-key lookup.
+    """
+    db = SessionLocal()
+    try:
+        revision = db.query(func.coalesce(Session.revision, 0)).filter(Session.id == session_id).scalar()
+    finally:
+        db.close()
+    if revision is None:
+        return jsonify({"error": {"code": "not_found", "message": "Session not found"}}), 404
+
+    etag = f"{session_id}.{revision}"
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        body = session_view_cache.get(f"{session_id}:{revision}", lambda: render_session_view(session_id))
+        if body is None:
+            return jsonify({"error": {"code": "not_found", "message": "Session not found"}}), 404
+        resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
+
+@app.get("/api/analytics/ratings")
+def rating_analytics():
+    """
+    Aggregates over typed ratings: average overall and per-category scores, the overall score
+    distribution, and how often each category is suggested and chosen for generation.
+    ?days=N limits it to ratings from the last N days.
+    """
+    try:
+        days = int(request.args.get("days", "0"))
+    except ValueError:
+        return jsonify({"error": {"code": "bad_request", "message": "days must be an integer"}}), 400
+
+    db = SessionLocal()
+    try:
+        ratings = db.query(Rating)
+        suggestions = db.query(Suggestion)
+        if days > 0:
+            since = datetime.utcnow() - timedelta(days=days)
+            ratings = ratings.filter(Rating.created_at >= since)
+            suggestions = suggestions.join(Rating, Rating.session_id == Suggestion.session_id).filter(Rating.created_at >= since)
+
+        score_columns = [Rating.overall_score] + [getattr(Rating, col) for col in CATEGORY_COLUMNS.values()]
+        row = ratings.with_entities(func.count(), *[func.avg(c) for c in score_columns]).one()
+        averages = dict(zip(["overall_score", *CATEGORY_COLUMNS], row[1:]))
+
+        bucket = func.floor(Rating.overall_score)
+        distribution = (
+            ratings.filter(Rating.overall_score.isnot(None))
+            .with_entities(bucket, func.count())
+            .group_by(bucket)
+            .order_by(bucket)
+            .all()
+        )
+        categories = (
+            suggestions.with_entities(Suggestion.category, func.count(), func.coalesce(func.sum(Suggestion.times_chosen), 0))
+            .group_by(Suggestion.category)
+            .order_by(func.sum(Suggestion.times_chosen).desc(), func.count().desc())
+            .all()
+        )
+        return jsonify({
+            "ratings": row[0],
+            "average_scores": {k: round(v, 2) if v is not None else None for k, v in averages.items()},
+            "overall_distribution": [{"score": int(b), "count": n} for b, n in distribution],
+            "categories": [{"category": c, "suggested": n, "chosen": int(chosen)} for c, n, chosen in categories],
+        })
+    finally:
+        db.close()
+
+# ----------------------------
+# Bulk ingestion
+# ----------------------------
+BULK_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+BULK_ITEM_STATES = ("queued", "normalized", "rated", "error")
+BULK_MAX_REDIRECTS = 3
+
+bulk_pool = ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="bulk")
+bulk_io_pool = ThreadPoolExecutor(max_workers=BULK_CONCURRENCY, thread_name_prefix="bulk-io")
+_bulk_process_pool: Optional[ProcessPoolExecutor] = None
+_bulk_process_pool_lock = threading.Lock()
+
+def bulk_process_pool() -> ProcessPoolExecutor:
+    """
+    Worker processes for imaging.normalize_upload, so decoding a batch of photos doesn't hold
+    the GIL against request threads. Started on first use, with spawn: a forked worker would
+    inherit the scheduler threads, the async loop and open SQLite connections mid-use.
+    """
+    global _bulk_process_pool
+    with _bulk_process_pool_lock:
+        if _bulk_process_pool is None:
+            _bulk_process_pool = ProcessPoolExecutor(
+                max_workers=max(1, BULK_NORMALIZE_PROCESSES), mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _bulk_process_pool
+
+def _staged_path(bulk_id: str, position: int) -> str:
+    return os.path.join(BULK_STAGING_DIR, bulk_id, f"{position:05d}")
+
+def _copy_capped(chunks, dest: str) -> None:
+    """
+    Write chunks to dest, refusing more than MAX_UPLOAD_MB (zip headers and Content-Length
+    can't be trusted for this, so the bytes are counted).
+    """
+    limit = MAX_UPLOAD_MB * 1024 * 1024
+    size = 0
+    try:
+        with open(dest, "wb") as out:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > limit:
+                    raise ValueError(f"image is larger than {MAX_UPLOAD_MB} MB")
+                out.write(chunk)
+        if not size:
+            raise ValueError("empty file")
+    except Exception:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+
+def stage_archive(fileobj, bulk_id: str) -> List[Dict[str, Any]]:
+    """
+    Extract the images in a zip to the job's staging directory. Member names are kept as refs
+    only, never used as paths. Returns one item per image; members that can't be extracted
+    become error items. Raises ValueError when the archive itself is unusable.
+    """
+    try:
+        zf = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ValueError("archive is not a zip file")
+    with zf:
+        members = [
+            m for m in zf.infolist()
+            if not m.is_dir()
+            and m.filename.lower().endswith(BULK_IMAGE_EXTENSIONS)
+            and not m.filename.startswith("__MACOSX/")
+            and not os.path.basename(m.filename).startswith(".")
+        ]
+        if not members:
+            raise ValueError("archive contains no .jpg, .png or .webp images")
+        if len(members) > BULK_MAX_ITEMS:
+            raise ValueError(f"archive contains {len(members)} images; the limit is {BULK_MAX_ITEMS}")
+
+        os.makedirs(os.path.join(BULK_STAGING_DIR, bulk_id), exist_ok=True)
+        items = []
+        for position, member in enumerate(members):
+            item = {"position": position, "ref": member.filename, "status": "queued"}
+            dest = _staged_path(bulk_id, position)
+            try:
+                with zf.open(member) as src:
+                    _copy_capped(iter(lambda: src.read(SPOOL_CHUNK_BYTES), b""), dest)
+                item["staged_path"] = dest
+            except Exception as e:
+                item.update(status="error", error_message=f"could not extract: {e}")
+            items.append(item)
+    return items
+
+def parse_bulk_manifest(body: Any) -> List[Dict[str, Any]]:
+    """
+    Items for a manifest {"images": ["https://...", {"url": "https://...", "ref": "sku-1"}, ...]}.
+    Raises ValueError when it is malformed.
+    """
+    images = body.get("images") if isinstance(body, dict) else None
+    if not isinstance(images, list) or not images:
+        raise ValueError('Expected JSON body {"images": [{"url": ..., "ref": ...}, ...]}')
+    if len(images) > BULK_MAX_ITEMS:
+        raise ValueError(f"manifest lists {len(images)} images; the limit is {BULK_MAX_ITEMS}")
+    items = []
+    for position, entry in enumerate(images):
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        url = entry.get("url") if isinstance(entry, dict) else None
+        if not isinstance(url, str) or urlparse(url).scheme not in ("http", "https"):
+            raise ValueError(f"images[{position}]: url must be an http(s) URL")
+        ref = entry.get("ref")
+        items.append({"position": position, "ref": str(ref) if ref is not None else url, "source_url": url, "status": "queued"})
+    return items
+
+def check_public_url(url: str) -> None:
+    """
+    Refuse URLs that aren't http(s) or whose host resolves to a loopback, private, link-local or
+    otherwise non-global address, so a manifest can't reach internal services.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("only http(s) URLs are supported")
+    if BULK_URL_ALLOW_PRIVATE:
+        return
+    try:
+        infos = socket.getaddrinfo(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except socket.gaierror:
+        raise ValueError(f"could not resolve {parsed.hostname}")
+    for info in infos:
+        if not ipaddress.ip_address(info[4][0].split("%")[0]).is_global:
+            raise ValueError(f"{parsed.hostname} resolves to a non-public address")
+
+def _check_peer(sock: socket.socket, host: str) -> None:
+    if BULK_URL_ALLOW_PRIVATE:
+        return
+    peer = sock.getpeername()[0]
+    if not ipaddress.ip_address(peer.split("%")[0]).is_global:
+        sock.close()
+        raise ValueError(f"{host} connected to non-public address {peer}")
+
+class _PublicHTTPConnection(urllib3.connection.HTTPConnection):
+    def _new_conn(self):
+        sock = super()._new_conn()
+        _check_peer(sock, self.host)
+        return sock
+
+class _PublicHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def _new_conn(self):
+        sock = super()._new_conn()
+        _check_peer(sock, self.host)
+        return sock
+
+class _PublicHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+class _PublicHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+class PublicAddressAdapter(HTTPAdapter):
+    """
+    Checks the address every new connection actually reached, before the TLS handshake or
+    any request bytes. check_public_url resolves the name separately from requests, so on its
+    own a short-TTL DNS answer could pass the check and then point the connection somewhere
+    internal. Proxies are ignored, since the peer would then be the proxy.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _PublicHTTPConnectionPool, "https": _PublicHTTPSConnectionPool}
+
+    def send(self, request, *args, **kwargs):
+        kwargs["proxies"] = {}
+        return super().send(request, *args, **kwargs)
+
+bulk_http_client = HttpClient(HTTP_POOL_SIZE, HTTP_HOST_CONCURRENCY, {}, HTTP_MAX_RETRIES, adapter_cls=PublicAddressAdapter)
+
+def download_image(url: str, dest: str) -> None:
+    # Redirects are followed by hand so every hop goes through check_public_url (and, on
+    # connect, PublicAddressAdapter).
+    for _ in range(BULK_MAX_REDIRECTS + 1):
+        check_public_url(url)
+        resp = bulk_http_client.get(url, label="bulk.download", stream=True, allow_redirects=False, timeout=60)
+        with resp:
+            if resp.is_redirect:
+                url = urljoin(url, resp.headers["Location"])
+                continue
+            resp.raise_for_status()
+            _copy_capped(resp.iter_content(SPOOL_CHUNK_BYTES), dest)
+            return
+    raise ValueError("too many redirects")
+
+def _fail_bulk_item(item: BulkItem, message: str) -> None:
+    item.status = "error"
+    item.error_message = message
+
+def rate_bulk_item(item_id: int, session_id: str) -> None:
+    # Nobody watches bulk sessions live, so the rating isn't streamed.
+    run_rating_pipeline(session_id, stream=False)
+    db = SessionLocal()
+    try:
+        item = db.query(BulkItem).get(item_id)
+        sess = db.query(Session).get(session_id)
+        if sess and sess.rating_json:
+            item.status = "rated"
+        else:
+            _fail_bulk_item(item, (sess.error_message if sess else None) or "rating failed")
+        db.commit()
+    finally:
+        db.close()
+
+def _ingest_bulk_items(db, bulk_id: str, items: List[BulkItem]) -> List[Future]:
+    """
+    Download manifest items and normalize every staged file in the process pool (each file as
+    soon as it is on disk), then add its session and original asset, committing BULK_DB_BATCH
+    items per transaction. Each committed batch is submitted for rating straight away; returns
+    the rating futures.
+    """
+    pool = bulk_process_pool()
+    normalizing: Dict[Future, tuple] = {}
+
+    def normalize(item: BulkItem) -> None:
+        sid = str(uuid.uuid4())
+        key = storage_key(f"{sid}.jpg")
+        tmp = storage.temp_path(key)
+        normalizing[pool.submit(normalize_upload, item.staged_path, tmp)] = (item, sid, key, tmp)
+
+    for item in items:
+        if item.staged_path:
+            normalize(item)
+    downloads = {}
+    for item in items:
+        if not item.staged_path:
+            os.makedirs(os.path.join(BULK_STAGING_DIR, bulk_id), exist_ok=True)
+            downloads[bulk_io_pool.submit(download_image, item.source_url, _staged_path(bulk_id, item.position))] = item
+    for future in as_completed(downloads):
+        item = downloads[future]
+        try:
+            future.result()
+        except Exception as e:
+            _fail_bulk_item(item, f"download failed: {e}")
+            continue
+        item.staged_path = _staged_path(bulk_id, item.position)
+        normalize(item)
+    db.commit()
+
+    ratings: List[Future] = []
+    batch: List[BulkItem] = []
+    added: Dict[str, ImageAsset] = {}  # source hash -> asset added in this run, for duplicates within the job
+
+    def commit_batch() -> None:
+        with metrics.span("bulk.commit"):
+            db.commit()
+        for b in batch:
+            if b.status == "normalized":
+                ratings.append(bulk_io_pool.submit(rate_bulk_item, b.id, b.session_id))
+        batch.clear()
+
+    for future in as_completed(normalizing):
+        item, sid, key, tmp = normalizing[future]
+        batch.append(item)
+        try:
+            source_sha256, sha256 = future.result()
+        except Exception:
+            _fail_bulk_item(item, "Could not parse image")
+        else:
+            existing = added.get(source_sha256) or _find_original_by_source_hash(db, source_sha256)
+            if existing:
+                path, url, meta = existing.path, existing.url, _safe_json_loads(existing.meta_json, {})
+            else:
+                path = storage.put(tmp, key, "image/jpeg")
+                url, meta = f"/uploads/{key}", {"mimeType": "image/jpeg", "sha256": sha256}
+            _, asset = add_original_session(db, sid, path, url, meta, source_sha256, existing)
+            added.setdefault(source_sha256, asset)
+            item.session_id = sid
+            item.status = "normalized"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if len(batch) >= BULK_DB_BATCH:
+            commit_batch()
+    commit_batch()
+    return ratings
+
+def run_bulk_job(bulk_id: str) -> None:
+    """
+    Drive a bulk job to the end: ingest queued items (_ingest_bulk_items) and rate them on
+    bulk_io_pool, at most BULK_CONCURRENCY at a time across jobs. Items record their own
+    progress, so a job interrupted by a restart resumes where it stopped.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(BulkJob).get(bulk_id)
+        if not job or job.status in JOB_TERMINAL_STATES:
+            return
+        job.status = "running"
+        job.started_at = job.started_at or datetime.utcnow()
+        db.commit()
+
+        items = db.query(BulkItem).filter(BulkItem.bulk_job_id == bulk_id).order_by(BulkItem.position).all()
+        ratings = [bulk_io_pool.submit(rate_bulk_item, i.id, i.session_id) for i in items if i.status == "normalized"]
+        ratings += _ingest_bulk_items(db, bulk_id, [i for i in items if i.status == "queued"])
+        for future in ratings:
+            future.result()
+
+        job.status = "done"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        shutil.rmtree(os.path.join(BULK_STAGING_DIR, bulk_id), ignore_errors=True)
+    except Exception as e:
+        log.exception("bulk job %s failed", bulk_id)
+        db.rollback()
+        job = db.query(BulkJob).get(bulk_id)
+        if job:
+            job.status = "error"
+            job.error_message = str(e)
+            job.finished_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+
+def recover_bulk_jobs() -> None:
+    """
+    Re-submit bulk jobs that were queued or running when the process stopped.
+    """
+    db = SessionLocal()
+    try:
+        pending = db.query(BulkJob.id).filter(BulkJob.status.in_(("queued", "running"))).order_by(BulkJob.created_at).all()
+    finally:
+        db.close()
+    for (bulk_id,) in pending:
+        bulk_pool.submit(run_bulk_job, bulk_id)
+
+def bulk_payload(db, job: BulkJob, offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    counts = dict(
+        db.query(BulkItem.status, func.count())
+        .filter(BulkItem.bulk_job_id == job.id)
+        .group_by(BulkItem.status)
+        .all()
+    )
+    items = (
+        db.query(BulkItem)
+        .filter(BulkItem.bulk_job_id == job.id)
+        .order_by(BulkItem.position)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return {
+        "bulk_id": job.id,
+        "status": job.status,
+        "source": job.source,
+        "total": job.total,
+        "counts": {state: counts.get(state, 0) for state in BULK_ITEM_STATES},
+        "error": job.error_message,
+        "created_at": job.created_at.isoformat() + "Z" if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() + "Z" if job.finished_at else None,
+        "items": [
+            {
+                "position": i.position,
+                "ref": i.ref,
+                "status": i.status,
+                "session_id": i.session_id,
+                "error": i.error_message,
+            }
+            for i in items
+        ],
+        "offset": offset,
+        "limit": limit,
+        "results_url": f"/api/bulk/{job.id}/results",
+    }
+
+@app.post("/api/bulk")
+def create_bulk_job():
+    """
+    Start a bulk job from a zip (multipart field `archive`, up to BULK_MAX_ARCHIVE_MB) or a JSON
+    manifest of image URLs. Answers 202 with the bulk id; follow it with GET /api/bulk/<id>.
+    """
+    limited = enforce_rate_limit("bulk")
+    if limited:
+        return limited
+
+    request.max_content_length = BULK_MAX_ARCHIVE_MB * 1024 * 1024
+    bulk_id = str(uuid.uuid4())
+    try:
+        if request.mimetype == "multipart/form-data":
+            if "archive" not in request.files:
+                return jsonify({"error": {"code": "bad_request", "message": "Missing form-data field: archive"}}), 400
+            source = "archive"
+            items = stage_archive(request.files["archive"].stream, bulk_id)
+        else:
+            source = "manifest"
+            items = parse_bulk_manifest(request.get_json(silent=True))
+    except ValueError as e:
+        shutil.rmtree(os.path.join(BULK_STAGING_DIR, bulk_id), ignore_errors=True)
+        return jsonify({"error": {"code": "bad_request", "message": str(e)}}), 400
+
+    # One executemany needs the same keys in every row; staged and failed items set different ones.
+    rows = [
+        {"bulk_job_id": bulk_id, "ref": None, "source_url": None, "staged_path": None, "status": "queued",
+         "error_message": None, **item}
+        for item in items
+    ]
+    db = SessionLocal()
+    try:
+        db.add(BulkJob(id=bulk_id, status="queued", source=source, total=len(items)))
+        db.flush()
+        db.execute(BulkItem.__table__.insert(), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        shutil.rmtree(os.path.join(BULK_STAGING_DIR, bulk_id), ignore_errors=True)
+        raise
+    finally:
+        db.close()
+
+    bulk_pool.submit(run_bulk_job, bulk_id)
+    return jsonify({
+        "bulk_id": bulk_id,
+        "status": "queued",
+        "total": len(items),
+        "status_url": f"/api/bulk/{bulk_id}",
+        "results_url": f"/api/bulk/{bulk_id}/results",
+    }), 202
+
+@app.get("/api/bulk/<bulk_id>")
+def bulk_status(bulk_id: str):
+    """
+    Progress of a bulk job: item counts per state and a page of items (?offset=&limit=, at most 1000).
+    """
+    try:
+        offset = max(0, int(request.args.get("offset", "0")))
+        limit = min(1000, max(0, int(request.args.get("limit", "100"))))
+    except ValueError:
+        return jsonify({"error": {"code": "bad_request", "message": "offset and limit must be integers"}}), 400
+
+    db = SessionLocal()
+    try:
+        job = db.query(BulkJob).get(bulk_id)
+        if not job:
+            return jsonify({"error": {"code": "not_found", "message": "Bulk job not found"}}), 404
+        return jsonify(bulk_payload(db, job, offset, limit))
+    finally:
+        db.close()
+
+BULK_CSV_COLUMNS = ["position", "ref", "status", "session_id", "overall_score", *CATEGORY_COLUMNS.values(), "summary", "error"]
+
+@app.get("/api/bulk/<bulk_id>/results")
+def bulk_results(bulk_id: str):
+    """
+    Export of a bulk job's items and ratings, in item order: ?format=ndjson (default; each line
+    has the full rating_result) or ?format=csv (scores from the ratings table, one column per
+    category). Items still in progress are included without scores.
+    """
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": {"code": "bad_request", "message": "format must be ndjson or csv"}}), 400
+
+    db = SessionLocal()
+    try:
+        if not db.query(exists().where(BulkJob.id == bulk_id)).scalar():
+            return jsonify({"error": {"code": "not_found", "message": "Bulk job not found"}}), 404
+    finally:
+        db.close()
+
+    def rows():
+        db = SessionLocal()
+        try:
+            query = (
+                db.query(BulkItem, Rating, Session.rating_json if fmt == "ndjson" else Session.id)
+                .outerjoin(Rating, Rating.session_id == BulkItem.session_id)
+                .outerjoin(Session, Session.id == BulkItem.session_id)
+                .filter(BulkItem.bulk_job_id == bulk_id)
+                .order_by(BulkItem.position)
+            )
+            yield from query.yield_per(500)
+        finally:
+            db.close()
+
+    def ndjson():
+        for item, _, rating_json in rows():
+            yield json.dumps({
+                "position": item.position,
+                "ref": item.ref,
+                "status": item.status,
+                "session_id": item.session_id,
+                "rating_result": _safe_json_loads(rating_json, None),
+                "error": item.error_message,
+            }) + "\n"
+
+    def csv_lines():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(BULK_CSV_COLUMNS)
+        for item, rating, _ in rows():
+            scores = [getattr(rating, col) if rating else None for col in ["overall_score", *CATEGORY_COLUMNS.values()]]
+            writer.writerow([
+                item.position, item.ref, item.status, item.session_id, *scores,
+                rating.summary if rating else None, item.error_message,
+            ])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    return Response(
+        stream_with_context(ndjson() if fmt == "ndjson" else csv_lines()),
+        mimetype="application/x-ndjson" if fmt == "ndjson" else "text/csv",
+        headers={"Content-Disposition": f'attachment; filename="bulk-{bulk_id}.{fmt}"'},
+    )
+
 if __name__ == "__main__":
+    # The debug reloader imports this module twice; only the serving child should own workers.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true" and RUN_BACKGROUND_WORKERS:
+        start_background_workers()
     app.run(host="0.0.0.0", port=5001, debug=True)
+elif RUN_BACKGROUND_WORKERS and __name__ != "__mp_main__":
+    # __mp_main__ is this module re-imported in a spawned worker process (bulk_process_pool).
+    start_background_workers()
@@ -0,0 +1,276 @@
+"""
+Load benchmark for the HTTP API against local stand-ins for Gemini and SerpApi (fake_upstreams.py).
+
+    cd backend
+    python bench_load.py [--scenario all] [--concurrency 8] [--requests 100] [--distinct 20]
+                         [--gemini-latency 1.5] [--image-latency 6] [--serp-latency 0.8] [--error-rate 0]
+
+Scenarios:
+- upload        POST /api/sessions?sync=1 (upload + rating)
+- generate      POST /api/sessions/<id>/generate, then polls GET /api/jobs/<id> until it finishes
+- products      POST /api/generate-products
+- batch_search  GET /api/batch_search?q=... (--batch-size names per request)
+
+--distinct bounds how many different images/prompts/queries are sent, which sets the cache hit
+rate; with --requests below it every request is a miss. By default the app runs in this process on
+a throwaway database and upload directory, with the fakes on a random port, and the report
+includes the app's RSS and the upstream calls each scenario made; --storage s3 keeps assets in
+the fakes' S3-compatible bucket. To measure a running server
+instead, start fake_upstreams.py, point the server at it (see that file) and pass --target URL
+(and --pid to sample its RSS).
+
+Results are a regression baseline: compare runs with the same arguments on the same machine.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from PIL import Image
+
+from fake_upstreams import FakeUpstreams, PRODUCTS
+
+SCENARIOS = ["upload", "generate", "products", "batch_search"]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    def __init__(self, pid: Optional[int], interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            value = rss_mb(self.pid)
+            if value is not None:
+                self.peak = max(self.peak or 0.0, value)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        if self.pid:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def room_images(count: int, edge: int = 1600) -> List[bytes]:
+    """Distinct JPEGs (different bytes, so no upload dedup or rating cache hits between them)."""
+    out = []
+    rng = random.Random(7)
+    for _ in range(count):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        img = Image.linear_gradient("L").resize((edge, edge * 3 // 4)).convert("RGB")
+        img.paste(Image.new("RGB", (edge // 4, edge // 4), color), (rng.randrange(edge // 2), rng.randrange(edge // 4)))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=88)
+        out.append(buf.getvalue())
+    return out
+
+
+def run_scenario(name: str, op: Callable[[requests.Session, int], None], args, pid: Optional[int]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    lock = threading.Lock()
+    local = threading.local()
+    counter = iter(range(args.requests))
+
+    def worker() -> None:
+        local.http = getattr(local, "http", None) or requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            try:
+                op(local.http, i)
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+            except requests.HTTPError as e:
+                with lock:
+                    errors[str(e.response.status_code)] += 1
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] += 1
+
+    started = time.perf_counter()
+    with RssSampler(pid) as rss, ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        for _ in range(args.concurrency):
+            ex.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    values = sorted(latencies)
+
+    def pct(p: float) -> Optional[int]:
+        return int(values[min(len(values) - 1, int(p * len(values)))]) if values else None
+
+    return {
+        "scenario": name,
+        "ok": len(values),
+        "errors": dict(errors),
+        "seconds": round(elapsed, 2),
+        "throughput": round(len(values) / elapsed, 2) if elapsed else 0,
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "max": int(values[-1]) if values else None,
+        "rss_peak_mb": round(rss.peak, 1) if rss.peak else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="per scenario")
+    parser.add_argument("--distinct", type=int, default=20, help="distinct images/prompts/queries")
+    parser.add_argument("--batch-size", type=int, default=6, help="queries per batch_search request")
+    parser.add_argument("--variations", type=int, default=1, help="num_variations per generate request")
+    parser.add_argument("--target", help="base URL of a running server; defaults to an in-process app")
+    parser.add_argument("--pid", type=int, help="pid of --target, for RSS sampling")
+    parser.add_argument("--gemini-latency", type=float, default=1.5)
+    parser.add_argument("--image-latency", type=float, default=6.0)
+    parser.add_argument("--serp-latency", type=float, default=0.8)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--storage", choices=["local", "s3"], default="local", help="asset storage of the in-process app")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per scenario")
+    args = parser.parse_args()
+
+    fake = None
+    tmp_dir = None
+    server = None
+    pid = args.pid
+    base = args.target.rstrip("/") if args.target else None
+    if not base:
+        fake = FakeUpstreams(
+            gemini_latency=args.gemini_latency, image_latency=args.image_latency, serp_latency=args.serp_latency,
+            error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        ).start()
+        tmp_dir = tempfile.mkdtemp(prefix="saun-load-")
+        os.environ.update(fake.env())
+        if args.storage == "s3":
+            os.environ.update(fake.s3_env())
+        os.environ.update({
+            "DATABASE_URL": f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+            "UPLOAD_DIR": os.path.join(tmp_dir, "uploads"),
+            "RATE_LIMIT_PER_MINUTE": "1000000",
+            "SERP_CACHE_SQLITE_PATH": "",
+            "GENERATION_QUEUE_MAX": str(max(50, args.requests)),
+            "HTTP_BACKOFF_BASE_SEC": os.environ.get("HTTP_BACKOFF_BASE_SEC", "0.1"),
+        })
+
+        import logging
+
+        from werkzeug.serving import make_server
+
+        import app  # noqa: E402  (configured by the environment above)
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server("127.0.0.1", 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        pid = os.getpid()
+
+    images = room_images(args.distinct + args.concurrency)  # the extra ones seed generate's sessions
+    prompts = [f"Make the room brighter with {PRODUCTS[i % len(PRODUCTS)].lower()} (variant {i})" for i in range(args.distinct)]
+    queries = [PRODUCTS[i % len(PRODUCTS)] + (f" {i // len(PRODUCTS)}" if i >= len(PRODUCTS) else "") for i in range(args.distinct)]
+
+    def post_image(http: requests.Session, i: int) -> Dict[str, Any]:
+        files = {"image": (f"room{i}.jpg", images[i], "image/jpeg")}
+        r = http.post(f"{base}/api/sessions", params={"sync": "1"}, files=files, timeout=300)
+        r.raise_for_status()
+        return r.json()
+
+    def upload(http: requests.Session, i: int) -> None:
+        post_image(http, i % args.distinct)
+
+    sessions: List[str] = []
+
+    def generate(http: requests.Session, i: int) -> None:
+        sid = sessions[i % len(sessions)]
+        r = http.post(f"{base}/api/sessions/{sid}/generate", json={"num_variations": args.variations}, timeout=60)
+        r.raise_for_status()
+        job_id = r.json()["job_id"]
+        while True:
+            time.sleep(0.2)
+            job = http.get(f"{base}/api/jobs/{job_id}", timeout=30)
+            job.raise_for_status()
+            status = job.json().get("status")
+            if status == "done":
+                return
+            if status == "error":
+                raise RuntimeError(job.json().get("error_message") or "job failed")
+
+    def products(http: requests.Session, i: int) -> None:
+        r = http.post(f"{base}/api/generate-products", json={"prompt": prompts[i % len(prompts)]}, timeout=120)
+        r.raise_for_status()
+
+    def batch_search(http: requests.Session, i: int) -> None:
+        q = ",".join(queries[(i * args.batch_size + k) % len(queries)] for k in range(args.batch_size))
+        r = http.get(f"{base}/api/batch_search", params={"q": q}, timeout=120)
+        r.raise_for_status()
+
+    ops = {"upload": upload, "generate": generate, "products": products, "batch_search": batch_search}
+    names = SCENARIOS if args.scenario == "all" else [args.scenario]
+    try:
+        if "generate" in names:
+            # One session per worker, so jobs run in parallel instead of queueing behind each other.
+            with requests.Session() as http:
+                sessions = [post_image(http, args.distinct + n)["session_id"] for n in range(args.concurrency)]
+
+        if not args.json:
+            print(f"{base}: concurrency {args.concurrency}, {args.requests} requests per scenario, {args.distinct} distinct inputs")
+        for name in names:
+            before = fake.stats() if fake else {}
+            result = run_scenario(name, ops[name], args, pid)
+            if fake:
+                after = fake.stats()
+                result["upstream_calls"] = {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0)}
+            if args.json:
+                print(json.dumps(result))
+                continue
+            print(
+                f"  {name:12} {result['throughput']:7.2f}/s  p50 {result['p50']}ms  p95 {result['p95']}ms"
+                f"  p99 {result['p99']}ms  max {result['max']}ms  ok {result['ok']}  errors {result['errors'] or 0}"
+                f"  rss {result['rss_peak_mb']}MB"
+            )
+            if result.get("upstream_calls"):
+                print(f"  {'':12} upstream {result['upstream_calls']}")
+    finally:
+        if server:
+            server.shutdown()
+        if fake:
+            fake.stop()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+Local stand-ins for the Gemini REST API and SerpApi, for load tests and offline development.
+
+    cd backend
+    python fake_upstreams.py [--port 8090] [--gemini-latency 1.5] [--image-latency 6] [--serp-latency 0.8]
+                             [--error-rate 0.02] [--throttle-rate 0.01]
+
+then start the app against it:
+
+    GEMINI_API_KEY=fake SERPAPI_KEY=fake \\
+    GEMINI_BASE_URL=http://127.0.0.1:8090/v1beta \\
+    GEMINI_UPLOAD_BASE_URL=http://127.0.0.1:8090/upload/v1beta \\
+    SERPAPI_URL=http://127.0.0.1:8090/search.json python app.py
+
+Served:
+- POST /v1beta/models/<model>:generateContent: a rating matching RATING_SCHEMA when the request
+  carries it, an inlineData image for image models, otherwise a JSON array of product names
+- POST /v1beta/models/<model>:streamGenerateContent?alt=sse: the same text answers split over SSE chunks
+- POST /upload/v1beta/files: the resumable upload protocol (start / upload / finalize / query)
+- GET /search.json: SerpApi google_shopping results
+- PUT/GET/HEAD/DELETE /s3/<bucket>/<key>: an in-memory S3-compatible bucket (path-style; requests
+  must carry SigV4 headers or presigned query parameters, which are not verified). s3_env() points
+  the app's STORAGE_BACKEND at it
+- GET /_stats: request counts per route
+
+Latencies are medians with +/- jitter; error-rate answers 503 and throttle-rate answers 429 with
+Retry-After, both of which the app's HTTP clients retry.
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+CATEGORIES = ["organization", "lighting", "spacing", "color_harmony", "cleanliness", "feng shui"]
+PRODUCTS = [
+    "Modern Beige Linen Sofa", "Minimalist Chrome Floor Lamp", "Walnut Mid-Century Coffee Table",
+    "Woven Jute Area Rug", "Brass Arc Pendant Light", "White Oak Bookshelf", "Linen Blackout Curtains",
+    "Ceramic Table Lamp", "Velvet Accent Chair", "Round Wall Mirror", "Rattan Storage Basket",
+    "Fiddle Leaf Fig Plant",
+]
+
+
+def _png(edge: int) -> bytes:
+    ramp = Image.linear_gradient("L").resize((edge, edge))
+    img = Image.merge("RGB", (ramp, ramp.rotate(90), Image.new("L", (edge, edge), 128)))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _rating(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "overall_score": round(rng.uniform(3, 9), 1),
+        "breakdown": {c: round(rng.uniform(2, 10), 1) for c in CATEGORIES},
+        "summary": "A bright room with good bones and some clutter near the entrance.",
+        "suggestions": [
+            {
+                "id": f"s{i + 1}",
+                "category": c,
+                "title": f"Improve {c.replace('_', ' ')}",
+                "why": f"The {c.replace('_', ' ')} could be better balanced.",
+                "steps": ["Rearrange the main pieces.", "Add one accent item."],
+                "impact": rng.choice(["low", "medium", "high"]),
+                "effort": rng.choice(["low", "medium", "high"]),
+            }
+            for i, c in enumerate(CATEGORIES)
+        ],
+        "risks_or_tradeoffs": [],
+    }
+
+
+def _candidate(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP"}]}
+
+
+class FakeUpstreams:
+    """
+    ThreadingHTTPServer serving the fake endpoints. start() runs it on a daemon thread.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, gemini_latency: float = 1.5,
+                 image_latency: float = 6.0, serp_latency: float = 0.8, jitter: float = 0.25,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, image_edge: int = 1024, seed: Optional[int] = None):
+        self.gemini_latency = gemini_latency
+        self.image_latency = image_latency
+        self.serp_latency = serp_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.image_b64 = base64.b64encode(_png(image_edge)).decode("ascii")
+        self.rng = random.Random(seed)
+        self.counts: Counter = Counter()
+        self._uploads: Dict[str, Dict[str, Any]] = {}
+        self._objects: Dict[str, tuple] = {}  # "<bucket>/<key>" -> (bytes, content type)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> Dict[str, str]:
+        """Environment that points app.py at this server."""
+        return {
+            "GEMINI_API_KEY": "fake",
+            "SERPAPI_KEY": "fake",
+            "GEMINI_BASE_URL": f"{self.base_url}/v1beta",
+            "GEMINI_UPLOAD_BASE_URL": f"{self.base_url}/upload/v1beta",
+            "SERPAPI_URL": f"{self.base_url}/search.json",
+        }
+
+    def s3_env(self, bucket: str = "saun-assets") -> Dict[str, str]:
+        """Environment that stores the app's assets in this server's bucket."""
+        return {
+            "STORAGE_BACKEND": "s3",
+            "S3_ENDPOINT_URL": f"{self.base_url}/s3",
+            "S3_BUCKET": bucket,
+            "S3_ACCESS_KEY_ID": "fake",
+            "S3_SECRET_ACCESS_KEY": "fake",
+        }
+
+    def start(self) -> "FakeUpstreams":
+        threading.Thread(target=self.server.serve_forever, name="fake-upstreams", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+    def _count(self, route: str) -> None:
+        with self._lock:
+            self.counts[route] += 1
+
+    def _delay(self, median: float) -> float:
+        with self._lock:
+            return max(0.0, median * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def _fault(self) -> Optional[int]:
+        with self._lock:
+            roll = self.rng.random()
+        if roll < self.error_rate:
+            return 503
+        if roll < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass
+
+            def _body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _send(self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_fault(self, status: int) -> None:
+                headers = {"Retry-After": "1"} if status == 429 else None
+                self._send(status, {"error": {"code": status, "message": "injected by fake_upstreams"}}, headers)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/_stats":
+                    return self._send(200, fake.stats())
+                if url.path.endswith("/search.json"):
+                    return self._serp(parse_qs(url.query).get("q", [""])[0])
+                if url.path.startswith("/s3/"):
+                    return self._s3("GET", url)
+                self._send(404, {"error": {"message": "not found"}})
+
+            def do_PUT(self):
+                self._s3("PUT", urlparse(self.path))
+
+            def do_HEAD(self):
+                self._s3("HEAD", urlparse(self.path))
+
+            def do_DELETE(self):
+                self._s3("DELETE", urlparse(self.path))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = self._body()
+                if url.path.endswith(":generateContent"):
+                    return self._generate(url.path.rsplit("/", 1)[-1].split(":")[0], body)
+                if url.path.endswith(":streamGenerateContent"):
+                    return self._stream(url.path.rsplit("/", 1)[-1].split(":")[0], body)
+                if url.path.endswith("/files"):
+                    return self._upload(parse_qs(url.query), body)
+                self._send(404, {"error": {"message": "not found"}})
+
+            @staticmethod
+            def _answer(model: str, body: bytes) -> tuple:
+                """(route, median latency, response parts) for a generateContent request."""
+                payload = json.loads(body or b"{}")
+                config = payload.get("generationConfig") or {}
+                schema = config.get("responseJsonSchema") or config.get("responseSchema") or {}
+                if "image" in model:
+                    parts = [{"text": "Here is the edited room."}, {"inlineData": {"mimeType": "image/png", "data": fake.image_b64}}]
+                    return "gemini.image", fake.image_latency, parts
+                if "overall_score" in (schema.get("properties") or {}):
+                    with fake._lock:
+                        rating = _rating(fake.rng)
+                    return "gemini.rating", fake.gemini_latency, [{"text": json.dumps(rating)}]
+                return "gemini.products", fake.gemini_latency, [{"text": json.dumps(PRODUCTS)}]
+
+            def _generate(self, model: str, body: bytes) -> None:
+                route, latency, parts = self._answer(model, body)
+                fake._count(route)
+                time.sleep(fake._delay(latency))
+                fault = fake._fault()
+                if fault:
+                    return self._send_fault(fault)
+                self._send(200, _candidate(parts))
+
+            def _stream(self, model: str, body: bytes) -> None:
+                # Text answers only; the latency is spread evenly over the chunks.
+                route, latency, parts = self._answer(model, body)
+                fake._count(f"{route}_stream")
+                fault = fake._fault()
+                if fault:
+                    time.sleep(fake._delay(latency) / 4)
+                    return self._send_fault(fault)
+                text = "".join(p.get("text", "") for p in parts)
+                chunks = [text[i:i + 40] for i in range(0, len(text), 40)]
+                step = fake._delay(latency) / len(chunks)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for chunk in chunks:
+                    time.sleep(step)
+                    self.wfile.write(f"data: {json.dumps(_candidate([{'text': chunk}]))}\r\n\r\n".encode("utf-8"))
+                    self.wfile.flush()
+
+            def _upload(self, query: Dict[str, List[str]], body: bytes) -> None:
+                command = (self.headers.get("X-Goog-Upload-Command") or "").lower()
+                if command == "start":
+                    fake._count("files.start")
+                    fault = fake._fault()
+                    if fault:
+                        return self._send_fault(fault)
+                    upload_id = uuid.uuid4().hex
+                    meta = json.loads(body or b"{}").get("file") or {}
+                    with fake._lock:
+                        fake._uploads[upload_id] = {
+                            "received": 0,
+                            "size": int(self.headers.get("X-Goog-Upload-Header-Content-Length") or 0),
+                            "mimeType": self.headers.get("X-Goog-Upload-Header-Content-Type") or "application/octet-stream",
+                            "displayName": meta.get("displayName"),
+                            "final": False,
+                        }
+                    return self._send(200, {}, {
+                        "X-Goog-Upload-URL": f"{fake.base_url}/upload/v1beta/files?upload_id={upload_id}&upload_protocol=resumable",
+                        "X-Goog-Upload-Status": "active",
+                        "X-Goog-Upload-Chunk-Granularity": str(256 * 1024),
+                    })
+
+                upload_id = query.get("upload_id", [""])[0]
+                with fake._lock:
+                    state = fake._uploads.get(upload_id)
+                if not state:
+                    return self._send(404, {"error": {"message": "unknown upload"}})
+                if command == "query":
+                    fake._count("files.query")
+                    return self._send(200, self._file(upload_id, state) if state["final"] else {}, {
+                        "X-Goog-Upload-Status": "final" if state["final"] else "active",
+                        "X-Goog-Upload-Size-Received": str(state["received"]),
+                    })
+
+                fake._count("files.chunk")
+                if int(self.headers.get("X-Goog-Upload-Offset") or -1) != state["received"]:
+                    return self._send(400, {"error": {"message": "offset mismatch"}})
+                with fake._lock:
+                    state["received"] += len(body)
+                    state["final"] = "finalize" in command
+                if not state["final"]:
+                    return self._send(200, {}, {"X-Goog-Upload-Status": "active"})
+                self._send(200, self._file(upload_id, state), {"X-Goog-Upload-Status": "final"})
+
+            @staticmethod
+            def _file(upload_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+                expires = (datetime.utcnow() + timedelta(hours=48)).strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+                return {"file": {
+                    "name": f"files/{upload_id}",
+                    "displayName": state["displayName"],
+                    "mimeType": state["mimeType"],
+                    "sizeBytes": str(state["received"]),
+                    "uri": f"{fake.base_url}/v1beta/files/{upload_id}",
+                    "state": "ACTIVE",
+                    "expirationTime": expires,
+                }}
+
+            def _s3(self, method: str, url) -> None:
+                body = self._body() if method == "PUT" else b""
+                fake._count(f"s3.{method.lower()}")
+                if not url.path.startswith("/s3/"):
+                    return self._send(404)
+                signed = (self.headers.get("Authorization") or "").startswith("AWS4-HMAC-SHA256 ") or "X-Amz-Signature=" in url.query
+                if not signed:
+                    return self._send(403)
+                fault = fake._fault() if method != "GET" else None
+                if fault:
+                    return self._send_fault(fault)
+                name = url.path[len("/s3/"):]
+                with fake._lock:
+                    if method == "PUT":
+                        fake._objects[name] = (body, self.headers.get("Content-Type") or "application/octet-stream")
+                        obj = None
+                    elif method == "DELETE":
+                        obj = fake._objects.pop(name, None)
+                    else:
+                        obj = fake._objects.get(name)
+                if method in ("PUT", "DELETE"):
+                    return self._send(204 if method == "DELETE" else 200)
+                if obj is None:
+                    return self._send(404)
+                data, content_type = obj
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if method == "GET":
+                    self.wfile.write(data)
+
+            def _serp(self, query: str) -> None:
+                fake._count("serpapi")
+                time.sleep(fake._delay(fake.serp_latency))
+                fault = fake._fault()
+                if fault:
+                    return self._send_fault(fault)
+                self._send(200, {"shopping_results": [
+                    {
+                        "title": f"{query} #{i + 1}",
+                        "product_link": f"https://shop.example/{uuid.uuid5(uuid.NAMESPACE_URL, query).hex}/{i}",
+                        "thumbnail": "https://shop.example/thumb.jpg",
+                        "price": f"${19 + 10 * i}.99",
+                        "source": "Example Store",
+                        "rating": 4.5,
+                        "reviews": 120 + i,
+                    }
+                    for i in range(3)
+                ]})
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--gemini-latency", type=float, default=1.5, help="rating/products calls, seconds")
+    parser.add_argument("--image-latency", type=float, default=6.0, help="image model calls, seconds")
+    parser.add_argument("--serp-latency", type=float, default=0.8, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.25, help="latency spread as a fraction of the median")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--image-edge", type=int, default=1024, help="edge of the returned image, px")
+    args = parser.parse_args()
+
+    fake = FakeUpstreams(
+        args.host, args.port, args.gemini_latency, args.image_latency, args.serp_latency, args.jitter,
+        args.error_rate, args.throttle_rate, args.image_edge,
+    )
+    print(f"fake upstreams on {fake.base_url}")
+    for k, v in fake.env().items():
+        print(f"  {k}={v}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
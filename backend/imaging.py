@@ -0,0 +1,38 @@
+"""
+Image work that runs in worker processes (bulk ingestion's normalize pool).
+
+Kept apart from app.py so a spawned worker imports Pillow and nothing else: no database
+engine, Flask app or background threads.
+"""
+import hashlib
+
+from PIL import Image
+
+CHUNK_BYTES = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def normalize_to_jpeg(src_path: str, dest_path: str) -> None:
+    """
+    Decode from disk and re-encode straight to disk, without intermediate byte buffers.
+    """
+    with Image.open(src_path) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(dest_path, format="JPEG", quality=92)
+
+
+def normalize_upload(src_path: str, dest_path: str) -> tuple:
+    """
+    normalize_to_jpeg plus both hashes. Returns (source sha256, normalized sha256).
+    """
+    source_sha256 = file_sha256(src_path)
+    normalize_to_jpeg(src_path, dest_path)
+    return source_sha256, file_sha256(dest_path)
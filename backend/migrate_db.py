@@ -0,0 +1,35 @@
+"""
+Apply pending schema migrations (see MIGRATIONS in app.py) to DATABASE_URL.
+
+    cd backend
+    python migrate_db.py [--status]
+
+The app applies them itself on startup unless AUTO_MIGRATE=0; run this first when
+several processes share the database, so they never start mid-migration.
+"""
+import argparse
+import os
+
+os.environ.setdefault("RUN_BACKGROUND_WORKERS", "0")
+os.environ.setdefault("AUTO_MIGRATE", "0")
+
+import app  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="list pending migrations and exit")
+    args = parser.parse_args()
+
+    pending = app.pending_migrations()
+    print(f"{app.engine.url.render_as_string(hide_password=True)}: {len(pending)} pending migration(s)")
+    for version, name in pending:
+        print(f"  {version}: {name}")
+    if args.status or not pending:
+        return
+
+    app.migrate(log_fn=print)
+
+
+if __name__ == "__main__":
+    main()
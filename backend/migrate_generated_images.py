@@ -0,0 +1,112 @@
+"""
+Re-encode stored generated images into GENERATED_IMAGE_FORMAT (see app.py).
+
+    cd backend
+    python migrate_generated_images.py [--workers N] [--batch-size N] [--dry-run] [--keep-source]
+
+Images are transcoded in a process pool and written through the app's storage backend
+(see STORAGE_BACKEND). image_assets rows and the URLs in generation_jobs.result_images_json
+are then updated in batched transactions. Source files are removed after their rows are
+committed, unless --keep-source is given.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+os.environ.setdefault("RUN_BACKGROUND_WORKERS", "0")
+
+import app  # noqa: E402
+
+
+def _reencode(asset_id: str, src_path: str) -> Tuple[str, str, str, str, int, int]:
+    _, mime, ext = app.generated_format()
+    dest = os.path.splitext(src_path)[0] + ext
+    src_path = app.storage.fetch(src_path)
+    with app.storage.writing(app.storage.key_of(dest), mime) as tmp:
+        app.encode_generated_image(src_path, tmp)
+    return asset_id, dest, mime, app.sha256_file(dest), os.path.getsize(src_path), os.path.getsize(dest)
+
+
+def _update_rows(db, results: List[Tuple[str, str, str, str, int, int]]) -> None:
+    by_id = {r[0]: r for r in results}
+    url_map: Dict[str, str] = {}
+    session_ids = set()
+    for asset in db.query(app.ImageAsset).filter(app.ImageAsset.id.in_(list(by_id))):
+        _, dest, mime, digest, _, _ = by_id[asset.id]
+        meta = app._safe_json_loads(asset.meta_json, {})
+        meta.setdefault("sourceMimeType", meta.get("mimeType", app._mime_from_path(asset.path)))
+        meta.update({"mimeType": mime, "sha256": digest})
+        new_url = f"/uploads/{app.storage.key_of(dest)}"
+        url_map[asset.url] = new_url
+        session_ids.add(asset.session_id)
+        asset.path, asset.url, asset.meta_json = dest, new_url, json.dumps(meta)
+
+    # A generated image only appears in its own session's jobs.
+    jobs = db.query(app.GenerationJob).filter(
+        app.GenerationJob.session_id.in_(list(session_ids)), app.GenerationJob.result_images_json.isnot(None)
+    )
+    for job in jobs:
+        urls = app._safe_json_loads(job.result_images_json, [])
+        if any(u in url_map for u in urls):
+            job.result_images_json = json.dumps([url_map.get(u, u) for u in urls])
+    db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="list what would be converted and exit")
+    parser.add_argument("--keep-source", action="store_true", help="leave the original files on disk")
+    args = parser.parse_args()
+
+    target_ext = app.generated_format()[2]
+    db = app.SessionLocal()
+    try:
+        todo = [
+            (a.id, a.path)
+            for a in db.query(app.ImageAsset).filter(app.ImageAsset.kind == "generated")
+            if not a.path.lower().endswith(target_ext) and app.storage.exists(a.path)
+        ]
+        print(f"{len(todo)} generated image(s) to convert to {target_ext}")
+        if args.dry_run or not todo:
+            return
+
+        failed, bytes_before, bytes_after = 0, 0, 0
+        sources = dict(todo)
+        migrated: List[str] = []
+        with ProcessPoolExecutor(max_workers=args.workers) as ex:
+            futures = [ex.submit(_reencode, asset_id, path) for asset_id, path in todo]
+            batch: List[Tuple[str, str, str, str, int, int]] = []
+            for fut in as_completed(futures):
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"  failed: {e}")
+                    continue
+                batch.append(result)
+                bytes_before += result[4]
+                bytes_after += result[5]
+                if len(batch) >= args.batch_size:
+                    _update_rows(db, batch)
+                    migrated.extend(sources[r[0]] for r in batch)
+                    batch = []
+            if batch:
+                _update_rows(db, batch)
+                migrated.extend(sources[r[0]] for r in batch)
+        converted = len(migrated)
+
+        if not args.keep_source:
+            for path in migrated:
+                app.storage.delete(path)
+
+        print(f"converted {converted}, failed {failed}: {bytes_before / 1e6:.1f} MB -> {bytes_after / 1e6:.1f} MB")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Copy stored originals and generated images into the configured storage backend.
+
+    cd backend
+    STORAGE_BACKEND=s3 S3_BUCKET=... python migrate_storage.py [--workers 8] [--dry-run]
+
+Run it once when switching STORAGE_BACKEND to s3: every image_assets file that is on local disk
+but not yet in the bucket is uploaded under its current key, so existing /uploads URLs keep
+working. Rows are not changed and local files are kept (they are the node's cache).
+"""
+import argparse
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+os.environ.setdefault("RUN_BACKGROUND_WORKERS", "0")
+
+import app  # noqa: E402
+
+
+def _copy(path: str) -> int:
+    key = app.storage.key_of(path)
+    tmp = app.storage.temp_path(key)
+    shutil.copyfile(path, tmp)
+    app.storage.put(tmp, key, app.mimetypes.guess_type(path)[0] or "application/octet-stream")
+    return os.path.getsize(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--dry-run", action="store_true", help="count what would be copied and exit")
+    args = parser.parse_args()
+
+    if not isinstance(app.storage, app.S3Storage):
+        print(f"STORAGE_BACKEND={app.STORAGE_BACKEND}: files are already where the app reads them")
+        return
+
+    db = app.SessionLocal()
+    try:
+        paths = sorted({p for (p,) in db.query(app.ImageAsset.path) if os.path.isfile(p)})
+    finally:
+        db.close()
+
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        present = list(ex.map(lambda p: app.storage.in_bucket(app.storage.key_of(p)), paths))
+    missing = [p for p, there in zip(paths, present) if not there]
+    print(f"{len(paths)} local file(s), {len(missing)} not in bucket {app.storage.bucket}")
+    if args.dry_run or not missing:
+        return
+
+    copied, failed, total = 0, 0, 0
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        futures = {ex.submit(_copy, p): p for p in missing}
+        for fut in as_completed(futures):
+            try:
+                total += fut.result()
+                copied += 1
+            except Exception as e:
+                failed += 1
+                print(f"  failed: {futures[fut]}: {e}")
+    print(f"copied {copied}, failed {failed} ({total / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+The app is configured from the environment at import time, so it is imported once per test
+run: against a throwaway database and upload directory, with Gemini and SerpApi pointed at
+fake_upstreams.py.
+"""
+import io
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_upstreams import FakeUpstreams  # noqa: E402
+
+TMP_DIR = tempfile.mkdtemp(prefix="saun-test-")
+FAKE = FakeUpstreams(gemini_latency=0.01, image_latency=0.01, serp_latency=0.01, jitter=0, image_edge=64, seed=1).start()
+os.environ.update(FAKE.env())
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(TMP_DIR, 'test.db')}",
+    "UPLOAD_DIR": os.path.join(TMP_DIR, "uploads"),
+    "RUN_BACKGROUND_WORKERS": "0",
+    "RATE_LIMIT_PER_MINUTE": "1000000",
+    "SERP_CACHE_SQLITE_PATH": "",
+    "HTTP_BACKOFF_BASE_SEC": "0.01",
+    "BULK_NORMALIZE_PROCESSES": "1",
+})
+
+import app as saun  # noqa: E402
+
+
+@pytest.fixture
+def app_module():
+    return saun
+
+
+@pytest.fixture
+def client():
+    return saun.app.test_client()
+
+
+@pytest.fixture
+def fake():
+    return FAKE
+
+
+@pytest.fixture
+def db():
+    session = saun.SessionLocal()
+    yield session
+    session.close()
+
+
+def jpeg_bytes(seed: int = 0, edge: int = 64) -> bytes:
+    """A small JPEG whose bytes differ per seed (so uploads don't dedupe)."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", (edge, edge), tuple(rng.randrange(256) for _ in range(3)))
+    img.putpixel((0, 0), (rng.randrange(256), 0, 0))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
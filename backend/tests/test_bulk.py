@@ -0,0 +1,121 @@
+import io
+import os
+import zipfile
+
+from conftest import jpeg_bytes
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for name, data in members:
+            z.writestr(name, data)
+    return buf.getvalue()
+
+
+def _post_archive(client, data):
+    return client.post(
+        "/api/bulk", data={"archive": (io.BytesIO(data), "rooms.zip")}, content_type="multipart/form-data",
+    )
+
+
+def test_stage_archive_skips_non_images_and_keeps_member_names_as_refs(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "BULK_STAGING_DIR", str(tmp_path))
+    data = _zip([
+        ("rooms/a.jpg", jpeg_bytes(1)),
+        ("../../escape.jpg", jpeg_bytes(2)),
+        ("notes.txt", b"hello"),
+        ("__MACOSX/rooms/._a.jpg", b"x"),
+    ])
+    items = app_module.stage_archive(io.BytesIO(data), "job")
+    assert [i["ref"] for i in items] == ["rooms/a.jpg", "../../escape.jpg"]
+    assert all(os.path.dirname(i["staged_path"]) == str(tmp_path / "job") for i in items)
+
+
+def test_mixed_archive_creates_error_items_for_bad_members(app_module, client, db, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(app_module.bulk_pool, "submit", lambda *args: submitted.append(args))
+    data = _zip([
+        ("good.jpg", jpeg_bytes(3)),
+        ("empty.jpg", b""),
+        ("huge.png", b"\0" * (app_module.MAX_UPLOAD_MB * 1024 * 1024 + 1)),
+    ])
+    resp = _post_archive(client, data)
+    assert resp.status_code == 202, resp.get_json()
+    bulk_id = resp.get_json()["bulk_id"]
+    assert submitted == [(app_module.run_bulk_job, bulk_id)]
+
+    items = {i.ref: i for i in db.query(app_module.BulkItem).filter_by(bulk_job_id=bulk_id)}
+    assert items["good.jpg"].status == "queued" and items["good.jpg"].staged_path
+    assert items["empty.jpg"].status == "error" and "empty" in items["empty.jpg"].error_message
+    assert items["huge.png"].status == "error" and "larger than" in items["huge.png"].error_message
+    assert items["empty.jpg"].staged_path is None
+
+
+def test_failed_insert_removes_staging_dir(app_module, client, monkeypatch):
+    staged = []
+    real_stage = app_module.stage_archive
+
+    def stage(fileobj, bulk_id):
+        staged.append(bulk_id)
+        return real_stage(fileobj, bulk_id)
+
+    def broken_commit(self):
+        raise RuntimeError("database is gone")
+
+    monkeypatch.setattr(app_module, "stage_archive", stage)
+    monkeypatch.setattr(app_module.SessionLocal.class_, "commit", broken_commit)
+    client.application.testing = False  # let the error become a 500 instead of propagating
+    try:
+        resp = _post_archive(client, _zip([("a.jpg", jpeg_bytes(4))]))
+    finally:
+        client.application.testing = True
+    assert resp.status_code == 500
+    assert not os.path.exists(os.path.join(app_module.BULK_STAGING_DIR, staged[0]))
+
+
+def test_rejects_bad_archives_and_manifests(client):
+    assert _post_archive(client, b"not a zip").status_code == 400
+    assert _post_archive(client, _zip([("notes.txt", b"x")])).status_code == 400
+    assert client.post("/api/bulk", json={"images": ["ftp://example.com/a.jpg"]}).status_code == 400
+    assert client.post("/api/bulk", json={}).status_code == 400
+
+
+def test_bulk_job_rates_items_and_exports_results(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module.bulk_pool, "submit", lambda *args: None)
+    data = _zip([("a.jpg", jpeg_bytes(5)), ("b.jpg", jpeg_bytes(6)), ("broken.jpg", b"not an image")])
+    bulk_id = _post_archive(client, data).get_json()["bulk_id"]
+
+    app_module.run_bulk_job(bulk_id)
+
+    status = client.get(f"/api/bulk/{bulk_id}").get_json()
+    assert status["status"] == "done"
+    assert status["counts"] == {"queued": 0, "normalized": 0, "rated": 2, "error": 1}
+    assert not os.path.exists(os.path.join(app_module.BULK_STAGING_DIR, bulk_id))
+
+    lines = client.get(f"/api/bulk/{bulk_id}/results?format=csv").get_data(as_text=True).splitlines()
+    assert lines[0].startswith("position,ref,status,session_id,overall_score")
+    assert [line.split(",")[2] for line in lines[1:]] == ["rated", "rated", "error"]
+
+
+def test_normalize_pool_spawns_workers(app_module, tmp_path):
+    pool = app_module.bulk_process_pool()
+    assert pool._mp_context.get_start_method() == "spawn"
+    src, dest = tmp_path / "in.jpg", tmp_path / "out.jpg"
+    src.write_bytes(jpeg_bytes(7))
+    source_sha, normalized_sha = pool.submit(app_module.normalize_upload, str(src), str(dest)).result(timeout=60)
+    assert len(source_sha) == len(normalized_sha) == 64 and dest.exists()
+
+
+def test_rating_recovery_leaves_bulk_sessions_to_bulk_recovery(app_module, db, monkeypatch):
+    for sid in ("recover-single", "recover-bulk"):
+        db.add(app_module.Session(id=sid, status="uploaded", original_image_path="x.jpg", original_image_url="/uploads/x.jpg"))
+    db.add(app_module.BulkJob(id="recover-job", status="running", source="archive", total=1))
+    db.flush()
+    db.add(app_module.BulkItem(bulk_job_id="recover-job", position=0, status="normalized", session_id="recover-bulk"))
+    db.commit()
+
+    submitted = []
+    monkeypatch.setattr(app_module.rating_pool, "submit", lambda fn, sid, *args: submitted.append(sid))
+    app_module.recover_pending_ratings()
+    assert "recover-single" in submitted and "recover-bulk" not in submitted
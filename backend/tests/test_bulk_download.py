@@ -0,0 +1,58 @@
+import http.server
+import threading
+
+import pytest
+
+from conftest import jpeg_bytes
+
+IMAGE = jpeg_bytes(8)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/hop":
+            self.send_response(302)
+            self.send_header("Location", "/room.jpg")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(IMAGE)))
+        self.end_headers()
+        self.wfile.write(IMAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def origin():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/a.jpg", "http://localhost/a.jpg", "http://169.254.169.254/latest", "http://10.0.0.1/a.jpg",
+    "file:///etc/passwd",
+])
+def test_check_public_url_refuses_internal_targets(app_module, url):
+    with pytest.raises(ValueError):
+        app_module.check_public_url(url)
+
+
+def test_connection_to_private_peer_is_refused_after_a_passing_check(app_module, origin, tmp_path, monkeypatch):
+    # As if DNS answered with a public address for the check and a private one for the connect.
+    monkeypatch.setattr(app_module, "check_public_url", lambda url: None)
+    with pytest.raises(ValueError, match="non-public address"):
+        app_module.download_image(f"{origin}/room.jpg", str(tmp_path / "out"))
+    assert not (tmp_path / "out").exists()
+
+
+def test_redirect_hops_are_checked(app_module, origin, tmp_path, monkeypatch):
+    seen = []
+    monkeypatch.setattr(app_module, "check_public_url", seen.append)
+    monkeypatch.setattr(app_module, "BULK_URL_ALLOW_PRIVATE", True)
+    app_module.download_image(f"{origin}/hop", str(tmp_path / "out"))
+    assert seen == [f"{origin}/hop", f"{origin}/room.jpg"]
+    assert (tmp_path / "out").read_bytes() == IMAGE
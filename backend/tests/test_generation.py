@@ -0,0 +1,150 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from conftest import jpeg_bytes
+
+
+@pytest.fixture
+def payloads(app_module, monkeypatch):
+    sent = []
+    real = app_module.generate_variation
+
+    async def spy(payload):
+        sent.append(payload)
+        return await real(payload)
+
+    monkeypatch.setattr(app_module, "generate_variation", spy)
+    return sent
+
+
+def _rated_session(client, seed):
+    resp = client.post(
+        "/api/sessions?sync=1", data={"image": (io.BytesIO(jpeg_bytes(seed, edge=2048)), "room.jpg")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200, resp.get_json()
+    body = resp.get_json()
+    return body["session_id"], body["original_image_url"], body["rating_result"]["suggestions"][0]["id"]
+
+
+def _queue_job(client, sid, **body):
+    resp = client.post(f"/api/sessions/{sid}/generate", json=body)
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()["job_id"]
+
+
+def _run_job(app_module, client, sid, **body):
+    job_id = _queue_job(client, sid, **body)
+    app_module.run_generation_job(job_id)
+    return job_id
+
+
+def test_edits_of_the_original_send_an_edit_size_file_uri(app_module, client, db, payloads):
+    assert app_module.EDIT_MAX_EDGE != app_module.RATING_MAX_EDGE  # the defaults
+    sid, original_url, suggestion = _rated_session(client, 30)
+
+    _run_job(app_module, client, sid, selected_suggestion_ids=[suggestion])
+    image_part = payloads[-1]["contents"][0]["parts"][0]
+    assert "fileData" in image_part and "inlineData" not in image_part
+
+    asset = app_module._get_original_asset(db, sid)
+    assert image_part["fileData"]["fileUri"] == asset.edit_file_uri != asset.file_uri
+    assert app_module._uri_live(asset.edit_file_uri, asset.edit_file_uri_expires_at)
+
+    edit_uri = asset.edit_file_uri
+    _run_job(app_module, client, sid, selected_suggestion_ids=[suggestion], base_image_url=original_url)
+    db.expire_all()
+    assert app_module._get_original_asset(db, sid).edit_file_uri == edit_uri  # reused, not uploaded again
+    assert payloads[-1]["contents"][0]["parts"][0]["fileData"]["fileUri"] == edit_uri
+
+
+def test_expired_edit_uri_is_uploaded_again(app_module, client, db, payloads):
+    from datetime import datetime, timedelta
+
+    sid, original_url, suggestion = _rated_session(client, 31)
+    _run_job(app_module, client, sid, selected_suggestion_ids=[suggestion])
+    asset = app_module._get_original_asset(db, sid)
+    old = asset.edit_file_uri
+    asset.edit_file_uri_expires_at = datetime.utcnow() - timedelta(minutes=1)
+    db.commit()
+
+    _run_job(app_module, client, sid, selected_suggestion_ids=[suggestion], base_image_url=original_url)
+    db.expire_all()
+    asset = app_module._get_original_asset(db, sid)
+    assert asset.edit_file_uri != old
+    assert payloads[-1]["contents"][0]["parts"][0]["fileData"]["fileUri"] == asset.edit_file_uri
+
+
+def test_failed_upload_falls_back_to_inline_data(app_module, client, monkeypatch, payloads):
+    sid, _, suggestion = _rated_session(client, 32)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("files api down")
+
+    monkeypatch.setattr(app_module, "gemini_resumable_upload", fail)
+    _run_job(app_module, client, sid, selected_suggestion_ids=[suggestion])
+    assert "inlineData" in payloads[-1]["contents"][0]["parts"][0]
+
+
+@pytest.mark.parametrize("purpose", ["rating", "edit"])
+def test_model_inputs_are_downscaled_per_purpose(app_module, tmp_path, purpose):
+    from PIL import Image
+
+    src = tmp_path / "big.jpg"
+    src.write_bytes(jpeg_bytes(33, edge=2048))
+    with Image.open(app_module.model_input_path(str(src), purpose)) as img:
+        assert max(img.size) == app_module.MODEL_INPUT_MAX_EDGE[purpose]
+
+
+def test_variations_are_committed_as_they_land(app_module, client, db, monkeypatch):
+    sid, _, suggestion = _rated_session(client, 34)
+    job_id = _queue_job(client, sid, selected_suggestion_ids=[suggestion], num_variations=2)
+
+    def progress():
+        other = app_module.SessionLocal()
+        try:
+            job = other.query(app_module.GenerationJob).get(job_id)
+            assets = other.query(app_module.ImageAsset).filter_by(session_id=sid, kind="generated").count()
+            return app_module.job_payload(job)["generated_images"], assets
+        finally:
+            other.close()
+
+    real = app_module.generate_variation
+    calls, seen = [], []
+
+    async def first_lands_then_second_fails(payload):
+        calls.append(payload)
+        if len(calls) == 1:
+            return await real(payload)
+        for _ in range(100):
+            urls, assets = await asyncio.to_thread(progress)
+            if urls:
+                break
+            await asyncio.sleep(0.05)
+        seen.append((urls, assets))
+        raise RuntimeError("model overloaded")
+
+    monkeypatch.setattr(app_module, "generate_variation", first_lands_then_second_fails)
+    app_module.run_generation_job(job_id)
+
+    assert len(seen) == 1 and len(seen[0][0]) == 1 and seen[0][1] == 1  # visible to another session mid-job
+    job = db.query(app_module.GenerationJob).get(job_id)
+    assert job.status == "done" and json.loads(job.result_images_json) == seen[0][0]
+    assert job.error_message.startswith("1 of 2 variations failed")
+
+
+def test_requeued_job_only_generates_missing_variations(app_module, client, db, payloads):
+    sid, _, suggestion = _rated_session(client, 35)
+    job_id = _queue_job(client, sid, selected_suggestion_ids=[suggestion], num_variations=3)
+    job = db.query(app_module.GenerationJob).get(job_id)
+    job.result_images_json = json.dumps(["/uploads/landed-before-restart.webp"])
+    db.commit()
+
+    app_module.run_generation_job(job_id)
+    db.expire_all()
+    urls = json.loads(db.query(app_module.GenerationJob).get(job_id).result_images_json)
+    assert len(payloads) == 2
+    assert len(urls) == 3 and urls[0] == "/uploads/landed-before-restart.webp"
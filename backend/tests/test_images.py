@@ -0,0 +1,39 @@
+import io
+
+from conftest import jpeg_bytes
+
+
+def _upload(client, seed):
+    resp = client.post(
+        "/api/sessions", data={"image": (io.BytesIO(jpeg_bytes(seed, edge=256)), "room.jpg")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code in (200, 202), resp.get_json()
+    return resp.get_json()["original_image_url"][len("/uploads/"):]
+
+
+def test_derivative_revalidation_does_not_touch_storage(app_module, client, monkeypatch):
+    key = _upload(client, 10)
+    first = client.get(f"/api/images/{key}?w=128&fmt=jpeg")
+    assert first.status_code == 200 and first.mimetype == "image/jpeg"
+    etag = first.headers["ETag"].strip('"')
+
+    def no_storage(*args):
+        raise AssertionError("storage touched")
+
+    monkeypatch.setattr(app_module.storage, "fetch", no_storage)
+    app_module._asset_sha_cache.clear()
+    again = client.get(f"/api/images/{key}?w=128&fmt=jpeg", headers={"If-None-Match": f'"{etag}"'})
+    assert again.status_code == 304 and again.headers["ETag"].strip('"') == etag
+    assert client.get(f"/api/images/{key}?w=128&fmt=jpeg").status_code == 200  # derivative cache hit
+
+
+def test_derivative_of_unknown_or_unsafe_key_is_404(client):
+    assert client.get("/api/images/ab/cd/missing.jpg").status_code == 404
+    assert client.get("/api/images/../app.db").status_code == 404
+
+
+def test_asset_url_lookups_use_an_index(app_module, db):
+    plan = db.execute(app_module.text(
+        "EXPLAIN QUERY PLAN SELECT id FROM image_assets WHERE url = :u"), {"u": "/uploads/x.jpg"}).fetchall()
+    assert any("ix_image_assets_url" in row[-1] for row in plan)
@@ -0,0 +1,111 @@
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def scheduler(app_module, db):
+    # Not started: tests drive claims and maintenance by hand. Jobs from other tests are
+    # finished first so only this test's rows are claimable.
+    db.query(app_module.GenerationJob).filter(app_module.GenerationJob.status.in_(["queued", "running"])).update(
+        {app_module.GenerationJob.status: "done"}, synchronize_session=False)
+    db.commit()
+    return app_module.JobScheduler(num_workers=0, max_queue=10)
+
+
+def _session(app_module, db, status="generating"):
+    sid = str(uuid.uuid4())
+    db.add(app_module.Session(id=sid, status=status, original_image_path="x.jpg", original_image_url="/uploads/x.jpg"))
+    db.commit()
+    return sid
+
+
+def _job(app_module, db, sid, created_at, status="queued", **fields):
+    job = app_module.GenerationJob(
+        id=str(uuid.uuid4()), session_id=sid, status=status, requested_edits_json=json.dumps({}),
+        created_at=created_at, **fields,
+    )
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def test_claims_follow_submission_order_per_session(app_module, db, scheduler):
+    t0 = datetime.utcnow() - timedelta(minutes=5)
+    a, b = _session(app_module, db), _session(app_module, db)
+    a1 = _job(app_module, db, a, t0)
+    a2 = _job(app_module, db, a, t0 + timedelta(seconds=1))
+    b1 = _job(app_module, db, b, t0 + timedelta(seconds=2))
+
+    first, second = scheduler._claim_next(), scheduler._claim_next()
+    assert (first.id, second.id) == (a1, b1)  # a2 waits for a1 while b runs in parallel
+    assert first.status == "running" and first.attempts == 1 and first.worker_id == scheduler.worker_id
+    assert scheduler._claim_next() is None
+
+    db.query(app_module.GenerationJob).filter_by(id=a1).update({"status": "done"})
+    db.commit()
+    assert scheduler._claim_next().id == a2
+
+
+def test_stale_jobs_are_requeued_then_abandoned(app_module, db, scheduler):
+    long_ago = datetime.utcnow() - timedelta(seconds=app_module.JOB_STALE_SEC * 2)
+    retry_sid, dead_sid = _session(app_module, db), _session(app_module, db)
+    retry = _job(app_module, db, retry_sid, long_ago, status="running", heartbeat_at=long_ago, attempts=1)
+    dead = _job(app_module, db, dead_sid, long_ago, status="running", heartbeat_at=long_ago,
+                attempts=app_module.JOB_MAX_ATTEMPTS)
+
+    scheduler._requeue_stale()
+
+    db.expire_all()
+    jobs = {j.id: j for j in db.query(app_module.GenerationJob).filter(app_module.GenerationJob.id.in_([retry, dead]))}
+    assert jobs[retry].status == "queued" and jobs[retry].worker_id is None
+    assert jobs[dead].status == "error" and "abandoned" in jobs[dead].error_message
+    assert db.query(app_module.Session).get(retry_sid).status == "generating"
+    assert db.query(app_module.Session).get(dead_sid).status == "error"
+    assert scheduler.stats(db)["finished"]["abandoned"] == 1
+
+
+def test_abandoned_job_leaves_session_generating_while_later_jobs_wait(app_module, db, scheduler):
+    long_ago = datetime.utcnow() - timedelta(seconds=app_module.JOB_STALE_SEC * 2)
+    sid = _session(app_module, db)
+    _job(app_module, db, sid, long_ago, status="running", heartbeat_at=long_ago, attempts=app_module.JOB_MAX_ATTEMPTS)
+    _job(app_module, db, sid, long_ago + timedelta(seconds=1))
+
+    scheduler._requeue_stale()
+
+    db.expire_all()
+    assert db.query(app_module.Session).get(sid).status == "generating"
+
+
+def test_fresh_heartbeats_are_left_alone(app_module, db, scheduler):
+    sid = _session(app_module, db)
+    job_id = _job(app_module, db, sid, datetime.utcnow(), status="running", heartbeat_at=datetime.utcnow(), attempts=1)
+    scheduler._requeue_stale()
+    db.expire_all()
+    assert db.query(app_module.GenerationJob).get(job_id).status == "running"
+
+
+def test_two_schedulers_never_claim_the_same_job(app_module, db, scheduler):
+    other = app_module.JobScheduler(num_workers=0, max_queue=10)
+    base = datetime.utcnow() - timedelta(minutes=1)
+    job_ids = {_job(app_module, db, _session(app_module, db), base + timedelta(seconds=i)) for i in range(8)}
+
+    start = threading.Barrier(2)
+    claims = {id(scheduler): [], id(other): []}
+
+    def drain(s):
+        start.wait()
+        while (job := s._claim_next()) is not None:
+            claims[id(s)].append(job.id)
+
+    threads = [threading.Thread(target=drain, args=(s,)) for s in (scheduler, other)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    claimed = claims[id(scheduler)] + claims[id(other)]
+    assert sorted(claimed) == sorted(job_ids)  # each job exactly once
@@ -0,0 +1,33 @@
+import json
+import uuid
+
+
+def test_update_rows_rewrites_urls_in_the_batch_sessions_jobs(app_module, db):
+    import migrate_generated_images as mgi
+
+    rows = {}
+    for name in ("converted", "untouched"):
+        sid, asset_id = str(uuid.uuid4()), str(uuid.uuid4())
+        key = app_module.storage_key(f"{asset_id}.png")
+        db.add(app_module.Session(id=sid, status="done", original_image_path="x.jpg", original_image_url="/uploads/x.jpg"))
+        db.add(app_module.ImageAsset(
+            id=asset_id, session_id=sid, kind="generated", path=app_module.storage.path(key), url=f"/uploads/{key}",
+        ))
+        job_id = str(uuid.uuid4())
+        db.add(app_module.GenerationJob(
+            id=job_id, session_id=sid, status="done", requested_edits_json="{}",
+            result_images_json=json.dumps([f"/uploads/{key}"]),
+        ))
+        rows[name] = (asset_id, job_id, key)
+    db.commit()
+
+    asset_id, job_id, key = rows["converted"]
+    dest = app_module.storage.path(app_module.storage_key(f"{asset_id}.webp"))
+    mgi._update_rows(db, [(asset_id, dest, "image/webp", "digest", 10, 5)])
+
+    db.expire_all()
+    new_url = f"/uploads/{app_module.storage.key_of(dest)}"
+    assert db.query(app_module.ImageAsset).get(asset_id).url == new_url
+    assert json.loads(db.query(app_module.GenerationJob).get(job_id).result_images_json) == [new_url]
+    _, other_job, other_key = rows["untouched"]
+    assert json.loads(db.query(app_module.GenerationJob).get(other_job).result_images_json) == [f"/uploads/{other_key}"]
@@ -0,0 +1,105 @@
+from sqlalchemy import inspect, text
+
+
+def _engine(app_module, tmp_path):
+    return app_module.make_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+
+
+def _indexes(eng, table):
+    return {ix["name"] for ix in inspect(eng).get_indexes(table)}
+
+
+def test_fresh_database_gets_every_table_and_index(app_module, tmp_path):
+    eng = _engine(app_module, tmp_path)
+    versions = [v for v, _, _ in app_module.MIGRATIONS]
+    assert versions == sorted(versions) == list(range(1, len(versions) + 1))
+
+    assert app_module.migrate(eng) == versions
+    assert app_module.pending_migrations(eng) == []
+    assert app_module.migrate(eng) == []
+
+    tables = set(inspect(eng).get_table_names())
+    assert set(app_module.Base.metadata.tables) <= tables
+    for table in app_module.Base.metadata.sorted_tables:
+        assert {ix.name for ix in table.indexes} <= _indexes(eng, table.name), table.name
+
+
+def test_untracked_database_from_create_all_upgrades(app_module, tmp_path):
+    # Databases from before schema_migrations: old tables without newer columns or indexes.
+    eng = _engine(app_module, tmp_path)
+    with eng.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE sessions (id VARCHAR PRIMARY KEY, created_at DATETIME, status VARCHAR,"
+            " original_image_path VARCHAR NOT NULL, original_image_url VARCHAR NOT NULL,"
+            " original_file_uri VARCHAR, rating_json TEXT, suggestions_json TEXT)"
+        ))
+        conn.execute(text(
+            "INSERT INTO sessions (id, status, original_image_path, original_image_url, rating_json)"
+            " VALUES ('s', 'rated', 'x.jpg', '/uploads/x.jpg',"
+            " '{\"overall_score\": 7, \"suggestions\": [{\"id\": \"s1\", \"title\": \"Declutter\"}]}')"
+        ))
+
+    logged = []
+    applied = app_module.migrate(eng, log_fn=logged.append)
+    assert applied[0] == 1 and logged[0] == "applied migration 1: base tables"
+
+    columns = {c["name"] for c in inspect(eng).get_columns("sessions")}
+    assert {"error_message", "revision"} <= columns
+    assert {ix.name for ix in app_module.Session.__table__.indexes} <= _indexes(eng, "sessions")
+
+
+def test_only_pending_steps_run(app_module, tmp_path, monkeypatch):
+    eng = _engine(app_module, tmp_path)
+    app_module.migrate(eng)
+    ran = []
+    monkeypatch.setattr(app_module, "MIGRATIONS", app_module.MIGRATIONS + [
+        (len(app_module.MIGRATIONS) + 1, "test step", lambda conn: ran.append(conn)),
+    ])
+    assert [v for v, _ in app_module.pending_migrations(eng)] == [len(app_module.MIGRATIONS)]
+    assert app_module.migrate(eng) == [len(app_module.MIGRATIONS)] and len(ran) == 1
+
+
+def test_failed_step_rolls_back_and_stops(app_module, tmp_path, monkeypatch):
+    eng = _engine(app_module, tmp_path)
+    app_module.migrate(eng)
+    version = len(app_module.MIGRATIONS) + 1
+
+    def broken(conn):
+        conn.execute(text(
+            "INSERT INTO sessions (id, status, original_image_path, original_image_url, revision)"
+            " VALUES ('half', 'rated', 'x.jpg', '/uploads/x.jpg', 0)"
+        ))
+        raise RuntimeError("bad step")
+
+    monkeypatch.setattr(app_module, "MIGRATIONS", app_module.MIGRATIONS + [(version, "broken", broken)])
+    try:
+        app_module.migrate(eng)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("migration error was swallowed")
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM sessions")).scalar() == 0
+    assert [v for v, _ in app_module.pending_migrations(eng)] == [version]
+
+
+def test_ratings_are_backfilled_into_typed_rows(app_module, tmp_path):
+    eng = _engine(app_module, tmp_path)
+    with eng.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE sessions (id VARCHAR PRIMARY KEY, created_at DATETIME, status VARCHAR,"
+            " original_image_path VARCHAR NOT NULL, original_image_url VARCHAR NOT NULL,"
+            " original_file_uri VARCHAR, rating_json TEXT, suggestions_json TEXT)"
+        ))
+        conn.execute(text(
+            "INSERT INTO sessions (id, created_at, status, original_image_path, original_image_url, rating_json) VALUES"
+            " ('s', '2024-01-02 03:04:05', 'rated', 'x.jpg', '/uploads/x.jpg', '{\"overall_score\": 7,"
+            " \"breakdown\": {\"organization\": 6}, \"suggestions\": [{\"id\": \"s1\", \"title\": \"Declutter\"}]}'),"
+            " ('bad', NULL, 'rated', 'y.jpg', '/uploads/y.jpg', 'not json')"
+        ))
+    app_module.migrate(eng)
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT session_id, overall_score, organization, created_at FROM ratings")).all() == [
+            ("s", 7.0, 6.0, "2024-01-02 03:04:05.000000"),
+        ]
+        assert conn.execute(text("SELECT key, title, times_chosen FROM suggestions")).all() == [("s1", "Declutter", 0)]
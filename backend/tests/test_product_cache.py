@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def clock(app_module, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(app_module._time, "time", lambda: now[0])
+    return now
+
+
+def test_peek_never_loads_and_counts_misses_only_when_asked(app_module):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=60)
+    assert cache.peek("k") is None and cache.stats()["misses"] == 0
+    assert cache.peek("k", count_miss=True) is None and cache.stats()["misses"] == 1
+    cache.set("k", ["sofa"])
+    assert cache.peek("k") == ["sofa"] and cache.stats()["hits"] == 1
+
+
+def test_stale_peek_refreshes_only_with_a_loader(app_module, clock):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=10, stale_sec=100)
+    cache.set("k", "old")
+    clock[0] += 20
+    assert cache.peek("k") == "old" and cache.stats()["refreshes"] == 0
+    assert cache.peek("k", lambda: "new") == "old" and cache.stats()["refreshes"] == 1
+
+
+def test_cache_key_ignores_case_and_spacing(app_module):
+    key = app_module.products_cache_key("A walnut  coffee table\n")
+    assert key == app_module.products_cache_key("a walnut coffee table")
+    assert key != app_module.products_cache_key("a walnut side table")
+
+
+def test_product_lists_persist_in_the_database(app_module):
+    store = app_module.ProductCacheStore("test-model")
+    key = app_module.products_cache_key("a linen sofa and a rug")
+    app_module.ResultCache("products", 10, 3600, store=store).set(key, ["linen sofa", "rug"])
+    fresh = app_module.ResultCache("products", 10, 3600, store=store)
+    assert fresh.peek(key) == ["linen sofa", "rug"] and fresh.stats()["store_hits"] == 1
+    assert app_module.ProductCacheStore("other-model").get(key) is None
@@ -0,0 +1,69 @@
+import pytest
+
+
+@pytest.fixture
+def limit(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "_RATE_LIMIT", 10)
+    return 10
+
+
+def test_gcra_allows_a_burst_of_the_limit_then_spaces_requests(app_module, limit):
+    interval = app_module._RATE_WINDOW_SEC / limit
+    tat, now = None, 1000.0
+    for _ in range(limit):
+        allowed, tat, _ = app_module._gcra(tat, now, 1)
+        assert allowed
+    allowed, same_tat, retry_after = app_module._gcra(tat, now, 1)
+    assert not allowed and same_tat == tat and retry_after == pytest.approx(interval)
+    assert app_module._gcra(tat, now + interval, 1)[0]
+
+
+def test_gcra_costs_and_idle_refill(app_module, limit):
+    allowed, tat, _ = app_module._gcra(None, 0.0, limit)
+    assert allowed
+    assert not app_module._gcra(tat, 0.0, 0.5)[0]
+    # A key idle for a whole window is back to a full bucket.
+    assert app_module._gcra(tat, app_module._RATE_WINDOW_SEC, limit)[0]
+    assert not app_module._gcra(None, 0.0, limit + 1)[0]
+
+
+def test_memory_backend_keeps_keys_apart_and_sweeps_idle_ones(app_module, limit, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(app_module._time, "monotonic", lambda: clock[0])
+    backend = app_module.MemoryRateLimitBackend(stripes=1, sweep_every=2)
+    assert backend.allow("a", limit)[0]
+    assert not backend.allow("a", 1)[0]
+    assert backend.allow("b", limit)[0]
+    clock[0] += app_module._RATE_WINDOW_SEC * 2
+    backend.allow("c", 1)
+    backend.allow("c", 1)
+    assert set(backend._stripes[0][0]) == {"c"}
+
+
+def test_sqlite_backend_is_shared_through_the_file(app_module, limit, tmp_path):
+    path = str(tmp_path / "limits.db")
+    one, two = app_module.SQLiteRateLimitBackend(path), app_module.SQLiteRateLimitBackend(path)
+    assert one.allow("client", limit)[0]
+    allowed, retry_after = two.allow("client", 1)
+    assert not allowed and retry_after > 0
+
+
+def test_rate_limiter_counts_rejections_and_fails_open(app_module, limit):
+    limiter = app_module.RateLimiter(app_module.MemoryRateLimitBackend())
+    results = [limiter.check("generate", "1.2.3.4")[0] for _ in range(5)]
+    assert results == [True, True, False, False, False]  # generate costs 4 of 10
+    assert limiter.rejections == {"generate": 3}
+
+    class Broken:
+        def allow(self, key, cost):
+            raise OSError("database is locked")
+
+    assert app_module.RateLimiter(Broken()).check("generate", "1.2.3.4") == (True, 0.0)
+
+
+def test_routes_answer_429_with_retry_after(app_module, client, limit, monkeypatch):
+    monkeypatch.setattr(app_module, "rate_limiter", app_module.RateLimiter(app_module.MemoryRateLimitBackend()))
+    statuses = [client.post("/api/generate-products", json={"prompt": "a sofa"}).status_code for _ in range(11)]
+    assert statuses[:10] == [200] * 10 and statuses[10] == 429
+    resp = client.post("/api/generate-products", json={"prompt": "a sofa"})
+    assert int(resp.headers["Retry-After"]) >= 1
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _cached(cache, key):
+    entry = cache._lookup(key)
+    return entry[1] if entry else None
+
+
+@pytest.fixture
+def clock(app_module, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(app_module._time, "time", lambda: now[0])
+    return now
+
+
+def test_concurrent_misses_share_one_load(app_module):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=60)
+    calls, release = [], threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", loader))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    _wait_for(lambda: cache.stats()["coalesced"] == 7)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert calls == [1] and results == ["value"] * 8
+    assert cache.stats()["misses"] == 8 and cache.get("k", loader) == "value"
+
+
+def test_loader_errors_reach_every_waiter_and_are_not_cached(app_module):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=60)
+
+    def boom():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get("k", boom)
+    assert cache.get("k", lambda: "ok") == "ok"
+    assert cache.stats()["errors"] == 1
+
+
+def test_stale_entries_are_served_while_refreshing(app_module, clock):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=10, stale_sec=100)
+    cache.set("k", "old")
+    refreshed = threading.Event()
+
+    def loader():
+        refreshed.set()
+        return "new"
+
+    clock[0] += 5
+    assert cache.get("k", loader) == "old" and not refreshed.is_set()
+    clock[0] += 10
+    assert cache.get("k", loader) == "old"
+    assert refreshed.wait(5)
+    _wait_for(lambda: _cached(cache, "k") == "new")
+    stats = cache.stats()
+    assert stats["hits"] >= 1 and stats["stale_hits"] == 1 and stats["refreshes"] == 1
+
+
+def test_failed_refresh_keeps_the_stale_value(app_module, clock):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=10, stale_sec=100)
+    cache.set("k", "old")
+    clock[0] += 20
+    done = threading.Event()
+
+    def boom():
+        done.set()
+        raise RuntimeError("upstream down")
+
+    assert cache.get("k", boom) == "old"
+    assert done.wait(5)
+    _wait_for(lambda: cache.stats()["errors"] == 1)
+    assert _cached(cache, "k") == "old"
+
+
+def test_entries_expire_after_the_stale_window(app_module, clock):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=10, stale_sec=5)
+    cache.set("k", "old")
+    clock[0] += 15
+    assert _cached(cache, "k") is None
+    assert cache.get("k", lambda: "new") == "new"
+
+
+def test_lru_eviction(app_module):
+    cache = app_module.ResultCache("test", max_entries=2, ttl_sec=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a", lambda: 0)
+    cache.set("c", 3)
+    assert _cached(cache, "b") is None and _cached(cache, "a") == 1 and cache.stats()["evictions"] == 1
+
+
+def test_store_tier_survives_a_new_cache(app_module, tmp_path):
+    path = str(tmp_path / "cache.db")
+    app_module.ResultCache("test", 10, 60, store=app_module.SQLiteCacheStore(path, "ns")).set("k", {"v": 1})
+    fresh = app_module.ResultCache("test", 10, 60, store=app_module.SQLiteCacheStore(path, "ns"))
+    assert fresh.get("k", lambda: None) == {"v": 1} and fresh.stats()["store_hits"] == 1
+    other = app_module.ResultCache("test", 10, 60, store=app_module.SQLiteCacheStore(path, "other"))
+    assert other.get("k", lambda: "loaded") == "loaded"
+
+
+def test_async_get_joins_a_sync_load_in_flight(app_module):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=60)
+    release = threading.Event()
+    sync = threading.Thread(target=lambda: cache.get("k", lambda: release.wait(5) and "value"))
+    sync.start()
+    _wait_for(lambda: "k" in cache._inflight)
+
+    async def never():
+        raise AssertionError("second load")
+
+    fut = app_module.async_runtime.submit(cache.get_async("k", never))
+    _wait_for(lambda: cache.stats()["coalesced"] == 1)
+    release.set()
+    sync.join(5)
+    assert fut.result(5) == "value"
+
+
+def test_async_get_loads_on_the_shared_loop(app_module):
+    cache = app_module.ResultCache("test", max_entries=10, ttl_sec=60)
+
+    async def load():
+        return threading.current_thread().name
+
+    assert app_module.async_runtime.submit(cache.get_async("k", load)).result(5) == "async-runtime"
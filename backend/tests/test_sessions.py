@@ -0,0 +1,89 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from conftest import jpeg_bytes
+
+
+def _create(client, seed):
+    resp = client.post(
+        "/api/sessions?sync=1", data={"image": (io.BytesIO(jpeg_bytes(seed, edge=256)), "room.jpg")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()
+
+
+def test_sync_create_rates_the_upload(client):
+    body = _create(client, 20)
+    assert body["status"] == "rated" and body["rating_result"]["suggestions"]
+
+
+@pytest.mark.parametrize("target, seed", [("ensure_original_file_uri", 24), ("generate_rating_for_session", 25)])
+def test_sync_create_failure_marks_the_session_errored(app_module, client, db, monkeypatch, target, seed):
+    def fail(*args, **kwargs):
+        raise requests.ConnectionError("upstream unreachable")
+
+    monkeypatch.setattr(app_module, target, fail)
+    resp = client.post(
+        "/api/sessions?sync=1", data={"image": (io.BytesIO(jpeg_bytes(seed, edge=256)), "room.jpg")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 502
+    body = resp.get_json()
+    assert body["error"]["code"] == "gemini_error"
+
+    sess = db.query(app_module.Session).get(body["session_id"])
+    assert sess.status == "error" and sess.error_message == "upstream unreachable"
+
+
+def test_rerate_refreshes_an_expired_file_uri(app_module, client, db, monkeypatch):
+    sid = _create(client, 21)["session_id"]
+    asset = app_module._get_original_asset(db, sid)
+    asset.file_uri = "https://expired.example/files/old"
+    asset.file_uri_expires_at = datetime.utcnow() - timedelta(hours=1)
+    db.commit()
+
+    sent = []
+    real = app_module.generate_rating_for_session
+    monkeypatch.setattr(
+        app_module, "generate_rating_for_session",
+        lambda db, sess, **kw: sent.append(sess.original_file_uri) or real(db, sess, **kw),
+    )
+    assert client.post(f"/api/sessions/{sid}/rate").status_code == 200
+
+    db.expire_all()
+    asset = app_module._get_original_asset(db, sid)
+    assert sent == [asset.file_uri]
+    assert asset.file_uri != "https://expired.example/files/old" and app_module.file_uri_usable(asset)
+
+
+def test_rerate_keeps_times_chosen(app_module, client, db):
+    sid = _create(client, 22)["session_id"]
+    first = db.query(app_module.Suggestion).filter_by(session_id=sid).order_by(app_module.Suggestion.position).first()
+    first.times_chosen = 3
+    db.commit()
+    key = first.key
+
+    assert client.post(f"/api/sessions/{sid}/rate").status_code == 200
+
+    db.expire_all()
+    rows = {s.key: s.times_chosen for s in db.query(app_module.Suggestion).filter_by(session_id=sid)}
+    assert rows[key] == 3
+    assert all(count == 0 for k, count in rows.items() if k != key)
+
+
+def test_ratings_analytics_counts_suggested_and_chosen(app_module, client, db):
+    sid = _create(client, 23)["session_id"]
+    row = db.query(app_module.Suggestion).filter_by(session_id=sid).first()
+    row.times_chosen = 2
+    db.commit()
+
+    body = client.get("/api/analytics/ratings").get_json()
+    assert body["ratings"] >= 1 and body["average_scores"]["overall_score"] is not None
+    assert sum(b["count"] for b in body["overall_distribution"]) == body["ratings"]
+    category = next(c for c in body["categories"] if c["category"] == row.category)
+    assert category["suggested"] >= 1 and category["chosen"] >= 2
+    assert client.get("/api/analytics/ratings?days=x").status_code == 400
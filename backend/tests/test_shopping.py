@@ -0,0 +1,28 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_shopping_pipeline_streams_products_then_results(app_module):
+    events = list(app_module.iter_shopping_pipeline("a walnut coffee table and a linen sofa", 10))
+    done = events[-1]
+    assert done["type"] == "done" and done["products"]
+    kinds = [e["type"] for e in events[:-1]]
+    assert kinds.index("product") < kinds.index("result")
+    assert sorted(e["index"] for e in events if e["type"] == "result") == list(range(len(done["products"])))
+
+
+def test_shopping_pipeline_reuses_extract_workers(app_module):
+    for i in range(app_module.SHOPPING_EXTRACT_WORKERS * 2):
+        list(app_module.iter_shopping_pipeline(f"a brass floor lamp number {i}", 10))
+    extractors = [t for t in threading.enumerate() if t.name.startswith("products-extract")]
+    assert 0 < len(extractors) <= app_module.SHOPPING_EXTRACT_WORKERS
+
+
+def test_shopping_extract_skipped_when_queued_past_deadline(app_module, monkeypatch):
+    calls = []
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(app_module, "stream_products", lambda prompt: calls.append(prompt) or iter(()))
+    monkeypatch.setattr(app_module, "shopping_extract_pool", pool)
+    done = list(app_module.iter_shopping_pipeline("a rug", 0))[-1]
+    pool.shutdown(wait=True)
+    assert done["products"] == [] and calls == []
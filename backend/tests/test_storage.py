@@ -0,0 +1,47 @@
+import os
+
+from conftest import jpeg_bytes
+
+
+def _s3(app_module, fake, tmp_path):
+    env = fake.s3_env("test-bucket")
+    return app_module.S3Storage(
+        str(tmp_path), env["S3_ENDPOINT_URL"], env["S3_BUCKET"], "us-east-1", env["S3_ACCESS_KEY_ID"],
+        env["S3_SECRET_ACCESS_KEY"], 3600,
+    )
+
+
+def test_storage_key_shards_by_name_hash(app_module):
+    key = app_module.storage_key("abc.jpg")
+    assert key.endswith("/abc.jpg") and len(key.split("/")) == 3
+    assert key == app_module.storage_key("abc.jpg")
+
+
+def test_s3_put_streams_file_and_survives_a_retry(app_module, fake, tmp_path, monkeypatch):
+    storage = _s3(app_module, fake, tmp_path)
+    data = jpeg_bytes(9) * 50
+    key = app_module.storage_key("streamed.jpg")
+    tmp = storage.temp_path(key)
+    with open(tmp, "wb") as f:
+        f.write(data)
+
+    faults = iter([503])
+    monkeypatch.setattr(fake, "_fault", lambda: next(faults, None))
+    puts = fake.stats().get("s3.put", 0)
+    path = storage.put(tmp, key, "image/jpeg")
+
+    assert fake.stats()["s3.put"] == puts + 2
+
+    assert fake._objects[f"test-bucket/{key}"] == (data, "image/jpeg")
+    assert open(path, "rb").read() == data and not os.path.exists(tmp)
+
+
+def test_s3_fetch_reads_through_the_local_cache(app_module, fake, tmp_path):
+    storage = _s3(app_module, fake, tmp_path)
+    key = app_module.storage_key("cached.jpg")
+    fake._objects[f"test-bucket/{key}"] = (b"bytes", "image/jpeg")
+    path = storage.path(key)
+    assert not os.path.exists(path)
+    assert open(storage.fetch(path), "rb").read() == b"bytes"
+    assert storage.exists(storage.path(app_module.storage_key("cached.jpg")))
+    assert not storage.exists(storage.path(app_module.storage_key("missing.jpg")))
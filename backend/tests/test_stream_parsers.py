@@ -0,0 +1,57 @@
+import json
+import random
+
+import pytest
+
+
+def _feed_in_chunks(parser, text, rng):
+    events, i = [], 0
+    while i < len(text):
+        n = rng.randint(1, 15)
+        events += parser.feed(text[i:i + n])
+        i += n
+    return events
+
+
+def test_string_array_parser_handles_any_chunking(app_module):
+    names = ["walnut coffee table", 'a "quoted" lamp', "rug, wool", "café chair"]
+    text = "```json\n" + json.dumps(names) + "\n```"
+    rng = random.Random(0)
+    for _ in range(100):
+        assert _feed_in_chunks(app_module.JsonStringArrayParser(), text, rng) == names
+
+
+RATING = {
+    "overall_score": 6.5,
+    "breakdown": {"organization": 5, "feng shui": 7.5},
+    "summary": 'A "cozy" room, with {braces} and [brackets] \\ ok, été',
+    "suggestions": [{"id": "s1", "steps": ["a, b", "c]"]}, {"id": "s2", "steps": []}],
+    "risks_or_tradeoffs": [],
+    "x": [1, [2, 3], {"y": [4]}],
+}
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_object_parser_handles_any_chunking(app_module, indent):
+    text = json.dumps(RATING, indent=indent, ensure_ascii=indent is None)
+    rng = random.Random(indent)
+    for _ in range(100):
+        events = _feed_in_chunks(app_module.JsonObjectStreamParser(), text, rng)
+        assert {k: v for kind, k, v in events if kind == "field"} == RATING
+        assert [(k, v) for kind, k, v in events if kind == "item"] == [
+            ("suggestions", RATING["suggestions"][0]), ("suggestions", RATING["suggestions"][1]),
+            ("x", 1), ("x", [2, 3]), ("x", {"y": [4]}),
+        ]
+        order = [(kind, k) for kind, k, _ in events]
+        assert order.index(("item", "suggestions")) < order.index(("field", "suggestions"))
+
+
+def test_object_parser_emits_fields_as_soon_as_they_close(app_module):
+    parser = app_module.JsonObjectStreamParser()
+    assert parser.feed('```json\n{"overall_score": 7, "summary": "ok') == [("field", "overall_score", 7)]
+    assert parser.feed('", "suggestions": [{"id": "s1"},') == [
+        ("field", "summary", "ok"), ("item", "suggestions", {"id": "s1"}),
+    ]
+    assert parser.feed(' {"id": "s2"}]}\n```') == [
+        ("item", "suggestions", {"id": "s2"}), ("field", "suggestions", [{"id": "s1"}, {"id": "s2"}]),
+    ]
@@ -2,6 +2,7 @@
 
 import { useEffect, useRef, useState } from "react";
 import { cn } from "@/lib/utils";
+import { streamBatchSearch } from "@/lib/shopping";
 import { GripVertical, ShoppingBag, ExternalLink, Check, Plus, PanelLeftClose, ChevronRight, ChevronLeft } from "lucide-react";
 
 export type ShopItem = {
@@ -63,42 +64,42 @@ export function ShopSidebar({
       return;
     }
 
+    const controller = new AbortController();
     const fetchProducts = async () => {
       setLoading(true);
+      const shopItems: ShopItem[] = [];
       try {
-        const queryString = productQueries.join(",");
-        const response = await fetch(
-          `http://localhost:5001/api/batch_search?q=${encodeURIComponent(queryString)}`
-        );
-        
-        if (!response.ok) {
-          throw new Error(`API error: ${response.status}`);
-        }
-
-        const data = await response.json();
-        
-        // Transform SERPapi results to ShopItem format
-        const shopItems: ShopItem[] = data.results.map(
-          (result: any, index: number) => ({
-            id: `serp-${index}`,
-            name: result.result?.title || result.query,
-            price: result.result?.price || "N/A",
-            image: result.result?.image,
-            link: result.result?.link,
-            category: result.result?.source || "Product",
-          })
+        // Items appear as each lookup resolves (cache hits first) instead of after the whole batch.
+        await streamBatchSearch(
+          "http://localhost:5001",
+          productQueries,
+          (result) => {
+            shopItems.push({
+              id: `serp-${result.index}`,
+              name: result.result?.title || result.query,
+              price: result.result?.price || "N/A",
+              image: result.result?.image,
+              link: result.result?.link,
+              category: result.result?.source || "Product",
+            });
+            setFetchedItems([...shopItems]);
+            setLoading(false);
+          },
+          controller.signal,
         );
 
-        setFetchedItems(shopItems.length > 0 ? shopItems : SAMPLE_ITEMS);
+        if (shopItems.length === 0) setFetchedItems(SAMPLE_ITEMS);
       } catch (error) {
+        if (controller.signal.aborted) return;
         console.error("Failed to fetch products:", error);
-        setFetchedItems(SAMPLE_ITEMS);
+        if (shopItems.length === 0) setFetchedItems(SAMPLE_ITEMS);
       } finally {
-        setLoading(false);
+        if (!controller.signal.aborted) setLoading(false);
       }
     };
 
     fetchProducts();
+    return () => controller.abort();
   }, [productQueries, items]);
 
   // Initialize width to 30% of screen on mount
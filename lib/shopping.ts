@@ -0,0 +1,72 @@
+export type ShoppingResult = {
+  index: number;
+  query: string;
+  result: {
+    title?: string;
+    link?: string;
+    image?: string;
+    price?: string;
+    source?: string;
+    rating?: number;
+    reviews?: number;
+  } | null;
+  error?: string;
+  timed_out?: boolean;
+};
+
+// Reads an application/x-ndjson response body, calling onMessage for each line as it arrives.
+async function readNdjson(res: Response, onMessage: (msg: any) => void): Promise<void> {
+  if (!res.ok || !res.body) {
+    throw new Error(`API error: ${res.status}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    buffered += decoder.decode(value, { stream: !done });
+    const lines = buffered.split("\n");
+    buffered = lines.pop() ?? "";
+    for (const line of lines) {
+      if (line.trim()) onMessage(JSON.parse(line));
+    }
+    if (done) break;
+  }
+}
+
+// Streams /api/batch_search?stream=1, calling onResult as each product lookup resolves.
+export async function streamBatchSearch(
+  apiBase: string,
+  queries: string[],
+  onResult: (r: ShoppingResult) => void,
+  signal?: AbortSignal,
+): Promise<void> {
+  const q = encodeURIComponent(queries.join(","));
+  const res = await fetch(`${apiBase}/api/batch_search?q=${q}&stream=1`, { signal });
+  await readNdjson(res, (msg) => {
+    if (!msg.done) onResult(msg as ShoppingResult);
+  });
+}
+
+// Streams /api/shopping: product names are extracted from the prompt server-side and each
+// one's shopping result arrives as soon as its lookup resolves. Resolves to the product names.
+export async function streamShoppingPipeline(
+  apiBase: string,
+  body: { prompt?: string; job_id?: string },
+  onResult: (r: ShoppingResult) => void,
+  signal?: AbortSignal,
+): Promise<string[]> {
+  const res = await fetch(`${apiBase}/api/shopping`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+    signal,
+  });
+  let products: string[] = [];
+  await readNdjson(res, (msg) => {
+    if (msg.type === "result") onResult(msg as ShoppingResult);
+    if (msg.type === "done") products = msg.products ?? [];
+  });
+  return products;
+}